@@ -1,5 +1,30 @@
-from flask import Flask, render_template, request
+from flask import Flask, Response, render_template, request
+import base64
+import binascii
 import json
+import os
+import re
+import time
+
+from cache import GraphCache, spool
+from compare import diff_graphs
+from graph import Edge, Node, intern, to_cytoscape
+from jobs import JobQueue, ProgressReader
+from layout import layered_layout
+import metrics
+from responses import dumps, include_schema, json_response
+from search import SearchIndex, entity_fields, event_fields
+from sdf import SchemaError, SchemaValidator, check_schema, index_entity, index_event, index_json, index_relation, \
+    new_json_index, no_root_message, remap_ids, rename_event_name, revert_fields, set_field, validate_schema
+from snapshot import SnapshotStore
+from streaming import iter_schema
+from workspace import Workspace, WorkspaceStore
+
+# orjson parses whole documents faster when it is installed
+try:
+    from orjson import loads
+except ImportError:
+    from json import loads
 
 # ===============================================
 # app.py
@@ -9,9 +34,24 @@ import json
 
 app = Flask(__name__, static_folder='./static', template_folder='./static')
 
-nodes = {}
-edges = []
-schema_json = {}
+# parsed schemas saved to disk, so sessions survive restarts
+snapshot_dir = os.environ.get('SCI_SNAPSHOT_DIR') or None
+snapshots = SnapshotStore(snapshot_dir, delay=float(os.environ.get('SCI_SNAPSHOT_DELAY', 1)),
+                          ttl=float(os.environ.get('SCI_SNAPSHOT_TTL', 7 * 24 * 3600))) if snapshot_dir else None
+# parsed schemas, one per curator session
+workspaces = WorkspaceStore(max_size=int(os.environ.get('SCI_WORKSPACE_MAX', 32)),
+                            ttl=float(os.environ.get('SCI_WORKSPACE_TTL', 3600)), snapshots=snapshots)
+# uploads at least this large are parsed from the request stream
+stream_min_bytes = int(os.environ.get('SCI_STREAM_MIN_BYTES', 4 * 1024 * 1024))
+# parsed schemas by content hash, shared by workspaces until they are edited
+cache_max_bytes = int(os.environ.get('SCI_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+graph_cache = GraphCache(cache_max_bytes, os.environ.get('SCI_CACHE_DIR') or None) if cache_max_bytes > 0 else None
+# uploads at least this large only build subtrees as they are asked for, 0 always builds the whole graph
+lazy_min_bytes = int(os.environ.get('SCI_LAZY_MIN_BYTES', 0))
+# uploads sent with ?async=true, parsed in the background
+upload_jobs = JobQueue(workers=int(os.environ.get('SCI_UPLOAD_WORKERS', 2)),
+                       max_pending=int(os.environ.get('SCI_UPLOAD_MAX_PENDING', 8)),
+                       ttl=float(os.environ.get('SCI_JOB_TTL', 600)))
 
 # SDF version 1.4
 schema_key_dict = {
@@ -20,6 +60,8 @@ schema_key_dict = {
     'privateData': ['@type', 'template', 'repeatable', 'importance'],
     'entity': ['name', '@id', 'qnode', 'qlabel', 'centrality']
 }
+# keys holding references between nodes, which the sidebar cannot edit since the graph and indexes are not patched for them
+structural_keys = ['child', 'children', 'outlinks', 'participants', 'relations', 'entity', 'privateData']
 
 def create_node(_id, _label, _type, _shape=''):
     """Creates a node.
@@ -31,15 +73,7 @@ def create_node(_id, _label, _type, _shape=''):
     _shape (str): shape as visualized in graph
     
     """
-    return {
-        'data': {
-            'id': _id,
-            '_label': _label if _label else _id,
-            '_type': _type,
-            '_shape': _shape
-        },
-        'classes': ''
-    }
+    return Node(_id, _label if _label else _id, _type, _shape)
 
 def create_edge(_source, _target, _label='', _edge_type=''):
     """Creates an edge whose id is "source_target".
@@ -51,40 +85,59 @@ def create_edge(_source, _target, _label='', _edge_type=''):
     _edge_type (str): type of edge, influences shape on graph
     
     """
-    return {
-        'data': {
-            'id': f"{_source}__{_target}",
-            '_label': f"\n\u2060{_label}\n\u2060",
-            'name': _label,
-            'source': _source,
-            'target': _target,
-            '_edge_type': _edge_type
-        },
-        'classes': ''
-    }
+    return Edge(_source, _target, _label, _edge_type)
 
 def extend_node(node, obj):
     """Adds values to the node according to the node type.
 
     Parameters:
-    node (dict): node to extend
+    node (Node): node to extend
     obj (dict): schema with data on the node
     
     Returns:
-    node (dict): extended node
+    node (Node): extended node
     """
 
     for key in obj.keys():
-        if key in schema_key_dict[node['data']['_type']]:
+        if key in schema_key_dict[node.type]:
             if key == 'optional' and obj[key]:
-                node['classes'] = 'optional'
-            node['data'][key] = obj[key]
+                node.classes = 'optional'
+            node.fields[key] = obj[key]
     if 'privateData' in obj.keys() and len(obj['privateData']) > 0:
         for key in obj['privateData'].keys():
             if key in schema_key_dict['privateData']:
-                node['data'][key] = obj['privateData'][key]
+                node.fields[key] = obj['privateData'][key]
     return node
 
+def create_entity_node(entity):
+    """Creates an entity node.
+
+    Parameters:
+    entity (dict): information on the entity
+
+    Returns:
+    node (Node): entity node
+    """
+    return extend_node(create_node(entity['@id'], entity['name'], 'entity'), entity)
+
+def create_relation_edge(relation):
+    """Creates an edge between the subject and object entities of a relation.
+
+    Parameters:
+    relation (dict): information on the relation
+
+    Returns:
+    edge (Edge): relation edge
+    """
+    # 'relation': ['name', 'relationSubject', 'relationPredicate', 'relationObject', '@id']
+    edge = create_edge(_source = relation['relationSubject'],
+                       _target = relation['relationObject'],
+                       _label = relation['name'],
+                       _edge_type = 'relation')
+    edge.ref = relation['@id']
+    edge.predicate = relation['relationPredicate']
+    return edge
+
 def get_entities(entities):
     """Creates lists of entity nodes through the schema entity ontology.
     
@@ -96,9 +149,7 @@ def get_entities(entities):
     """
     nodes = {}
     for entity in entities:
-        _label = entity['name']
-        entity_id = entity['@id']
-        nodes[entity_id] = extend_node(create_node(entity_id, _label, 'entity'), entity)
+        nodes[entity['@id']] = create_entity_node(entity)
 
     return nodes
 
@@ -106,28 +157,79 @@ def get_relations(relations):
     """Creates edges between entities through the schema relation ontology.
 
     Parameters:
-    nodes (dict): nodes in the schema
     relations (dict): information on all relations in a schema
 
     Returns:
+    edges (list): edges in the schema
+    """
+    return [create_relation_edge(relation) for relation in relations]
+
+def graph_counts(graph):
+    """Counts the nodes and edges of a graph, for metrics."""
+    return {'nodes': len(graph['nodes']), 'edges': len(graph['edges'])}
+
+def index_edge(edge_index, edge):
+    """Adds an edge to the adjacency index under its source and target nodes.
+
+    Parameters:
+    edge_index (dict): adjacency index, see index_edges
+    edge (Edge): edge to add
+
+    """
+    edge_index['source'].setdefault(edge.source, {}).setdefault(edge.type, []).append(edge)
+    edge_index['target'].setdefault(edge.target, {}).setdefault(edge.type, []).append(edge)
+
+def index_edges(nodes, edges):
+    """Builds per-source and per-target adjacency indexes keyed by edge type, and the roots, in one pass.
+
+    The number of edges of a type leaving or entering a node is the length
+    of its list in the index, see degree. Roots are the nodes other than
+    entities that edges leave and none enter, in the order they first
+    appear; edits that could change them re-parse the graph, see
+    needs_reload.
+
+    Parameters:
     nodes (dict): nodes in the schema
     edges (list): edges in the schema
+
+    Returns:
+    edge_index (dict): {'source': {node_id: {edge_type: [edges]}}, 'target': {node_id: {edge_type: [edges]}},
+                        'roots': {node_id: True}}
     """
-    edges = []
-    # 'relation': ['name', 'relationSubject', 'relationPredicate', 'relationObject', '@id']
-    for relation in relations:
-        edge = create_edge(_source = relation['relationSubject'],
-                           _target = relation['relationObject'],
-                           _label = relation['name'],
-                           _edge_type = 'relation')
-        edge['data']['@id'] = relation['@id']
-        edge['data']['predicate'] = relation['relationPredicate']
-        edges.append(edge)
+    edge_index = {'source': {}, 'target': {}, 'roots': {}}
+    parentless = {}
+    for edge in edges:
+        index_edge(edge_index, edge)
+        if edge.source not in parentless:
+            parentless[edge.source] = nodes[edge.source].type != 'entity'
+        parentless[edge.target] = False
+    edge_index['roots'] = {node_id: True for node_id, is_parentless in parentless.items() if is_parentless}
+    return edge_index
 
-    return edges
+def degree(edge_index, node_id, side='source', edge_type=None):
+    """Counts the edges leaving or entering a node.
+
+    Parameters:
+    edge_index (dict): adjacency index, see index_edges
+    node_id (str): node id
+    side (str): source for the edges leaving the node, target for the edges entering it
+    edge_type (str): type of edges counted, or None for all types
+
+    Returns:
+    int: number of edges
+    """
+    by_type = edge_index[side].get(node_id, {})
+    if edge_type is not None:
+        return len(by_type.get(edge_type, []))
+    return sum(len(edge_list) for edge_list in by_type.values())
 
+@metrics.timed('containers', lambda result, nodes, edges, containers: {'containers': len(containers)})
 def handle_containers(nodes, edges, containers):
     """Connects incoming and outgoing edges and removes all unvisualized nodes and edges.
+
+    Containers are processed in order in a single pass over an index of the
+    edges touching them. Stale edges are dropped in bulk at the end and
+    rewired edges that already exist are not added again.
     
     Parameters:
     nodes (dict): nodes in the schema
@@ -138,86 +240,138 @@ def handle_containers(nodes, edges, containers):
     nodes (dict): nodes in the schema
     edges (list): edges in the schema
     """
-    edges_to_remove = []
+    container_set = set(containers)
+    in_index = {container: [] for container in container_set}
+    out_index = {container: [] for container in container_set}
+    edge_keys = set()
+
+    def add_edge(edge):
+        key = (edge.source, edge.target, edge.type)
+        if key in edge_keys:
+            return
+        edge_keys.add(key)
+        edges.append(edge)
+        if edge.target in container_set:
+            in_index[edge.target].append(edge)
+        if edge.source in container_set:
+            out_index[edge.source].append(edge)
+
+    # index edges connected to containers
+    for edge in edges:
+        edge_keys.add((edge.source, edge.target, edge.type))
+        if edge.target in container_set:
+            in_index[edge.target].append(edge)
+        if edge.source in container_set:
+            out_index[edge.source].append(edge)
+
+    edges_to_remove = set()
     for container in containers:
         in_edges = []
         out_edges = []
         parent_edge = ['', '']
         # find all edges connected to the container
-        for edge in edges:
-            if edge['data']['target'] == container:
-                if edge['data']['_edge_type'] == 'step_child':
-                    parent_edge[0] = edge['data']['source']
-                else:
-                    in_edges.append(edge['data']['source'])
-                edges_to_remove.append(edge)
-            if edge['data']['source'] == container:
-                if edge['data']['_edge_type'] == 'step_child':
-                    parent_edge[1] = edge['data']['target']
-                out_edges.append(edge['data']['target'])
-                edges_to_remove.append(edge)
+        for edge in in_index[container]:
+            if edge.type == 'step_child':
+                parent_edge[0] = edge.source
+            else:
+                in_edges.append(edge.source)
+            edges_to_remove.add(id(edge))
+        for edge in out_index[container]:
+            if edge.type == 'step_child':
+                parent_edge[1] = edge.target
+            out_edges.append(edge.target)
+            edges_to_remove.add(id(edge))
         # add hierarchical edge
         if parent_edge[0] != '' and parent_edge[1] != '':
-            edges.append(create_edge(parent_edge[0], parent_edge[1], _edge_type='step_child'))
+            add_edge(create_edge(parent_edge[0], parent_edge[1], _edge_type='step_child'))
         # attach other edges
         if len(in_edges) == 1:
             for out in out_edges:
-                edges.append(create_edge(in_edges[0], out, _edge_type='child_outlink'))
-        else:
+                add_edge(create_edge(in_edges[0], out, _edge_type='child_outlink'))
+        elif out_edges:
             for edge in in_edges:
-                edges.append(create_edge(edge, out_edges[0], _edge_type='child_outlink'))
-        nodes.pop(container)
+                add_edge(create_edge(edge, out_edges[0], _edge_type='child_outlink'))
+        nodes.pop(container, None)
 
-    for index in edges_to_remove:
-        edges.remove(index)
+    edges = [edge for edge in edges if id(edge) not in edges_to_remove]
     
     return nodes, edges
 
-def get_nodes_and_edges(schema_json):
-    """Creates lists of nodes and edges through the schema event ontology.
+class GraphBuilder:
+    """Builds nodes and edges from schema items, in the order they are read.
 
-    Parameters:
-    schemaJson (dict): entire schema in json form
+    Entities and relations should be added before the events that use them,
+    as get_nodes_and_edges does; finish collapses containers, finds the
+    roots and indexes the edges.
 
-    Returns:
-    nodes (dict): nodes in the schema
-    edges (list): edges in the schema
+    Parameters:
+    json_index (dict): if given, items are also indexed into it as they are added, see index_json
+    search_index (SearchIndex): if given, the text of entities and events is also indexed into it
     """
-    
-    # get entities and relations
-    nodes = get_entities(schema_json['entities'])
-    edges = get_relations(schema_json['relations'])
 
-    # get events and attach entities to them
-    containers_to_remove = []
-    events = schema_json['events']
-    for event in events:
+    def __init__(self, json_index=None, search_index=None):
+        self.nodes = {}
+        self.edges = []
+        self.containers_to_remove = []
+        self.json_index = json_index
+        self.search_index = search_index
+        self.positions = {'entities': 0, 'relations': 0, 'events': 0}
+
+    def _index(self, key, index_item, item):
+        """Indexes an item at the next position of its list."""
+        if self.json_index is not None:
+            index_item(self.json_index, self.positions[key], item)
+            self.positions[key] += 1
+
+    def add_entity(self, entity):
+        """Adds an entity node. An event already read under the same id is kept."""
+        self._index('entities', index_entity, entity)
+        if self.search_index is not None:
+            self.search_index.add_entity(entity)
+        if entity['@id'] not in self.nodes:
+            self.nodes[entity['@id']] = create_entity_node(entity)
+
+    def add_relation(self, relation):
+        """Adds a relation edge."""
+        self._index('relations', index_relation, relation)
+        self.edges.append(create_relation_edge(relation))
+
+    def add_event(self, event):
+        """Adds an event node, its children, outlinks and participant edges."""
+        self._index('events', index_event, event)
+        if self.search_index is not None:
+            self.search_index.add_event(event)
+        nodes = self.nodes
+        edges = self.edges
+        containers_to_remove = self.containers_to_remove
         # create event node
         # if node already exists, add information
         _label = event['name'].split('/')[-1].replace('_', ' ').replace('-', ' ')
         event_id = event['@id']
         if event_id in nodes:
-            nodes[event_id]['data']['_type'] = 'event'
-            nodes[event_id]['data']['_label'] = _label
-            nodes[event_id] = extend_node(nodes[event_id], event)
+            node = nodes[event_id]
+            node.type = 'event'
+            node.label = _label
+            extend_node(node, event)
             if 'children' not in event:
-                nodes[event_id]['data']['_type'] = 'child'
-            elif 'outlinks' in nodes[event_id]['data']['name'].lower():
-                nodes[event_id]['data']['_type'] = 'container'
+                node.type = 'child'
+            elif 'outlinks' in node.fields['name'].lower():
+                node.type = 'container'
                 containers_to_remove.append(event_id)
             else:
-                nodes[event_id]['data']['_type'] = 'parent'
-                nodes[event_id]['data']['_shape'] = 'diamond'
+                node.type = 'parent'
+                node.shape = 'diamond'
         else:
-            nodes[event_id] = extend_node(create_node(event_id, _label, 'event', 'diamond'), event)
-            nodes[event_id]['data']['_type'] = 'parent'
+            node = extend_node(create_node(event_id, _label, 'event', 'diamond'), event)
+            node.type = 'parent'
+            nodes[node.id] = node
 
         # not hierarchical node, change node type to a leaf
         if 'children' not in event:
-            nodes[event_id]['data']['_type'] = 'child'
-            nodes[event_id]['data']['_shape'] = 'ellipse'
+            node.type = 'child'
+            node.shape = 'ellipse'
         # handle repeatable
-        if 'repeatable' in nodes[event_id]['data'] and nodes[event_id]['data']['repeatable']:
+        if node.fields.get('repeatable'):
             edges.append(create_edge(event_id, event_id, _edge_type='child_outlink'))
 
         # link participants to entities
@@ -226,29 +380,31 @@ def get_nodes_and_edges(schema_json):
                 _label = participant['roleName']
                 entity_id = participant['entity']
                 edge = create_edge(event_id, entity_id, _label, _edge_type='step_participant')
-                edge['data']['@id'] = participant['@id']
+                edge.ref = participant['@id']
                 edges.append(edge)
 
         # children
         if 'children' in event:
             gate = 'or'
-            if nodes[event_id]['data']['children_gate'] == 'xor':
+            if node.fields['children_gate'] == 'xor':
                 gate = 'xor'
                 xor_id = f'{event_id}xor'
                 nodes[xor_id] = create_node(xor_id, 'XOR', 'gate', 'rectangle')
-            elif nodes[event_id]['data']['children_gate'] == 'and':
+            elif node.fields['children_gate'] == 'and':
                 gate = 'and'
-            
+
             for child in event['children']:
                 # add child information or create new node
                 child_id = child['child']
                 if child_id in nodes:
-                    prev_type = nodes[child_id]['data']['_type']
-                    nodes[child_id]['data']['_type'] = 'child'
-                    nodes[child_id] = extend_node(nodes[child_id], child)
-                    nodes[child_id]['data']['_type'] = prev_type
+                    child_node = nodes[child_id]
+                    prev_type = child_node.type
+                    child_node.type = 'child'
+                    extend_node(child_node, child)
+                    child_node.type = prev_type
                 else:                    
-                    nodes[child_id] = extend_node(create_node(child_id, child['comment'], 'child', 'ellipse'), child)
+                    child_node = extend_node(create_node(child_id, child['comment'], 'child', 'ellipse'), child)
+                    nodes[child_node.id] = child_node
 
                 # handle xor gate or just add edges
                 if gate == 'xor':
@@ -256,48 +412,134 @@ def get_nodes_and_edges(schema_json):
                     edges.append(create_edge(event_id, xor_id, _edge_type='step_child'))
                 else:
                     edges.append(create_edge(event_id, child_id, _edge_type='child_outlink' if gate == 'and' else 'step_child'))
-            
+
                 # add outlinks
                 if len(child['outlinks']):
                     for outlink in child['outlinks']:
                         if outlink not in nodes:
                             _label = outlink.split('/')[-1].replace('_', '')
-                            nodes[outlink] = create_node(outlink, _label, 'child', 'ellipse')
+                            outlink_node = create_node(outlink, _label, 'child', 'ellipse')
+                            nodes[outlink_node.id] = outlink_node
                         edges.append(create_edge(child_id, outlink, _edge_type='child_outlink'))
 
-    nodes, edges = handle_containers(nodes, edges, containers_to_remove)
+    def finish(self, complete=None):
+        """Collapses containers and finds the root nodes.
 
-    # find root node(s)
-    parentless_edge = {}
-    for edge in edges:
-        if edge['data']['source'] not in parentless_edge:
-            if nodes[edge['data']['source']]['data']['_type'] == 'entity':
-                parentless_edge[edge['data']['source']] = False
-            else:
-                parentless_edge[edge['data']['source']] = True
-        parentless_edge[edge['data']['target']] = False
-    roots = [edge for edge in parentless_edge if parentless_edge[edge] == True]
-    for root in roots:
-        nodes[root]['data']['_type'] = 'root'
-
-    # TODO: entities and relations
-    # Zoey wants an entity-first view, so all entities are shown, with groups of events around them in clusters
-        # Q: are we able to make a tab on the viewer itself to switch between views?
-        
-    return nodes, edges
+        Parameters:
+        complete (set): when only part of the schema was added, the ids whose defining
+        and referencing items were all added; only those can be roots
+
+        Returns:
+        nodes (dict): nodes in the schema
+        edges (list): edges in the schema
+        edge_index (dict): adjacency index over edges, see index_edges
+        """
+        nodes, edges = handle_containers(self.nodes, self.edges, self.containers_to_remove)
+        # containers are not shown, so they are not found either
+        if self.search_index is not None:
+            for container in self.containers_to_remove:
+                self.search_index.remove_node(container)
+
+        # index edges and find root node(s)
+        edge_index = index_edges(nodes, edges)
+        if complete is not None:
+            edge_index['roots'] = {root: True for root in edge_index['roots'] if root in complete}
+        for root in edge_index['roots']:
+            nodes[root].type = 'root'
+
+        # TODO: a tab on the viewer to switch to the entity-first view, see get_entity_view
+
+        return nodes, edges, edge_index
+
+@metrics.timed('build', lambda result, *args: {'nodes': len(result[0]), 'edges': len(result[1])})
+def get_nodes_and_edges(schema_json, json_index=None, search_index=None):
+    """Creates lists of nodes and edges through the schema event ontology.
+
+    Parameters:
+    schemaJson (dict): entire schema in json form
+    json_index (dict): if given, filled with the index over the schema in the same pass, see index_json
+    search_index (SearchIndex): if given, filled with the text of the schema in the same pass
+
+    Returns:
+    nodes (dict): nodes in the schema
+    edges (list): edges in the schema
+    edge_index (dict): adjacency index over edges, see index_edges
+    """
+    builder = GraphBuilder(json_index, search_index)
 
-def update_json(values):
+    # get entities and relations
+    for entity in schema_json['entities']:
+        builder.add_entity(entity)
+    for relation in schema_json['relations']:
+        builder.add_relation(relation)
+
+    # get events and attach entities to them
+    for event in schema_json['events']:
+        builder.add_event(event)
+
+    return builder.finish()
+
+def rebuild_graph(workspace, reindex=False):
+    """Re-parses the whole graph of a workspace from its schema JSON, along with its search index.
+
+    Parameters:
+    workspace (Workspace): workspace to rebuild
+    reindex (bool): whether to rebuild the index over the JSON too, when it may not match the JSON
+
+    """
+    json_index = new_json_index() if reindex else None
+    search_index = SearchIndex()
+    workspace.nodes, edges, workspace.edge_index = get_nodes_and_edges(workspace.schema_json, json_index,
+                                                                       search_index)
+    workspace.edges = dict.fromkeys(edges)
+    if reindex:
+        workspace.json_index = json_index
+    workspace.search_index = search_index
+
+def index_text_changes(workspace, node_ids, changes):
+    """Updates the search index of a workspace, if it has one, after update_json changed nodes.
+
+    Parameters:
+    workspace (Workspace): workspace holding the changed schema and graph
+    node_ids (list): ids of the changed nodes, before and after the change
+    changes (list): changed JSON fields
+
+    """
+    search_index = workspace.search_index
+    if search_index is None:
+        return
+    fields = entity_fields + event_fields
+    if not any(change['path'][-1] in fields or change['path'][-1] in ('@id', 'child') for change in changes):
+        return
+    for node_id in node_ids:
+        # containers are not shown, so they are not found either
+        if is_hidden_container(workspace, node_id):
+            search_index.remove_node(node_id)
+        else:
+            search_index.reindex_node(workspace.schema_json, workspace.json_index, node_id)
+
+@metrics.timed('update')
+def update_json(workspace, values, changes=None, undo=None):
     """Updates JSON with values.
 
+    Only the objects defining or referencing the node are touched, found
+    through the workspace's json_index.
+
     Parameters:
+    workspace (Workspace): workspace holding the schema to change
     values (dict): contains node id, key, and value to change key to.
     e.g. {id: node_id, key: name, value: Test}
+    changes (list): if given, collects {path, value} for every changed field in the JSON
+    undo (list): if given, collects the old values of changed fields, see set_field
 
     Returns:
     schemaJson (dict): new JSON 
     """
-    global schema_json
-    new_json = schema_json
+    if changes is None:
+        changes = []
+    first_change = len(changes)
+    new_json = workspace.schema_json
+    json_index = workspace.json_index
     node_id = values['id']
     node_type = False
     key = values['key']
@@ -307,175 +549,1574 @@ def update_json(values):
         return new_json
     else:
         node_type = node_id.split('/')[0].split(':')[-1].lower()
-    is_root = node_id == schema_name
+    is_root = node_id == workspace.schema_name
 
     # TODO how to edit relations and participants through the sidebar?
 
+    # renaming moves the id everywhere it is defined or referenced
+    if key == '@id':
+        kind = 'entities' if node_type == 'entities' else 'events'
+        remap_ids(new_json, json_index, {kind: {node_id: new_value}}, changes, undo)
+        index_text_changes(workspace, [node_id, new_value], changes[first_change:])
+        return new_json
+
     # entities
     if node_type == 'entities':
         # entity data
-        for entity in new_json['entities']:
-            if entity['@id'] == node_id:
-                entity[key] = new_value
-        if key != '@id':
-            schema_json = new_json
-            return schema_json
-        else:
-            # relation data
-            for relation in new_json['relations']:
-                if relation['relationSubject'] == node_id:
-                    relation['relationSubject'] = new_value
-                if relation['relationObject'] == node_id:
-                    relation['relationObject'] = new_value
-                pass
+        for e in json_index['entities'].get(node_id, []):
+            set_field(new_json, ['entities', e, key], new_value, changes, undo)
+        index_text_changes(workspace, [node_id], changes[first_change:])
+        return new_json
 
     # nodes
     # child key
-    if key == 'name':
-        child_key = 'comment'
-    elif key == '@id':
-        child_key = 'child'
+    child_key = 'comment' if key == 'name' else key
+
+    # scheme data
+    update_children = True
+    for s in json_index['events'].get(node_id, []):
+        scheme = new_json['events'][s]
+        if key in scheme:
+            if key == 'name':
+                rename_event_name(json_index, s, scheme['name'], new_value)
+            set_field(new_json, ['events', s, key], new_value, changes, undo)
+            if is_root and key not in schema_key_dict['event']:
+                update_children = False
+        elif key in schema_key_dict['privateData'] and 'privateData' in scheme:
+            if key in scheme['privateData']:
+                set_field(new_json, ['events', s, 'privateData', key], new_value, changes, undo)
+                update_children = False
+
+    # children data
+    if update_children and child_key in schema_key_dict['child']:
+        for s, c in json_index['children'].get(node_id, []):
+            set_field(new_json, ['events', s, 'children', c, child_key], new_value, changes, undo)
+    # participant data is not listed in sidebar
+
+    index_text_changes(workspace, [node_id], changes[first_change:])
+    return new_json
+
+def unindex_edge(edge_index, edge):
+    """Removes an edge from the adjacency index.
+
+    Parameters:
+    edge_index (dict): adjacency index, see index_edges
+    edge (Edge): edge to remove
+
+    """
+    for side, node_id in (('source', edge.source), ('target', edge.target)):
+        by_type = edge_index[side].get(node_id, {})
+        edge_list = by_type.get(edge.type, [])
+        for i, indexed in enumerate(edge_list):
+            if indexed is edge:
+                edge_list.pop(i)
+                break
+        if not edge_list:
+            by_type.pop(edge.type, None)
+        if not by_type:
+            edge_index[side].pop(node_id, None)
+
+def record_added(diff, element_id):
+    """Records that an element id came into use, noting it as new unless it was in use before the change."""
+    if element_id not in diff['removed']:
+        diff['created'].add(element_id)
+
+def record_rename(diff, old_id, new_id):
+    """Records that an element moved to a new id, following on from its earlier renames."""
+    renamed = diff['renamed']
+    for earlier_id, current_id in renamed.items():
+        if current_id == old_id:
+            renamed[earlier_id] = new_id
+    renamed[old_id] = new_id
+    diff['removed'][old_id] = None
+    record_added(diff, new_id)
+
+def rename_node(workspace, old_id, new_id, diff):
+    """Moves a node, its edges and their index entries to a new id.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    old_id (str): current node id
+    new_id (str): new node id
+    diff (dict): collects renamed elements, see patch_graph
+
+    """
+    nodes = workspace.nodes
+    edge_index = workspace.edge_index
+    node = nodes.pop(old_id)
+    node.id = intern(new_id)
+    nodes[node.id] = node
+    for key in ('@id', 'child'):
+        if key in node.fields:
+            node.fields[key] = new_id
+    if node.label == old_id:
+        node.label = new_id
+    record_rename(diff, old_id, new_id)
+    diff['nodes'][new_id] = node
+
+    # re-key edges
+    moved = {}
+    for side in ('source', 'target'):
+        for edge_list in edge_index[side].get(old_id, {}).values():
+            for edge in edge_list:
+                moved[id(edge)] = edge
+    for edge in moved.values():
+        old_edge_id = edge.id
+        if edge.source == old_id:
+            edge.source = node.id
+        if edge.target == old_id:
+            edge.target = node.id
+        record_rename(diff, old_edge_id, edge.id)
+        diff['edges'][edge.id] = edge
+        # sources of outlinks show the renamed id in their outlinks
+        if edge.target == new_id and edge.type == 'child_outlink':
+            diff['nodes'][edge.source] = nodes[edge.source]
+    for side in ('source', 'target'):
+        by_type = edge_index[side].pop(old_id, None)
+        if by_type:
+            merged = edge_index[side].setdefault(node.id, {})
+            for edge_type, edge_list in by_type.items():
+                merged.setdefault(edge_type, []).extend(edge_list)
+    # roots keep their order
+    if old_id in edge_index['roots']:
+        edge_index['roots'] = {node.id if root == old_id else root: True for root in edge_index['roots']}
+
+def check_update(values):
+    """Checks that a field change is well formed before anything is changed.
+
+    Parameters:
+    values (dict): contains node id, key, and value to change key to.
+
+    Raises:
+    ValueError: if the change cannot be applied
+    """
+    if not isinstance(values, dict) or not all(field in values for field in ('id', 'key', 'value')):
+        raise ValueError('expected {id, key, value}')
+    if not isinstance(values['id'], str) or not isinstance(values['key'], str):
+        raise ValueError('id and key must be strings')
+    if values['key'] in structural_keys:
+        raise ValueError(f"{values['key']} cannot be edited, it changes the structure of the graph")
+    if values['key'] in ('@id', 'name') and not isinstance(values['value'], str):
+        raise ValueError(f"{values['key']} must be a string")
+    if values['key'] == '@id' and not values['value']:
+        raise ValueError('@id must not be empty')
+
+def shown_comment(workspace, node_id):
+    """Finds the comment the graph shows for a node defined by an event.
+
+    The event and the children entries referring to it may each carry a
+    comment; the one applied last in build order wins, see add_event.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    node_id (str): node id
+
+    Returns:
+    str: the comment, or None if no place sets one
+    """
+    events = workspace.schema_json['events']
+    json_index = workspace.json_index
+    comment = None
+    for s in sorted(set(json_index['events'].get(node_id, [])) |
+                    {s for s, _ in json_index['children'].get(node_id, [])}):
+        event = events[s]
+        if event['@id'] == node_id and 'comment' in event:
+            comment = event['comment']
+        for child in event.get('children', []):
+            if child['child'] == node_id and 'comment' in child:
+                comment = child['comment']
+    return comment
+
+def new_graph_diff():
+    """Returns an empty graph diff, to be filled by apply_graph_change.
+
+    Removed ids are kept in order of removal, and ids that did not exist
+    before the change are collected so they are never reported as removed.
+    """
+    return {'nodes': {}, 'edges': {}, 'removed': {}, 'renamed': {}, 'created': set(), 'reload': False}
+
+def needs_reload(workspace, values):
+    """Whether a field change alters the structure of a hierarchy, so the schema is re-parsed instead of patched.
+
+    That is a children gate change, a rename onto an existing id, an
+    event turning into or out of a container, or a repeat loop added to or
+    removed from a node no other node points to, which may make it a root
+    or stop it from being one, see index_edges. Collapsed containers are
+    not in the graph, so only their structural changes are re-parsed.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema, not patched yet
+    values (dict): contains node id, key, and value to change key to.
+
+    Returns:
+    bool: whether the graph must be re-parsed
+    """
+    nodes = workspace.nodes
+    key = values['key']
+    new_value = values['value']
+    if values['id'] not in nodes:
+        # a collapsed container passes its repeat loop on to the nodes around it,
+        # and comes back once it is renamed out of being one
+        return values['id'] in workspace.json_index['events'] and \
+            (key in ('children_gate', 'repeatable') or key == 'name' and 'outlinks' not in str(new_value).lower())
+    fields = nodes[values['id']].fields
+    changes_container = key == 'name' and 'children_gate' in fields and \
+        ('outlinks' in str(fields.get('name', '')).lower()) != ('outlinks' in str(new_value).lower())
+    changes_roots = key == 'repeatable' and \
+        all(edge.source == values['id'] for edge_list in workspace.edge_index['target'].get(values['id'], {}).values()
+            for edge in edge_list)
+    return key == 'children_gate' or changes_container or changes_roots or (key == '@id' and new_value in nodes)
+
+def apply_graph_change(workspace, values, changes, diff):
+    """Applies a single field change that keeps the structure of the graph to the graph and its indexes.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    values (dict): contains node id, key, and value to change key to.
+    changes (list): changed JSON fields, as collected by update_json
+    diff (dict): collects changed nodes and edges by id, ids of removed elements and renamed element ids
+
+    """
+    nodes = workspace.nodes
+    node_id = values['id']
+    key = values['key']
+    new_value = values['value']
+    node = nodes[node_id]
+    fields = node.fields
+    if key == '@id':
+        rename_node(workspace, node_id, new_value, diff)
+        if f'{node_id}xor' in nodes:
+            rename_node(workspace, f'{node_id}xor', f'{new_value}xor', diff)
     else:
-        child_key = key
-        
-    for scheme in new_json['events']:
-        # entity id search
-        if node_type == 'entities':
-            if 'participants' in scheme:
-                for participant in scheme['participants']:
-                    if participant['entity'] == node_id:
-                        participant['entity'] = new_value
-        else:
-            # scheme data
-            if scheme['@id'] == node_id:
-                if key in scheme:
-                    scheme[key] = new_value
-                    if key == 'comment':
-                        break
-                    if key in schema_key_dict['event'] or is_root:
-                        break
-                elif key in schema_key_dict['privateData'] and 'privateData' in scheme:
-                    if key in scheme['privateData']:
-                        scheme['privateData'][key] = new_value
-                        break
-            # children data
-            if 'children' in scheme and child_key in schema_key_dict['child']:
-                for child in scheme['children']:
-                    # child
-                    if child['child'] == node_id:
-                        child[child_key] = new_value
-                    # child outlinks
-                    if child_key == 'child':
-                        for i in range(len(child['outlinks'])):
-                            if child['outlinks'][i] == node_id:
-                                child['outlinks'][i] = new_value
-            # participant data is not listed in sidebar
-
-    schema_json = new_json
-    return schema_json
-
-def get_connected_nodes(selected_node):
-    """Constructs graph to be visualized by the viewer.
+        # a child without an event of its own only carries the comment
+        if key == 'name' and '@id' not in fields:
+            key = 'comment'
+        fields[key] = new_value
+        diff['nodes'][node_id] = node
+        if key == 'name':
+            if node.type == 'entity':
+                node.label = new_value
+            else:
+                node.label = new_value.split('/')[-1].replace('_', ' ').replace('-', ' ')
+            if node.type == 'root':
+                workspace.schema_name = new_value
+            # children comments follow the name
+            if any(change['path'][-1] == 'comment' for change in changes):
+                fields['comment'] = shown_comment(workspace, node_id)
+        elif key == 'comment' and '@id' not in fields:
+            node.label = new_value
+        elif key == 'optional':
+            node.classes = 'optional' if new_value else ''
+        elif key == 'repeatable':
+            loop = [edge for edge in workspace.edge_index['source'].get(node_id, {}).get('child_outlink', [])
+                    if edge.target == node_id]
+            if new_value and not loop:
+                edge = create_edge(node_id, node_id, _edge_type='child_outlink')
+                workspace.edges[edge] = None
+                index_edge(workspace.edge_index, edge)
+                diff['edges'][edge.id] = edge
+                record_added(diff, edge.id)
+            elif not new_value:
+                for edge in loop:
+                    del workspace.edges[edge]
+                    unindex_edge(workspace.edge_index, edge)
+                    diff['removed'][edge.id] = None
+
+def finish_graph_diff(workspace, diff):
+    """Turns a graph diff collected over one or more changes into the lists sent to the viewer.
+
+    Elements changed several times are listed once as they are now,
+    elements that were removed and came back are not listed as removed,
+    and ids that only existed between changes are left out.
 
     Parameters:
-    selected_node (str): name of node that serves as the topmost node.
+    workspace (Workspace): workspace holding the patched graph
+    diff (dict): graph diff, see new_graph_diff
 
     Returns:
-    str: name of root node
-    dict: list of nodes and list of edges
-    
+    diff (dict): changed nodes and edges, ids of removed elements, renamed element ids,
+                 and whether the whole graph was reloaded
+    """
+    if diff['reload']:
+        return {'nodes': [], 'edges': [], 'removed': [], 'renamed': {}, 'reload': True}
+    nodes = list({id(node): node for node in diff['nodes'].values() if workspace.nodes.get(node.id) is node}.values())
+    edges = []
+    seen = set()
+    for edge in diff['edges'].values():
+        indexed = workspace.edge_index['source'].get(edge.source, {}).get(edge.type, [])
+        if id(edge) not in seen and any(other is edge for other in indexed):
+            seen.add(id(edge))
+            edges.append(edge)
+    present = {node.id for node in nodes} | {edge.id for edge in edges} | \
+              {element_id for element_id in diff['removed'] if element_id in workspace.nodes}
+    removed = [element_id for element_id in diff['removed']
+               if element_id not in present and element_id not in diff['created']]
+    removed_ids = set(removed)
+    renamed = {old_id: new_id for old_id, new_id in diff['renamed'].items() if old_id in removed_ids}
+    return {'nodes': nodes, 'edges': edges, 'removed': removed, 'renamed': renamed, 'reload': False}
+
+def revert_changes(workspace, undo):
+    """Puts back the fields changed by update_json and rebuilds the graph and indexes from them.
+
+    Parameters:
+    workspace (Workspace): workspace holding the changed schema
+    undo (list): old values of the changed fields, as collected by update_json
+
+    """
+    revert_fields(workspace.schema_json, undo)
+    rebuild_graph(workspace, reindex=True)
+    try:
+        workspace.schema_name, _ = get_connected_nodes(workspace, 'root')
+    except SchemaError:
+        # the error that led to the revert is the one to report
+        pass
+
+@metrics.timed('patch')
+def patch_graph(workspace, values, changes, undo=None):
+    """Applies a single field change to the parsed graph and its indexes.
+
+    Changes that alter the structure of a hierarchy re-parse the schema
+    instead, see needs_reload. If the changed schema cannot be parsed, the
+    change is reverted when its undo list is given.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    values (dict): contains node id, key, and value to change key to.
+    changes (list): changed JSON fields, as collected by update_json
+    undo (list): old values of the changed fields, as collected by update_json
+
+    Returns:
+    diff (dict): changed nodes and edges, ids of removed elements, renamed element ids,
+                 and whether the whole graph was reloaded
+
+    Raises:
+    ValueError: if the changed schema cannot be parsed
     """
+    diff = new_graph_diff()
+    if not changes:
+        pass
+    elif needs_reload(workspace, values):
+        try:
+            rebuild_graph(workspace)
+        except Exception as e:
+            if undo is None:
+                raise
+            revert_changes(workspace, undo)
+            raise ValueError('the graph cannot be built after this change') from e
+        diff['reload'] = True
+    elif values['id'] in workspace.nodes:
+        apply_graph_change(workspace, values, changes, diff)
+    return finish_graph_diff(workspace, diff)
 
+@metrics.timed('batch', lambda result, workspace, operations: {'operations': len(operations)})
+def update_batch(workspace, operations):
+    """Applies several field changes to the JSON and the parsed graph, all of them or none.
+
+    Every change is checked first. The graph is patched change by change,
+    or re-parsed once at the end if any change alters its structure. If a
+    change fails, or the changed schema cannot be parsed, the fields changed
+    so far are put back and the graph and indexes are rebuilt from them.
+
+    Parameters:
+    workspace (Workspace): workspace holding the schema to change, detached
+    operations (list): {id, key, value} changes, applied in order
+
+    Returns:
+    changes (list): {path, value} of every changed field in the JSON, once per field
+    diff (dict): combined graph diff, see patch_graph
+
+    Raises:
+    ValueError: if a change is not well formed, naming its position, or the changed schema cannot be parsed
+    """
+    for i, values in enumerate(operations):
+        try:
+            check_update(values)
+        except ValueError as e:
+            raise ValueError(f'operation {i}: {e}')
+
+    changes = []
+    undo = []
+    diff = new_graph_diff()
+    try:
+        for values in operations:
+            operation_changes = []
+            update_json(workspace, values, operation_changes, undo)
+            changes.extend(operation_changes)
+            if diff['reload'] or not operation_changes:
+                continue
+            if needs_reload(workspace, values):
+                diff['reload'] = True
+            elif values['id'] in workspace.nodes:
+                apply_graph_change(workspace, values, operation_changes, diff)
+        if diff['reload']:
+            try:
+                rebuild_graph(workspace)
+            except Exception as e:
+                raise ValueError('the graph cannot be built after these changes') from e
+    except Exception:
+        revert_changes(workspace, undo)
+        raise
+
+    changes = list({tuple(change['path']): change for change in changes}.values())
+    return changes, finish_graph_diff(workspace, diff)
+
+def collect_subtree(nodes, edge_index, root_node, is_root=False, offset=0, limit=None, edge_types=None,
+                    include_entities=True):
+    """Collects the nodes a node points to and the causal edges between them.
+
+    The nodes pointed to can be windowed, in which case only the causal
+    edges leaving the nodes of the window are collected.
+
+    Parameters:
+    nodes (dict): nodes in the schema
+    edge_index (dict): adjacency index over edges, see index_edges
+    root_node (Node): node that serves as the topmost node
+    is_root (bool): whether the node is the root of the schema, which is itself
+    included with its outlinks in the first window, but without its participants
+    offset (int): number of nodes pointed to to skip
+    limit (int): maximum number of nodes pointed to, or None for all of them
+    edge_types (set): types of edges to follow, or None for all types
+    include_entities (bool): whether to include participants
+
+    Returns:
+    dict: list of nodes, list of edges and the number of nodes pointed to before windowing
+    """
     n = []
     e = []
     id_set = set()
-    
-    if selected_node == 'root':
-        for _, node in nodes.items():
-            if node['data']['_type'] == 'root':
-                root_node = node
-                n.append(node)
-                id_set.add(node['data']['id'])
-                break
-    else:
-        root_node = nodes[selected_node]
-    
+    if is_root and offset == 0:
+        n.append(root_node)
+        id_set.add(root_node.id)
+
     # node children
-    for edge in edges:
-        if edge['data']['source'] == root_node['data']['id']:
-            node = nodes[edge['data']['target']]
+    children = []
+    for edge_type, edge_list in edge_index['source'].get(root_node.id, {}).items():
+        if edge_types is not None and edge_type not in edge_types:
+            continue
+        for edge in edge_list:
+            node = nodes[edge.target]
             # skip entities
-            if selected_node == 'root' and node['data']['_type'] == 'entity':
+            if (is_root or not include_entities) and node.type == 'entity':
                 continue
-            e.append(edge)
-            n.append(nodes[edge['data']['target']])
-            id_set.add(nodes[edge['data']['target']]['data']['id'])
-    
+            children.append((edge, node))
+    window = children[offset:] if limit is None else children[offset:offset + limit]
+    for edge, node in window:
+        e.append(edge)
+        n.append(node)
+        id_set.add(node.id)
+
     # causal edges between children
+    follow_outlinks = edge_types is None or 'child_outlink' in edge_types
+    follow_relations = edge_types is None or 'relation' in edge_types
     for id in id_set:
-        for edge in edges:
-            if edge['data']['source'] == id:
-                if edge['data']['_edge_type'] == 'child_outlink':
-                    # check if node was created previously
-                    if edge['data']['target'] not in id_set:
-                        n.append(nodes[edge['data']['target']])
-                    e.append(edge)
-                if edge['data']['target'] in id_set and edge['data']['_edge_type'] == 'relation':
-                    e.append(edge)
-
-    return root_node['data']['name'], {'nodes': n, 'edges': e}
+        out_edges = edge_index['source'].get(id, {})
+        for edge in out_edges.get('child_outlink', []) if follow_outlinks else []:
+            # check if node was created previously
+            if edge.target not in id_set:
+                n.append(nodes[edge.target])
+            e.append(edge)
+        for edge in out_edges.get('relation', []) if follow_relations else []:
+            if edge.target in id_set:
+                e.append(edge)
+
+    return {'nodes': n, 'edges': e, 'total': len(children)}
+
+def no_root_error(workspace):
+    """Error of a schema with no root to show, e.g. when all its events are children of each other."""
+    return SchemaError([{'severity': 'error', 'problem': 'no_root', '@id': workspace.schema_json.get('@id'),
+                         'path': 'events', 'message': no_root_message}])
+
+@metrics.timed('subtree', lambda result, *args, **window: graph_counts(result[1]))
+def get_connected_nodes(workspace, selected_node, as_root=False, **window):
+    """Constructs graph to be visualized by the viewer.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    selected_node (str): name of node that serves as the topmost node, or root for the first root
+    as_root (bool): whether to show the node as a root of the schema, see collect_subtree
+    window: offset, limit, edge_types and include_entities, see collect_subtree
+
+    Returns:
+    str: name of root node
+    dict: list of nodes, list of edges and the number of nodes pointed to
+
+    Raises:
+    SchemaError: if the first root is asked for and the schema has none
+    """
+    if workspace.subtrees is not None:
+        nodes, edge_index, root_node = get_lazy_subtree(workspace, selected_node)
+    else:
+        nodes = workspace.nodes
+        edge_index = workspace.edge_index
+        if selected_node == 'root':
+            if not edge_index['roots']:
+                raise no_root_error(workspace)
+            root_node = nodes[next(iter(edge_index['roots']))]
+        else:
+            root_node = nodes[selected_node]
+    graph = collect_subtree(nodes, edge_index, root_node, is_root=as_root or selected_node == 'root', **window)
+    return root_node.fields['name'], graph
+
+def list_roots(workspace):
+    """Lists the roots of a schema, i.e. its top-level events.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+
+    Returns:
+    list: {'@id', 'name', 'children'} per root, where children counts the edges leaving it
+    """
+    roots = []
+    if workspace.subtrees is not None:
+        schema_json = workspace.schema_json
+        root_ids = dict.fromkeys(event['@id'] for event in schema_json['events']
+                                 if is_root_event(schema_json, workspace.json_index, event['@id']))
+        for root_id in root_ids:
+            nodes, edge_index, _ = get_lazy_subtree(workspace, root_id)
+            roots.append((nodes[root_id], degree(edge_index, root_id)))
+    else:
+        roots = [(workspace.nodes[root_id], degree(workspace.edge_index, root_id))
+                 for root_id in workspace.edge_index['roots']]
+    return [{'@id': node.id, 'name': node.fields.get('name', ''), 'children': children} for node, children in roots]
+
+def is_schema_root(workspace, node_id):
+    """Whether a node is a root of the schema, without building the whole graph of a lazy workspace."""
+    if workspace.subtrees is not None:
+        return is_root_event(workspace.schema_json, workspace.json_index, node_id)
+    return node_id in workspace.edge_index['roots']
+
+def is_container_event(event):
+    """Whether an event is an outlinks container, which is collapsed if it is referenced before it is defined."""
+    return 'children' in event and 'outlinks' in str(event.get('name', '')).lower()
+
+def include_items(schema_json, json_index, refs, positions, complete):
+    """Collects the events that define or reference ids.
+
+    Containers referencing an id are followed too, as their own references
+    decide which edges reach the id once they are collapsed.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json
+    refs (iterable): ids to include
+    positions (set): positions of events, added to
+    complete (set): ids whose defining and referencing events are all included, added to
+
+    """
+    events = schema_json['events']
+    events_index = json_index['events']
+    stack = list(refs)
+    while stack:
+        ref = stack.pop()
+        if ref in complete:
+            continue
+        complete.add(ref)
+        positions.update(events_index.get(ref, []))
+        for s, _ in json_index['children'].get(ref, []):
+            positions.add(s)
+            if is_container_event(events[s]):
+                stack.append(events[s]['@id'])
+        for s, c, _ in json_index['outlinks'].get(ref, []):
+            positions.add(s)
+            source = events[s]['children'][c]['child']
+            if any(is_container_event(events[t]) for t in events_index.get(source, [])):
+                stack.append(source)
+
+def build_partial_graph(schema_json, json_index, event_positions, entity_ids=(), relation_positions=(),
+                        complete=()):
+    """Builds the graph of part of a schema.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json
+    event_positions (iterable): positions of the events to add
+    entity_ids (iterable): ids of the entities to add
+    relation_positions (iterable): positions of the relations to add
+    complete (set): ids whose defining and referencing events are all added, see include_items
+
+    Returns:
+    nodes (dict): nodes built
+    edge_index (dict): adjacency index over their edges
+    """
+    builder = GraphBuilder()
+    for e in sorted(e for entity_id in entity_ids for e in json_index['entities'].get(entity_id, [])):
+        builder.add_entity(schema_json['entities'][e])
+    for r in sorted(relation_positions):
+        builder.add_relation(schema_json['relations'][r])
+    for s in sorted(event_positions):
+        builder.add_event(schema_json['events'][s])
+    nodes, _, edge_index = builder.finish(complete)
+    return nodes, edge_index
+
+def is_root_event(schema_json, json_index, node_id):
+    """Tells whether a node is a root of the full graph without building it.
+
+    A root is an event with children or participants that does not repeat
+    and is not anyone's child or outlink, unless only containers point to it
+    and collapsing them leaves it without a parent.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json
+    node_id (str): node id
+
+    Returns:
+    bool: whether the node is a root
+    """
+    events = schema_json['events']
+    definitions = [events[s] for s in json_index['events'].get(node_id, [])]
+    if not definitions or any(event.get('privateData', {}).get('repeatable') for event in definitions):
+        return False
+    if node_id not in json_index['children'] and node_id not in json_index['outlinks']:
+        return any(event.get('children') or event.get('participants') for event in definitions)
+
+    positions = set()
+    complete = set()
+    include_items(schema_json, json_index, [node_id], positions, complete)
+    if len(complete) == 1:
+        return False
+    nodes, _ = build_partial_graph(schema_json, json_index, positions, complete={node_id})
+    return node_id in nodes and nodes[node_id].type == 'root'
+
+def subtree_items(schema_json, json_index, node_id):
+    """Finds the schema items that define the subtree of a node.
+
+    Those are the events defining or referencing the node, the nodes it has
+    edges to and the nodes those have edges to, with the children of
+    containers counted in place of the containers, and the entities and
+    relations around them.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json
+    node_id (str): id of the topmost node
+
+    Returns:
+    items (dict): positions of the needed events and relations, ids of the needed entities,
+                  and the ids whose nodes are complete, see include_items
+    """
+    events = schema_json['events']
+    events_index = json_index['events']
+    relations = schema_json['relations']
+    positions = set()
+    complete = set()
+    entity_ids = set()
+
+    def targets(refs):
+        found = []
+        for ref in refs:
+            for s in events_index.get(ref, []):
+                for child in events[s].get('children', []):
+                    found.append(child['child'])
+                for participant in events[s].get('participants', []):
+                    entity_ids.add(participant['entity'])
+            for s, c in json_index['children'].get(ref, []):
+                found.extend(events[s]['children'][c].get('outlinks', []))
+            for r in json_index['relationSubject'].get(ref, []):
+                entity_ids.add(relations[r]['relationObject'])
+                found.append(relations[r]['relationObject'])
+        # containers are collapsed into edges to their children
+        expanded = set()
+        while found:
+            ref = found.pop()
+            if ref not in expanded:
+                expanded.add(ref)
+                if ref in json_index['children'] and any(is_container_event(events[s])
+                                                         for s in events_index.get(ref, [])):
+                    found.extend(child['child'] for s in events_index[ref] for child in events[s]['children'])
+        return expanded
+
+    # gates are built with the event they belong to
+    if node_id not in events_index and node_id.endswith('xor') and node_id[:-3] in events_index:
+        node_id = node_id[:-3]
+    include_items(schema_json, json_index, [node_id], positions, complete)
+    level = {node_id}
+    for _ in range(2):
+        level = targets(level)
+        include_items(schema_json, json_index, level, positions, complete)
+
+    entity_ids.add(node_id)
+    for s in positions:
+        for participant in events[s].get('participants', []):
+            entity_ids.add(participant['entity'])
+    relation_positions = set()
+    for entity_id in entity_ids:
+        relation_positions.update(json_index['relationSubject'].get(entity_id, []))
+    return {
+        'entities': entity_ids,
+        'relations': relation_positions,
+        'events': positions,
+        'complete': complete
+    }
+
+def get_lazy_subtree(workspace, selected_node):
+    """Builds the graph around a node from the JSON index the first time it is asked for, then reuses it.
+
+    Only the items that define the subtree are parsed, and the subtree
+    collected from them is the same as from the full graph.
+
+    Parameters:
+    workspace (Workspace): workspace without a full graph, see load_workspace
+    selected_node (str): id of the topmost node, or root
+
+    Returns:
+    nodes (dict): nodes of the subtree and around it
+    edge_index (dict): adjacency index over their edges
+    root_node (Node): topmost node
+
+    Raises:
+    SchemaError: if the first root is asked for and the schema has none
+    """
+    if selected_node in workspace.subtrees:
+        return workspace.subtrees[selected_node]
+    schema_json = workspace.schema_json
+    json_index = workspace.json_index
+    if selected_node == 'root':
+        node_id = next((event['@id'] for event in schema_json['events']
+                        if is_root_event(schema_json, json_index, event['@id'])), None)
+        if node_id is None:
+            raise no_root_error(workspace)
+    else:
+        node_id = selected_node
+
+    items = subtree_items(schema_json, json_index, node_id)
+    nodes, edge_index = build_partial_graph(schema_json, json_index, items['events'], items['entities'],
+                                            items['relations'], items['complete'])
+
+    workspace.subtrees[selected_node] = nodes, edge_index, nodes[node_id]
+    return workspace.subtrees[selected_node]
+
+def get_lazy_entity_graph(workspace, entity_id):
+    """Builds the graph around an entity from the JSON index the first time it is asked for, then reuses it.
+
+    Parameters:
+    workspace (Workspace): workspace without a full graph, see load_workspace
+    entity_id (str): entity @id
+
+    Returns:
+    nodes (dict): nodes of the entity, its events and related entities
+    edge_index (dict): adjacency index over their edges
+    """
+    key = ('entity', entity_id)
+    if key in workspace.subtrees:
+        return workspace.subtrees[key]
+    schema_json = workspace.schema_json
+    json_index = workspace.json_index
+    events = schema_json['events']
+    relations = json_index['relationSubject'].get(entity_id, []) + json_index['relationObject'].get(entity_id, [])
+    entity_ids = {entity_id}
+    for r in relations:
+        entity_ids.add(schema_json['relations'][r]['relationSubject'])
+        entity_ids.add(schema_json['relations'][r]['relationObject'])
+    event_positions = set()
+    complete = set()
+    # events with their parents, which hold their child values
+    include_items(schema_json, json_index, [events[s]['@id'] for s, _ in json_index['participants'].get(entity_id, [])],
+                  event_positions, complete)
+    for s in event_positions:
+        entity_ids.update(participant['entity'] for participant in events[s].get('participants', []))
+
+    workspace.subtrees[key] = build_partial_graph(schema_json, json_index, event_positions, entity_ids,
+                                                  set(relations), complete)
+    return workspace.subtrees[key]
+
+@metrics.timed('entity', lambda result, *args: graph_counts(result))
+def get_entity_view(workspace, entity_id):
+    """Constructs the entity-first view of an entity: the events it takes part in, clustered by role,
+    and the entities it is related to. The parents of those events are not included.
+
+    Participant and relation edges are looked up by entity in the adjacency
+    index, so the view costs as much as it has elements.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    entity_id (str): entity @id
+
+    Returns:
+    dict: list of nodes, list of edges, and event ids by role
+    """
+    if workspace.subtrees is not None:
+        nodes, edge_index = get_lazy_entity_graph(workspace, entity_id)
+    else:
+        nodes, edge_index = workspace.nodes, workspace.edge_index
+    n = [nodes[entity_id]]
+    e = []
+    id_set = {entity_id}
+    roles = {}
+
+    # events, by role
+    for edge in edge_index['target'].get(entity_id, {}).get('step_participant', []):
+        e.append(edge)
+        roles.setdefault(edge.name, []).append(edge.source)
+        if edge.source not in id_set:
+            id_set.add(edge.source)
+            n.append(nodes[edge.source])
+
+    # relation neighbors
+    for side, other in (('source', 'target'), ('target', 'source')):
+        for edge in edge_index[side].get(entity_id, {}).get('relation', []):
+            e.append(edge)
+            neighbor = getattr(edge, other)
+            if neighbor not in id_set and neighbor in nodes:
+                id_set.add(neighbor)
+                n.append(nodes[neighbor])
+
+    return {'nodes': n, 'edges': e, 'roles': roles}
+
+def list_entities(workspace):
+    """Lists the entities of a schema with the number of events and relations each takes part in.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+
+    Returns:
+    list: {'@id', 'name', 'events', 'relations'} per entity, in schema order
+    """
+    json_index = workspace.json_index
+    entities = []
+    for entity in workspace.schema_json['entities']:
+        entity_id = entity['@id']
+        entities.append({
+            '@id': entity_id,
+            'name': entity.get('name', ''),
+            'events': len({s for s, _ in json_index['participants'].get(entity_id, [])}),
+            'relations': len(json_index['relationSubject'].get(entity_id, [])) +
+                         len(json_index['relationObject'].get(entity_id, []))
+        })
+    return entities
+
+def is_hidden_container(workspace, node_id):
+    """Whether a node is a container that is collapsed out of the graph, judging from the JSON alone."""
+    events = workspace.schema_json['events']
+    return node_id in workspace.json_index['children'] and \
+        any(is_container_event(events[s]) for s in workspace.json_index['events'].get(node_id, []))
+
+def get_search_index(workspace):
+    """Gets the search index of a workspace, indexing its schema if the graph was not built with one.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+
+    Returns:
+    search_index (SearchIndex): text index over the schema
+    """
+    if workspace.search_index is None:
+        search_index = SearchIndex()
+        for entity in workspace.schema_json.get('entities', []):
+            search_index.add_entity(entity)
+        for event in workspace.schema_json.get('events', []):
+            search_index.add_event(event)
+        # containers are not shown, so they are not found either
+        for node_id in list(search_index.texts):
+            if is_hidden_container(workspace, node_id):
+                search_index.remove_node(node_id)
+        workspace.search_index = search_index
+    return workspace.search_index
+
+def ancestor_path(workspace, node_id):
+    """Finds the events above a node, following the first event that lists it as a child.
+
+    Containers are skipped, as they are not shown.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    node_id (str): node id
+
+    Returns:
+    list: ids of the events above the node, from the topmost one down to its parent
+    """
+    events = workspace.schema_json['events']
+    children_index = workspace.json_index['children']
+    path = []
+    seen = {node_id}
+    while node_id in children_index:
+        s, _ = children_index[node_id][0]
+        node_id = events[s]['@id']
+        if node_id in seen:
+            break
+        seen.add(node_id)
+        if not is_container_event(events[s]):
+            path.append(node_id)
+    path.reverse()
+    return path
+
+def search_nodes(workspace, query, limit=50):
+    """Finds the events and entities whose text contains every word of a query.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    query (str): words to look for
+    limit (int): maximum number of results
+
+    Returns:
+    results (list): {'@id', 'name', 'type', 'fields', 'path'} per match, see SearchIndex.search and ancestor_path
+    total (int): number of matches before the limit
+    """
+    search_index = get_search_index(workspace)
+    matches = search_index.search(query)
+    results = []
+    for node_id, fields in matches[:limit]:
+        texts = search_index.texts[node_id]
+        is_entity = node_id in workspace.json_index['entities'] and node_id not in workspace.json_index['events']
+        results.append({
+            '@id': node_id,
+            'name': texts.get('name', texts.get('comment', '')),
+            'type': 'entity' if is_entity else 'event',
+            'fields': fields,
+            'path': [] if is_entity else ancestor_path(workspace, node_id)
+        })
+    return results, len(matches)
+
+def full_graph(workspace):
+    """Gets the whole graph of a workspace, building it first if the workspace is lazy.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+
+    Returns:
+    nodes (dict): nodes in the schema
+    edge_index (dict): adjacency index over edges
+    """
+    if workspace.subtrees is not None:
+        rebuild_graph(workspace)
+        workspace.subtrees = None
+    return workspace.nodes, workspace.edge_index
+
+def graph_response(graph, positions=None):
+    """Converts nodes and edges to Cytoscape elements for a response.
+
+    Parameters:
+    graph (dict): list of nodes and list of edges
+    positions (dict): if given, node positions to add to the node elements, see subtree_layout
+
+    Returns:
+    dict: list of node elements and list of edge elements
+    """
+    nodes = to_cytoscape(graph['nodes'])
+    if positions is not None:
+        for node in nodes:
+            if node['data']['id'] in positions:
+                node['position'] = positions[node['data']['id']]
+    return {'nodes': nodes, 'edges': to_cytoscape(graph['edges'])}
+
+@metrics.timed('layout', lambda result, *args: {'nodes': len(result)})
+def subtree_layout(workspace, selected_node, edge_types=None, include_entities=True):
+    """Lays out the whole subtree of a node, or reuses the layout computed since its last structural change.
+
+    Positions are relative to the topmost node, which is at (0, 0), so that
+    windows of the subtree fit together.
+
+    Parameters:
+    workspace (Workspace): workspace holding the parsed schema
+    selected_node (str): id of the topmost node, or root
+    edge_types (set): types of edges followed, see collect_subtree
+    include_entities (bool): whether participants are included
+
+    Returns:
+    positions (dict): node id to {'x', 'y'}
+    """
+    key = (selected_node, tuple(sorted(edge_types)) if edge_types is not None else None, include_entities)
+    if key not in workspace.layouts:
+        _, graph = get_connected_nodes(workspace, selected_node, edge_types=edge_types,
+                                       include_entities=include_entities)
+        origin = graph['nodes'][0].id if selected_node == 'root' else selected_node
+        node_ids = [origin] + [node.id for node in graph['nodes']]
+        edges = [(edge.source, edge.target) for edge in graph['edges']]
+        workspace.layouts[key] = layered_layout(node_ids, edges, origin)
+    return workspace.layouts[key]
+
+@app.before_request
+def start_timing():
+    metrics.start_request()
+
+@app.after_request
+def add_server_timing(response):
+    timing = metrics.finish_request(request.endpoint, request.method, response.status_code)
+    if timing:
+        response.headers['Server-Timing'] = timing
+    return response
+
+@app.teardown_request
+def stop_profiling(error):
+    metrics.stop_profiler()
 
 @app.route('/')
 def homepage():
     return render_template('index.html')
 
+def read_schema_stream(stream, build_graph=True):
+    """Parses a schema from a binary stream, validating it and building nodes and edges as items are read.
+
+    Items are checked before they are added, and nothing more is added once
+    one is invalid, so a broken schema is read to the end to report all its
+    problems at once.
+
+    Parameters:
+    stream (file): binary stream with the schema JSON
+    build_graph (bool): whether to build the graph, or only index the items
+
+    Returns:
+    schema_json (dict): entire schema in json form
+    graph (tuple): nodes, edges and edge_index, as from get_nodes_and_edges, or None
+    json_index (dict): index over schema_json
+    search_index (SearchIndex): text index over schema_json, or None if the graph was not built
+
+    Raises:
+    SchemaError: if the graph of the schema cannot be built, see SchemaValidator
+    """
+    schema_json = {}
+    json_index = new_json_index()
+    search_index = SearchIndex() if build_graph else None
+    validator = SchemaValidator()
+    check_item = {
+        'entities': validator.add_entity,
+        'relations': validator.add_relation,
+        'events': validator.add_event
+    }
+    if build_graph:
+        builder = GraphBuilder(json_index, search_index)
+        add_item = {
+            'entities': builder.add_entity,
+            'relations': builder.add_relation,
+            'events': builder.add_event
+        }
+    else:
+        add_item = {
+            'entities': lambda item: index_entity(json_index, len(schema_json['entities']) - 1, item),
+            'relations': lambda item: index_relation(json_index, len(schema_json['relations']) - 1, item),
+            'events': lambda item: index_event(json_index, len(schema_json['events']) - 1, item)
+        }
+    valid = True
+    for key, value, is_item in iter_schema(stream):
+        if is_item:
+            schema_json.setdefault(key, []).append(value)
+            valid = check_item[key](value) and valid
+            if valid:
+                add_item[key](value)
+        else:
+            schema_json[key] = value
+    problems = validator.finish(schema_json)
+    if any(problem['severity'] == 'error' for problem in problems):
+        raise SchemaError(problems)
+    return schema_json, builder.finish() if build_graph else None, json_index, search_index
+
+@metrics.timed('read', lambda result, *args: {'events': len(result[0].get('events', []))})
+def read_schema(stream, content_length, lazy=False):
+    """Parses an uploaded schema, streaming it if it is large or of unknown size.
+
+    Parameters:
+    stream (file): binary stream with the schema JSON
+    content_length (int): size of the upload, if known
+    lazy (bool): only index the schema instead of building the graph
+
+    Returns:
+    schema_json (dict): entire schema in json form
+    graph (tuple): nodes, edges and edge_index, or None if not parsed yet
+    json_index (dict): index over schema_json, or None if not built yet
+    search_index (SearchIndex): text index over schema_json, or None if not built yet
+
+    Raises:
+    SchemaError: if the graph of the schema cannot be built, see SchemaValidator
+    ValueError: if the upload is not well-formed JSON
+    """
+    if content_length is None or content_length >= stream_min_bytes:
+        return read_schema_stream(stream, build_graph=not lazy)
+    schema_json = loads(stream.read())
+    check_schema(schema_json)
+    return schema_json, None, None, None
+
+def is_lazy(content_length):
+    """Whether an upload of this size only builds subtrees as they are asked for, see SCI_LAZY_MIN_BYTES."""
+    return lazy_min_bytes > 0 and (content_length is None or content_length >= lazy_min_bytes)
+
+def load_workspace(schema_json, graph=None, json_index=None, search_index=None, lazy=False):
+    """Parses a schema into a new workspace.
+
+    A lazy workspace only indexes the schema; subtrees are built when they
+    are first asked for, and the whole graph once the schema is edited.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    graph (tuple): nodes, edges and edge_index if already built
+    json_index (dict): index over schema_json if already built
+    search_index (SearchIndex): text index over schema_json if already built
+    lazy (bool): whether to leave the graph unbuilt, if it is not built already
+
+    Returns:
+    workspace (Workspace): parsed schema
+    parsed_schema (dict): graph of the root node
+    """
+    if graph is None and lazy:
+        workspace = Workspace(schema_json, None, None, None, json_index or index_json(schema_json), subtrees={})
+        workspace.schema_name, parsed_schema = get_connected_nodes(workspace, 'root')
+        return workspace, graph_response(parsed_schema)
+    if graph is None:
+        json_index = new_json_index()
+        search_index = SearchIndex()
+        graph = get_nodes_and_edges(schema_json, json_index, search_index)
+    elif json_index is None:
+        json_index = index_json(schema_json)
+    nodes, edges, edge_index = graph
+    workspace = Workspace(schema_json, nodes, edges, edge_index, json_index)
+    workspace.search_index = search_index
+    workspace.schema_name, parsed_schema = get_connected_nodes(workspace, 'root')
+    return workspace, graph_response(parsed_schema)
+
+def load_schema(stream, content_length, key=None):
+    """Loads an uploaded schema into a new workspace, reusing the cached parse of identical content.
+
+    Parameters:
+    stream (file): binary stream with the schema JSON
+    content_length (int): size of the upload, if known
+    key (str): hash of the content if the stream was already spooled, see spool
+
+    Returns:
+    workspace (Workspace): parsed schema
+    parsed_schema (dict): graph of the root node
+    """
+    lazy = is_lazy(content_length)
+    if graph_cache is None:
+        return load_workspace(*read_schema(stream, content_length, lazy), lazy=lazy)
+
+    if key is None:
+        key, size, spooled = spool(stream, stream_min_bytes)
+        with spooled:
+            return load_schema(spooled, size, key)
+
+    cached = graph_cache.get(key)
+    if cached is not None:
+        schema_json, json_index, nodes, edges, edge_index, search_index = cached
+        graph = (nodes, edges, edge_index) if nodes is not None else None
+        workspace, parsed_schema = load_workspace(schema_json, graph, json_index, search_index, lazy=True)
+        workspace.shared = True
+    else:
+        workspace, parsed_schema = load_workspace(*read_schema(stream, content_length, lazy), lazy=lazy)
+        # the cache keeps a copy, so this workspace is edited without copying its own graph first
+        graph_cache.put(key, (workspace.schema_json, workspace.json_index, workspace.nodes,
+                              workspace.edges, workspace.edge_index, workspace.search_index), content_length)
+    return workspace, parsed_schema
+
+@metrics.timed('detach')
+def detach_workspace(workspace):
+    """Gives a workspace its own copy of the schema and the whole graph before it is edited.
+
+    Workspaces loaded through the cache share them, and lazy workspaces have
+    not built the whole graph yet.
+
+    Parameters:
+    workspace (Workspace): workspace about to be edited
+    """
+    if not workspace.shared and workspace.subtrees is None:
+        return
+    if workspace.shared:
+        workspace.schema_json = loads(dumps(workspace.schema_json))
+    rebuild_graph(workspace, reindex=True)
+    workspace.shared = False
+    workspace.subtrees = None
+
+def loaded_response(workspace, parsed_schema, workspace_id, with_schema):
+    """Makes the response to an upload or reload.
+
+    Parameters:
+    workspace (Workspace): loaded schema
+    parsed_schema (dict): graph of the root node
+    workspace_id (str): id the workspace is stored under
+    with_schema (bool): whether to echo the schema JSON back, see include_schema
+
+    Returns:
+    dict: response
+    """
+    response = {
+        'parsedSchema': parsed_schema,
+        'name': workspace.schema_name,
+        'workspace': workspace_id
+    }
+    if with_schema:
+        response['schemaJson'] = workspace.schema_json
+    return response
+
+def is_async():
+    """Whether the client asked for the upload to be parsed in the background, i.e. ?async=true was sent."""
+    return request.args.get('async', 'false').lower() != 'false'
+
+def start_upload(stream, workspace_id=None):
+    """Parses an upload in the background, answering with the job to poll at /jobs.
+
+    The upload is copied out of the request first, so the request ends
+    before parsing starts.
+
+    Parameters:
+    stream (file): binary stream with the schema JSON
+    workspace_id (str): id to store the workspace under, a new one is created if empty
+
+    Returns:
+    Response: the queued job, or an error if too many uploads are pending
+    """
+    key, size, spooled = spool(stream, stream_min_bytes)
+    with_schema = include_schema()
+
+    def run(job):
+        with spooled:
+            workspace, parsed_schema = load_schema(ProgressReader(spooled, job), size, key)
+        return loaded_response(workspace, parsed_schema, workspaces.put(workspace, workspace_id), with_schema)
+
+    job = upload_jobs.submit(run, size)
+    if job is None:
+        spooled.close()
+        return 'Too many uploads in progress, try again later.', 503
+    return json_response(job.state(), status=202)
+
+def invalid_schema_response(error):
+    """Makes the response to a schema whose graph cannot be built, listing every problem found in it."""
+    return json_response({'error': str(error), 'problems': error.problems}, status=400)
+
 @app.route('/upload', methods=['POST'])
 def upload():
     """Uploads JSON and processes it for graph view."""
     file = request.files['file']
-    schema_string = file.read().decode("utf-8")
-    global schema_json
-    global nodes
-    global edges
-    global schema_name
-    schema_json = json.loads(schema_string)
-    nodes, edges = get_nodes_and_edges(schema_json)
-    schema_name, parsed_schema = get_connected_nodes('root')
-    return json.dumps({
-        'parsedSchema': parsed_schema,
-        'name': schema_name,
-        'schemaJson': schema_json
-    })
+    if is_async():
+        return start_upload(file.stream)
+    try:
+        workspace, parsed_schema = load_schema(file.stream, request.content_length)
+    except SchemaError as e:
+        return invalid_schema_response(e)
+    except ValueError as e:
+        return f'Invalid JSON: {e}.', 400
+    return json_response(loaded_response(workspace, parsed_schema, workspaces.put(workspace), include_schema()))
+
+def read_window(args):
+    """Reads the node and window asked for by GET /node, from its parameters or from a cursor.
+
+    Parameters:
+    args (dict): ID and optionally offset, limit, edgeTypes (comma-separated),
+    includeEntities (true or false) and layout (true or false), or a cursor returned
+    with the previous window
+
+    Returns:
+    node_id (str): id of the topmost node
+    window (dict): window arguments for get_connected_nodes, empty if none were given
+    layout (bool): whether node positions were asked for
+    """
+    if args.get('cursor'):
+        page = loads(base64.urlsafe_b64decode(args['cursor'].encode('ascii')))
+    else:
+        page = {'ID': args.get('ID')}
+        if 'offset' in args:
+            page['offset'] = int(args['offset'])
+        if 'limit' in args:
+            page['limit'] = int(args['limit'])
+        if args.get('edgeTypes'):
+            page['edgeTypes'] = args['edgeTypes'].split(',')
+        if 'includeEntities' in args:
+            page['includeEntities'] = args['includeEntities'].lower() != 'false'
+        if args.get('layout', 'false').lower() != 'false':
+            page['layout'] = True
+    window = {}
+    if 'offset' in page:
+        window['offset'] = max(0, int(page['offset']))
+    if 'limit' in page:
+        window['limit'] = max(1, int(page['limit']))
+    if 'edgeTypes' in page:
+        window['edge_types'] = set(page['edgeTypes'])
+    if 'includeEntities' in page:
+        window['include_entities'] = bool(page['includeEntities'])
+    return page['ID'], window, bool(page.get('layout'))
+
+def next_cursor(node_id, window, total, layout=False):
+    """Makes the cursor of the window after this one, or None if this is the last one.
+
+    Parameters:
+    node_id (str): id of the topmost node
+    window (dict): window arguments, see read_window
+    total (int): number of nodes pointed to
+    layout (bool): whether node positions were asked for
+
+    Returns:
+    str: opaque cursor for GET /node
+    """
+    offset = window.get('offset', 0) + window.get('limit', total)
+    if offset >= total:
+        return None
+    page = {'ID': node_id, 'offset': offset, 'limit': window['limit']}
+    if 'edge_types' in window:
+        page['edgeTypes'] = sorted(window['edge_types'])
+    if 'include_entities' in window:
+        page['includeEntities'] = window['include_entities']
+    if layout:
+        page['layout'] = True
+    return base64.urlsafe_b64encode(dumps(page)).decode('ascii')
 
 @app.route('/node', methods=['GET', 'POST'])
 def get_subtree_or_update_node():
-    if not (bool(nodes) and bool(edges)):
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
         return 'Parsing error! Upload the file again.', 400
 
     if request.method == 'GET':        
-        """Gets subtree of the selected node."""
-        node_id = request.args.get('ID')
-        _, subtree = get_connected_nodes(node_id)
-        return json.dumps(subtree)
+        """Gets subtree of the selected node, or a window of it."""
+        try:
+            node_id, window, layout = read_window(request.args)
+        except (ValueError, TypeError, KeyError, binascii.Error):
+            return 'Invalid window parameters.', 400
+        with workspace.lock:
+            try:
+                _, subtree = get_connected_nodes(workspace, node_id, **window)
+            except SchemaError as e:
+                return invalid_schema_response(e)
+            positions = None
+            if layout:
+                positions = subtree_layout(workspace, node_id, window.get('edge_types'),
+                                           window.get('include_entities', True))
+            response = graph_response(subtree, positions)
+            if window:
+                response['total'] = subtree['total']
+                response['nextCursor'] = next_cursor(node_id, window, subtree['total'], layout)
+            return json_response(response)
     else:
-        """Posts updates to selected node and reloads schema."""
+        """Posts updates to selected node and returns the whole schema, see patch_node for only what changed."""
         values = json.loads(request.data.decode("utf-8"))
-        new_json = update_json(values)
-        return json.dumps(new_json)
+        try:
+            check_update(values)
+        except ValueError as e:
+            return f'Invalid change: {e}.', 400
+        changes = []
+        undo = []
+        with workspace.lock:
+            detach_workspace(workspace)
+            new_json = update_json(workspace, values, changes, undo)
+            try:
+                diff = patch_graph(workspace, values, changes, undo)
+            except ValueError as e:
+                return f'Invalid change: {e}.', 400
+            if diff['reload'] or diff['removed'] or diff['edges']:
+                workspace.layouts.clear()
+            if diff['reload']:
+                workspace.schema_name, _ = get_connected_nodes(workspace, 'root')
+            workspaces.changed(request.args['workspace'], workspace)
+            return json_response(new_json)
+
+def patch_response(workspace, changes, diff):
+    """Makes the response to a PATCH, with the graph of the root node if the whole graph was reloaded.
+
+    Parameters:
+    workspace (Workspace): patched workspace
+    changes (list): changed JSON fields
+    diff (dict): graph diff, see patch_graph
+
+    Returns:
+    dict: response
+    """
+    # layouts only depend on which nodes and edges there are
+    if diff['reload'] or diff['removed'] or diff['edges']:
+        workspace.layouts.clear()
+    diff.update(graph_response(diff))
+    response = {
+        'json': changes,
+        'graph': diff,
+        'name': workspace.schema_name
+    }
+    if diff['reload']:
+        workspace.schema_name, parsed_schema = get_connected_nodes(workspace, 'root')
+        response['parsedSchema'] = graph_response(parsed_schema)
+        response['name'] = workspace.schema_name
+    return response
+
+@app.route('/node', methods=['PATCH'])
+def patch_node():
+    """Applies one field change to the JSON and the parsed graph, returning only what changed."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    values = json.loads(request.data.decode("utf-8"))
+    try:
+        check_update(values)
+    except ValueError as e:
+        return f'Invalid change: {e}.', 400
+    changes = []
+    undo = []
+    with workspace.lock:
+        detach_workspace(workspace)
+        update_json(workspace, values, changes, undo)
+        try:
+            diff = patch_graph(workspace, values, changes, undo)
+        except ValueError as e:
+            return f'Invalid change: {e}.', 400
+        response = patch_response(workspace, changes, diff)
+        workspaces.changed(request.args['workspace'], workspace)
+        return json_response(response)
+
+@app.route('/nodes', methods=['PATCH'])
+def patch_nodes():
+    """Applies a list of field changes to the JSON and the parsed graph at once, returning what changed."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    operations = json.loads(request.data.decode("utf-8"))
+    if isinstance(operations, dict):
+        operations = operations.get('operations')
+    if not isinstance(operations, list):
+        return 'Invalid changes: expected a list of {id, key, value}.', 400
+    with workspace.lock:
+        detach_workspace(workspace)
+        try:
+            changes, diff = update_batch(workspace, operations)
+        except ValueError as e:
+            return f'Invalid changes: {e}.', 400
+        response = patch_response(workspace, changes, diff)
+        workspaces.changed(request.args['workspace'], workspace)
+        return json_response(response)
 
 @app.route('/reload', methods=['POST'])
 def reload_schema():
-    """Reloads schema; does the same thing as upload."""
-    schema_string = request.data.decode("utf-8")
-    global schema_json
-    global nodes
-    global edges
-    global schema_name
-    schema_json = json.loads(schema_string)
-    nodes, edges = get_nodes_and_edges(schema_json)
-    schema_name, parsed_schema = get_connected_nodes('root')
-    return json.dumps({
-        'parsedSchema': parsed_schema,
-        'name': schema_name,
-        'schemaJson': schema_json
-    })
\ No newline at end of file
+    """Reloads schema into the given workspace; does the same thing as upload."""
+    if is_async():
+        return start_upload(request.stream, request.args.get('workspace'))
+    try:
+        workspace, parsed_schema = load_schema(request.stream, request.content_length)
+    except SchemaError as e:
+        return invalid_schema_response(e)
+    except ValueError as e:
+        return f'Invalid JSON: {e}.', 400
+    workspace_id = workspaces.put(workspace, request.args.get('workspace'))
+    return json_response(loaded_response(workspace, parsed_schema, workspace_id, include_schema()))
+
+@app.route('/entities', methods=['GET'])
+def get_entities_overview():
+    """Lists the entities of a schema, or gets the entity-first view of one with ?ID=."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    entity_id = request.args.get('ID')
+    with workspace.lock:
+        if not entity_id:
+            return json_response({'entities': list_entities(workspace)})
+        if entity_id not in workspace.json_index['entities']:
+            return 'Unknown entity.', 404
+        view = get_entity_view(workspace, entity_id)
+        response = graph_response(view)
+        response['roles'] = view['roles']
+        return json_response(response)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Gets the progress of a background upload, with its result once done."""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return 'Unknown upload job.', 404
+    return json_response(job.state())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def get_job_events(job_id):
+    """Streams the progress of a background upload as server-sent events, ending with its result."""
+    job = upload_jobs.get(job_id)
+    if job is None:
+        return 'Unknown upload job.', 404
+
+    def events():
+        version = None
+        while True:
+            new_version = job.wait(version, timeout=15)
+            if new_version == version:
+                yield ': keep-alive\n\n'
+                continue
+            version = new_version
+            state = job.state()
+            yield f"event: {state['status']}\ndata: {dumps(state).decode('utf-8')}\n\n"
+            if state['status'] in ('done', 'failed'):
+                return
+            # progress is sent at most ten times a second
+            time.sleep(0.1)
+
+    return Response(events(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache'})
+
+@app.route('/roots', methods=['GET'])
+def get_roots():
+    """Lists the roots of a schema, or gets the graph of one with ?ID=, as upload does for the first one."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    root_id = request.args.get('ID')
+    with workspace.lock:
+        if not root_id:
+            return json_response({'roots': list_roots(workspace)})
+        if not is_schema_root(workspace, root_id):
+            return 'Unknown root.', 404
+        name, graph = get_connected_nodes(workspace, root_id, as_root=True)
+        return json_response({'parsedSchema': graph_response(graph), 'name': name})
+
+@app.route('/search', methods=['GET'])
+def search():
+    """Finds events and entities by the words of their name, description, comments, qnode, qlabel or explanation."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    if workspace is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    try:
+        limit = max(1, int(request.args.get('limit', 50)))
+    except ValueError:
+        return 'Invalid limit.', 400
+    with workspace.lock:
+        results, total = search_nodes(workspace, request.args.get('q', ''), limit)
+        return json_response({'results': results, 'total': total})
+
+@app.route('/diff', methods=['GET'])
+def diff():
+    """Compares the schema of a workspace with the one of the workspace given as ?base=, or the subtree of ?ID= only."""
+    workspace = workspaces.get(request.args.get('workspace', ''))
+    base = workspaces.get(request.args.get('base', ''))
+    if workspace is None or base is None:
+        return 'Parsing error! Upload the file again.', 400
+
+    node_id = request.args.get('ID')
+    # locks are always taken in the same order, so two diffs of the same workspaces cannot wait on each other
+    first, second = sorted((base, workspace), key=id)
+    with first.lock, second.lock:
+        old, new = full_graph(base), full_graph(workspace)
+        if node_id and node_id not in old[0] and node_id not in new[0]:
+            return 'Unknown node.', 404
+        return json_response(diff_graphs(old, new, node_id or None))
+
+@app.route('/validate', methods=['GET', 'POST'])
+def validate():
+    """Checks the structure of the schema of a workspace, or of the JSON posted, without loading it.
+
+    Lists broken references, duplicate ids, events with children but no
+    children_gate and cycles of children and outlinks, see SchemaValidator.
+    """
+    if request.method == 'POST':
+        file = request.files.get('file')
+        try:
+            schema_json = loads((file.stream if file else request.stream).read())
+        except ValueError as e:
+            return f'Invalid JSON: {e}.', 400
+        problems = validate_schema(schema_json)
+    else:
+        workspace = workspaces.get(request.args.get('workspace', ''))
+        if workspace is None:
+            return 'Parsing error! Upload the file again.', 400
+        with workspace.lock:
+            problems = validate_schema(workspace.schema_json)
+    return json_response({
+        'valid': not any(problem['severity'] == 'error' for problem in problems),
+        'problems': problems
+    })
+
+@app.route('/cache', methods=['GET'])
+def cache_stats():
+    """Gets hit and miss counters of the parsed schema cache."""
+    return json_response(graph_cache.stats() if graph_cache else {})
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Gets request, stage and cache totals in the Prometheus text format, if SCI_METRICS is set."""
+    if not metrics.enabled:
+        return 'Metrics are disabled.', 404
+    gauges = {'sci_workspaces': len(workspaces)}
+    if graph_cache:
+        for key, value in graph_cache.stats().items():
+            gauges['sci_cache_' + re.sub(r'(?<!^)(?=[A-Z])', '_', key).lower()] = value
+    return metrics.registry.render(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
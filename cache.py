@@ -0,0 +1,157 @@
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+from collections import OrderedDict
+
+from sdf import paused_gc
+
+# ===============================================
+# cache.py
+# ------------
+# parsed schemas cached by the hash of their content
+# ===============================================
+
+def spool(stream, max_memory, chunk_size=1 << 16):
+    """Copies a stream into a seekable file while hashing it.
+
+    Parameters:
+    stream (file): binary stream to copy
+    max_memory (int): bytes kept in memory before the copy moves to disk
+    chunk_size (int): bytes read at a time
+
+    Returns:
+    key (str): sha256 hex digest of the content
+    size (int): size of the content in bytes
+    file (file): copy of the content, positioned at the start
+    """
+    digest = hashlib.sha256()
+    size = 0
+    spooled = tempfile.SpooledTemporaryFile(max_size=max_memory)
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        digest.update(chunk)
+        spooled.write(chunk)
+        size += len(chunk)
+    spooled.seek(0)
+    return digest.hexdigest(), size, spooled
+
+# bumped when the cached structures change, so entries persisted by older versions are not read
+format_version = 3
+
+class GraphCache:
+    """Thread-safe LRU of parsed schemas keyed by content hash, optionally persisted to disk.
+
+    Entries are shared by every workspace loaded from them, so they must
+    not be changed; those workspaces copy them before editing. The workspace
+    whose parse filled an entry keeps its own objects, see put.
+
+    Parameters:
+    max_bytes (int): memory budget, counted as the size of the source documents
+    directory (str): directory to persist entries to, or None to keep them in memory only
+    """
+
+    def __init__(self, max_bytes, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.v{format_version}.pickle')
+
+    def _store(self, key, value, size):
+        """Adds an entry to memory, evicting the least recently used ones over budget."""
+        if size > self.max_bytes:
+            return
+        if key in self._items:
+            self.size -= self._items.pop(key)[1]
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, (_, evicted_size) = self._items.popitem(last=False)
+            self.size -= evicted_size
+
+    def get(self, key):
+        """Gets a cached entry, from memory or else from disk.
+
+        Parameters:
+        key (str): content hash
+
+        Returns:
+        value: cached entry, or None on a miss
+        """
+        data = None
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                self.hits += 1
+                data = self._items[key][0]
+                if not isinstance(data, bytes):
+                    return data
+        if data is not None:
+            # entries are decoded the first time they are asked for, see put
+            with paused_gc():
+                _, value = pickle.loads(data)
+            with self._lock:
+                if key in self._items and self._items[key][0] is data:
+                    self._items[key] = (value, self._items[key][1])
+            return value
+        if self.directory and os.path.exists(self._path(key)):
+            try:
+                with paused_gc(), open(self._path(key), 'rb') as f:
+                    size, value = pickle.load(f)
+            except (OSError, EOFError, pickle.UnpicklingError):
+                value = None
+            if value is not None:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._store(key, value, size)
+                return value
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, size):
+        """Caches an entry and persists it if a directory is set.
+
+        The entry is pickled at once and only decoded when it is first asked
+        for, so the caller keeps the objects it passed and may change them.
+
+        Parameters:
+        key (str): content hash
+        value: entry to cache
+        size (int): size of the source document in bytes
+        """
+        if size > self.max_bytes and not self.directory:
+            return
+        with paused_gc():
+            data = pickle.dumps((size, value), protocol=pickle.HIGHEST_PROTOCOL)
+        with self._lock:
+            self._store(key, data, size)
+        if self.directory:
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+
+    def stats(self):
+        """Returns hit and miss counters and memory use."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'diskHits': self.disk_hits,
+                'misses': self.misses,
+                'entries': len(self._items),
+                'bytes': self.size,
+                'maxBytes': self.max_bytes
+            }
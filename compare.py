@@ -0,0 +1,253 @@
+import hashlib
+import json
+
+from metrics import timed
+
+# ===============================================
+# compare.py
+# ------------
+# differences between two parsed graphs of a
+# schema, e.g. a TA1 submission and its curated
+# version
+# ===============================================
+
+# edge values compared once edges are matched by type and target
+edge_fields = ('name', 'ref', 'predicate')
+
+def node_digest(node):
+    """Hashes the id and values of a node, without its edges."""
+    content = json.dumps([node.id, node.type, node.label, node.shape, node.classes, node.fields],
+                         sort_keys=True, default=str)
+    return hashlib.blake2b(content.encode('utf-8'), digest_size=16).digest()
+
+def out_edges(edge_index, node_id):
+    """Lists the edges leaving a node, of every type."""
+    return [edge for edge_list in edge_index['source'].get(node_id, {}).values() for edge in edge_list]
+
+def subtree_digests(nodes, edge_index):
+    """Hashes every node along with everything reachable from it, bottom up, with an iterative depth-first search.
+
+    An edge back to a node whose hash is still being computed only adds the
+    values of that node, so cycles end. Edges are hashed in sorted order, so
+    the order children are listed in does not matter.
+
+    Parameters:
+    nodes (dict): nodes in the schema
+    edge_index (dict): adjacency index over edges
+
+    Returns:
+    own (dict): node id to hash of the node alone, see node_digest
+    subtree (dict): node id to hash of the node and its descendants
+    starts (list): nodes the searches started from, which reach every node; nodes no edge enters are among them
+    """
+    own = {node_id: node_digest(node) for node_id, node in nodes.items()}
+    subtree = {}
+    starts = []
+    for start in nodes:
+        if start in subtree:
+            continue
+        starts.append(start)
+        # nodes on the stack are in subtree with a value of None
+        subtree[start] = None
+        stack = [(start, iter(out_edges(edge_index, start)))]
+        while stack:
+            node_id, edges = stack[-1]
+            for edge in edges:
+                if edge.target not in subtree:
+                    subtree[edge.target] = None
+                    stack.append((edge.target, iter(out_edges(edge_index, edge.target))))
+                    break
+            else:
+                stack.pop()
+                parts = sorted(repr((edge.type, edge.name, edge.ref, edge.predicate, edge.target)).encode('utf-8') +
+                               (subtree[edge.target] or own[edge.target])
+                               for edge in out_edges(edge_index, node_id))
+                h = hashlib.blake2b(own[node_id], digest_size=16)
+                for part in parts:
+                    h.update(part)
+                subtree[node_id] = h.digest()
+    return own, subtree, starts
+
+def align_nodes(old_nodes, new_nodes):
+    """Matches the nodes of two graphs by id, then the remaining ones by name.
+
+    A node is only matched by name if no other unmatched node of its side,
+    entity or event, has the same name.
+
+    Parameters:
+    old_nodes (dict): nodes of the old graph
+    new_nodes (dict): nodes of the new graph
+
+    Returns:
+    dict: old node id to new node id, for the matched nodes
+    """
+    aligned = {node_id: node_id for node_id in old_nodes if node_id in new_nodes}
+    if len(aligned) == len(old_nodes) or len(aligned) == len(new_nodes):
+        return aligned
+
+    def by_name(nodes):
+        names = {}
+        for node_id, node in nodes.items():
+            if node_id not in aligned:
+                names.setdefault((node.type == 'entity', node.label), []).append(node_id)
+        return names
+
+    old_names = by_name(old_nodes)
+    for key, node_ids in by_name(new_nodes).items():
+        if len(node_ids) == 1 and len(old_names.get(key, [])) == 1:
+            aligned[old_names[key][0]] = node_ids[0]
+    return aligned
+
+def changed_values(old, new, keys):
+    """Compares the values of two dicts.
+
+    Parameters:
+    old (dict): old values
+    new (dict): new values
+    keys (iterable): keys compared
+
+    Returns:
+    dict: {key: {'old': value, 'new': value}} of the keys whose value changed, without 'old' or 'new' when missing
+    """
+    changes = {}
+    for key in keys:
+        if old.get(key) != new.get(key) or (key in old) != (key in new):
+            change = {}
+            if key in old:
+                change['old'] = old[key]
+            if key in new:
+                change['new'] = new[key]
+            changes[key] = change
+    return changes
+
+def node_values(node):
+    """Values of a node compared by diff_graphs, its type and the fields taken from the schema."""
+    values = dict(node.fields)
+    values['_type'] = node.type
+    return values
+
+def edge_summary(edge):
+    """Describes an edge in a diff."""
+    summary = {'source': edge.source, 'target': edge.target, 'type': edge.type, 'name': edge.name}
+    if edge.ref is not None:
+        summary['@id'] = edge.ref
+    return summary
+
+def node_summary(node):
+    """Describes a node in a diff."""
+    return {'@id': node.id, 'name': node.label, 'type': node.type}
+
+@timed('diff', lambda result, *args, **kwargs: {'compared': result['compared'], 'skipped': result['skipped']})
+def diff_graphs(old, new, node_id=None):
+    """Finds the nodes and edges added, removed or modified between two graphs of a schema.
+
+    Nodes are matched by id, falling back on their name, see align_nodes.
+    Matched nodes are walked down from the top of both graphs; a pair of
+    nodes whose subtrees hash the same is skipped along with everything
+    below it, so unchanged parts cost one comparison and the whole diff
+    takes time linear in the size of the graphs.
+
+    Edges leaving matched nodes are matched by type and target, and their
+    name, @id and predicate compared.
+
+    Parameters:
+    old (tuple): nodes and edge_index of the old graph
+    new (tuple): nodes and edge_index of the new graph
+    node_id (str): if given, only the subtree of this node is compared; an id of either graph
+
+    Returns:
+    dict: {'nodes': {'added', 'removed', 'modified'}, 'edges': {'added', 'removed', 'modified'},
+           'identical', 'compared', 'skipped'}; modified nodes have their new '@id', the old one
+           under 'was' if it changed, and 'changes' by field, see changed_values
+    """
+    old_nodes, old_index = old
+    new_nodes, new_index = new
+    old_own, old_subtree, old_starts = subtree_digests(old_nodes, old_index)
+    new_own, new_subtree, new_starts = subtree_digests(new_nodes, new_index)
+    aligned = align_nodes(old_nodes, new_nodes)
+    reverse = {new_id: old_id for old_id, new_id in aligned.items()}
+
+    nodes = {'added': [], 'removed': [], 'modified': []}
+    edges = {'added': [], 'removed': [], 'modified': []}
+    compared = skipped = 0
+    # (old id, new id) pairs and single nodes to walk, old or new id being None for nodes on one side only
+    if node_id is None:
+        stack = [(start, aligned.get(start)) for start in reversed(old_starts)] + \
+                [(reverse.get(start), start) for start in reversed(new_starts)]
+    elif node_id in old_nodes:
+        stack = [(node_id, aligned.get(node_id))]
+    elif node_id in new_nodes:
+        stack = [(reverse.get(node_id), node_id)]
+    else:
+        raise KeyError(node_id)
+    seen_old = set()
+    seen_new = set()
+
+    while stack:
+        old_id, new_id = stack.pop()
+        if (old_id is not None and old_id in seen_old) or (new_id is not None and new_id in seen_new):
+            continue
+        if old_id is not None:
+            seen_old.add(old_id)
+        if new_id is not None:
+            seen_new.add(new_id)
+
+        if new_id is None:
+            nodes['removed'].append(node_summary(old_nodes[old_id]))
+            for edge in out_edges(old_index, old_id):
+                edges['removed'].append(edge_summary(edge))
+                stack.append((edge.target, aligned.get(edge.target)))
+            continue
+        if old_id is None:
+            nodes['added'].append(node_summary(new_nodes[new_id]))
+            for edge in out_edges(new_index, new_id):
+                edges['added'].append(edge_summary(edge))
+                stack.append((reverse.get(edge.target), edge.target))
+            continue
+
+        compared += 1
+        if old_subtree[old_id] == new_subtree[new_id]:
+            skipped += 1
+            continue
+        if old_own[old_id] != new_own[new_id]:
+            old_values = node_values(old_nodes[old_id])
+            new_values = node_values(new_nodes[new_id])
+            changes = changed_values(old_values, new_values, dict.fromkeys([*old_values, *new_values]))
+            if changes:
+                modified = {'@id': new_id, 'changes': changes}
+                if old_id != new_id:
+                    modified['was'] = old_id
+                nodes['modified'].append(modified)
+
+        # edges of the new node by type and target, in the ids of the new graph
+        new_edges = {}
+        for edge in out_edges(new_index, new_id):
+            new_edges.setdefault((edge.type, edge.target), []).append(edge)
+            stack.append((reverse.get(edge.target), edge.target))
+        for edge in out_edges(old_index, old_id):
+            stack.append((edge.target, aligned.get(edge.target)))
+            matches = new_edges.get((edge.type, aligned.get(edge.target)))
+            if not matches:
+                edges['removed'].append(edge_summary(edge))
+                continue
+            match = matches.pop(0)
+            changes = changed_values({field: getattr(edge, field) for field in edge_fields},
+                                     {field: getattr(match, field) for field in edge_fields}, edge_fields)
+            if changes:
+                modified = edge_summary(match)
+                modified['changes'] = changes
+                edges['modified'].append(modified)
+        for edge_list in new_edges.values():
+            edges['added'].extend(edge_summary(edge) for edge in edge_list)
+
+    for kind in nodes.values():
+        kind.sort(key=lambda node: node['@id'])
+    for kind in edges.values():
+        kind.sort(key=lambda edge: (edge['source'], edge['target'], edge['type']))
+    return {
+        'nodes': nodes,
+        'edges': edges,
+        'identical': not any(nodes.values()) and not any(edges.values()),
+        'compared': compared,
+        'skipped': skipped
+    }
@@ -0,0 +1,103 @@
+import sys
+
+# ===============================================
+# graph.py
+# ------------
+# compact nodes and edges of a parsed schema,
+# turned into Cytoscape elements only when sent
+# ===============================================
+
+def intern(value):
+    """Interns strings so ids repeated across nodes, edges and indexes are stored once."""
+    return sys.intern(value) if type(value) is str else value
+
+class Node:
+    """Node of the schema graph.
+
+    Attributes:
+    id (str): unique id
+    label (str): label shown in graph
+    type (str): type of node, e.g. root, parent, child, gate, entity
+    shape (str): shape as visualized in graph
+    classes (str): Cytoscape classes, e.g. optional
+    fields (dict): values taken from the schema, e.g. name, comment, qnode; the dict is the node's own,
+                   its values are shared with the schema JSON
+    """
+    __slots__ = ('id', 'label', 'type', 'shape', 'classes', 'fields')
+
+    def __init__(self, _id, label, _type, shape='', classes='', fields=None):
+        self.id = intern(_id)
+        self.label = label
+        self.type = _type
+        self.shape = shape
+        self.classes = classes
+        self.fields = {} if fields is None else fields
+
+    def __reduce__(self):
+        return Node, (self.id, self.label, self.type, self.shape, self.classes, self.fields)
+
+    def to_cytoscape(self):
+        """Returns the node as a Cytoscape element."""
+        data = {
+            'id': self.id,
+            '_label': self.label,
+            '_type': self.type,
+            '_shape': self.shape
+        }
+        data.update(self.fields)
+        return {'data': data, 'classes': self.classes}
+
+class Edge:
+    """Edge of the schema graph. Its id is "source__target".
+
+    Attributes:
+    source (str): source node id
+    target (str): target node id
+    name (str): label shown in graph
+    type (str): type of edge, e.g. step_child, child_outlink, step_participant, relation
+    ref (str): @id of the participant or relation the edge stands for
+    predicate (str): predicate of a relation
+    """
+    __slots__ = ('source', 'target', 'name', 'type', 'ref', 'predicate')
+
+    def __init__(self, source, target, name='', _type='', ref=None, predicate=None):
+        self.source = intern(source)
+        self.target = intern(target)
+        self.name = intern(name)
+        self.type = _type
+        self.ref = ref
+        self.predicate = predicate
+
+    def __reduce__(self):
+        return Edge, (self.source, self.target, self.name, self.type, self.ref, self.predicate)
+
+    @property
+    def id(self):
+        return f"{self.source}__{self.target}"
+
+    def to_cytoscape(self):
+        """Returns the edge as a Cytoscape element."""
+        data = {
+            'id': self.id,
+            '_label': f"\n\u2060{self.name}\n\u2060",
+            'name': self.name,
+            'source': self.source,
+            'target': self.target,
+            '_edge_type': self.type
+        }
+        if self.ref is not None:
+            data['@id'] = self.ref
+        if self.predicate is not None:
+            data['predicate'] = self.predicate
+        return {'data': data, 'classes': ''}
+
+def to_cytoscape(elements):
+    """Converts a list of nodes or edges to Cytoscape elements.
+
+    Parameters:
+    elements (list): nodes or edges
+
+    Returns:
+    list: Cytoscape elements
+    """
+    return [element.to_cytoscape() for element in elements]
@@ -0,0 +1,151 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# ===============================================
+# jobs.py
+# ------------
+# uploads parsed in the background, polled for
+# their progress and result
+# ===============================================
+
+class Job:
+    """Upload being parsed in the background.
+
+    Attributes:
+    id (str): job id
+    status (str): queued, running, done or failed
+    bytes_read (int): bytes of the upload parsed so far
+    total_bytes (int): size of the upload
+    result (dict): response of the upload once done
+    error (str): why the upload failed
+    problems (list): problems found in a schema that failed validation, see sdf.SchemaValidator
+    version (int): incremented on every change, see wait
+    finished (float): monotonic time the job was done or failed
+    """
+
+    def __init__(self, total_bytes):
+        self.id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.bytes_read = 0
+        self.total_bytes = total_bytes
+        self.result = None
+        self.error = None
+        self.problems = None
+        self.version = 0
+        self.finished = None
+        self._changed = threading.Condition()
+
+    def update(self, **fields):
+        """Changes fields of the job and wakes up whoever waits for it."""
+        with self._changed:
+            for key, value in fields.items():
+                setattr(self, key, value)
+            if self.status in ('done', 'failed') and self.finished is None:
+                self.finished = time.monotonic()
+            self.version += 1
+            self._changed.notify_all()
+
+    def wait(self, version, timeout):
+        """Waits until the job changes after a version, or the timeout passes.
+
+        Returns:
+        version (int): current version
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != version, timeout)
+            return self.version
+
+    def state(self):
+        """Returns the job as sent to the client, with the result once done."""
+        with self._changed:
+            state = {
+                'job': self.id,
+                'status': self.status,
+                'bytesRead': self.bytes_read,
+                'totalBytes': self.total_bytes,
+                'progress': min(1.0, self.bytes_read / self.total_bytes) if self.total_bytes else 0.0
+            }
+            if self.status == 'done':
+                state['progress'] = 1.0
+                state['result'] = self.result
+            elif self.status == 'failed':
+                state['error'] = self.error
+                if self.problems is not None:
+                    state['problems'] = self.problems
+            return state
+
+class ProgressReader:
+    """Binary stream that reports how much of it was read to a job."""
+
+    def __init__(self, stream, job):
+        self.stream = stream
+        self.job = job
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        self.job.update(bytes_read=self.bytes_read)
+        return data
+
+class JobQueue:
+    """Bounded thread pool running background uploads, keeping finished jobs for a while.
+
+    Threads share the parsed schemas with the process that serves them, so
+    a job only holds the lock of the workspace it creates and other requests
+    are served while it runs.
+
+    Parameters:
+    workers (int): number of uploads parsed at the same time
+    max_pending (int): number of queued and running jobs accepted, 0 for no limit
+    ttl (float): seconds a finished job is kept to be polled
+    """
+
+    def __init__(self, workers=2, max_pending=8, ttl=600):
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upload')
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished is not None and now - job.finished >= self.ttl]:
+            del self._jobs[job_id]
+
+    def submit(self, func, total_bytes):
+        """Queues a job.
+
+        Parameters:
+        func (function): given the job, parses the upload and returns the result
+        total_bytes (int): size of the upload
+
+        Returns:
+        job (Job): the queued job, or None if too many are pending
+        """
+        job = Job(total_bytes)
+        with self._lock:
+            self._purge(time.monotonic())
+            pending = sum(1 for other in self._jobs.values() if other.finished is None)
+            if self.max_pending and pending >= self.max_pending:
+                return None
+            self._jobs[job.id] = job
+        self._executor.submit(self._run, job, func)
+        return job
+
+    def _run(self, job, func):
+        job.update(status='running')
+        try:
+            result = func(job)
+        except Exception as e:
+            job.update(status='failed', error=f'{type(e).__name__}: {e}', problems=getattr(e, 'problems', None))
+        else:
+            job.update(status='done', result=result)
+
+    def get(self, job_id):
+        """Gets a job, or None if it is unknown or was finished too long ago."""
+        with self._lock:
+            self._purge(time.monotonic())
+            return self._jobs.get(job_id)
@@ -0,0 +1,176 @@
+# ===============================================
+# layout.py
+# ------------
+# layered layout of subtrees, computed on the
+# server so large subtrees are not laid out in
+# the browser
+# ===============================================
+
+def break_cycles(node_ids, successors):
+    """Finds the edges to reverse so that the graph has no cycles, with an iterative depth-first search.
+
+    Parameters:
+    node_ids (list): node ids, in order
+    successors (dict): node id to list of target ids
+
+    Returns:
+    reversed_edges (set): (source, target) pairs that close a cycle
+    """
+    reversed_edges = set()
+    state = {}
+    for start in node_ids:
+        if start in state:
+            continue
+        state[start] = 1
+        stack = [(start, iter(successors[start]))]
+        while stack:
+            node_id, targets = stack[-1]
+            for target in targets:
+                if target not in state:
+                    state[target] = 1
+                    stack.append((target, iter(successors[target])))
+                    break
+                if state[target] == 1:
+                    reversed_edges.add((node_id, target))
+            else:
+                state[node_id] = 2
+                stack.pop()
+    return reversed_edges
+
+def assign_layers(node_ids, successors):
+    """Puts every node one layer after its furthest predecessor.
+
+    Parameters:
+    node_ids (list): node ids, in order
+    successors (dict): node id to list of target ids, without cycles
+
+    Returns:
+    layers (dict): node id to layer number
+    """
+    in_degree = {node_id: 0 for node_id in node_ids}
+    for node_id in node_ids:
+        for target in successors[node_id]:
+            in_degree[target] += 1
+    layers = {node_id: 0 for node_id in node_ids}
+    ready = [node_id for node_id in node_ids if in_degree[node_id] == 0]
+    while ready:
+        node_id = ready.pop()
+        for target in successors[node_id]:
+            layers[target] = max(layers[target], layers[node_id] + 1)
+            in_degree[target] -= 1
+            if in_degree[target] == 0:
+                ready.append(target)
+    return layers
+
+def order_layers(ranks, successors, predecessors, sweeps):
+    """Orders the nodes within layers to reduce crossings, by the barycenter of their neighbors.
+
+    Parameters:
+    ranks (list): list of node ids per layer, in their first order
+    successors (dict): node id to list of target ids
+    predecessors (dict): node id to list of source ids
+    sweeps (int): number of down and up sweeps
+
+    Returns:
+    ranks (list): list of node ids per layer, reordered
+    """
+    position = {node_id: i for rank in ranks for i, node_id in enumerate(rank)}
+
+    def sweep(layer_range, neighbors):
+        for layer in layer_range:
+            rank = ranks[layer]
+            barycenters = {}
+            for node_id in rank:
+                placed = [position[other] for other in neighbors[node_id]]
+                barycenters[node_id] = sum(placed) / len(placed) if placed else position[node_id]
+            rank.sort(key=lambda node_id: barycenters[node_id])
+            for i, node_id in enumerate(rank):
+                position[node_id] = i
+
+    for _ in range(sweeps):
+        sweep(range(1, len(ranks)), predecessors)
+        sweep(range(len(ranks) - 2, -1, -1), successors)
+    return ranks
+
+def layered_layout(node_ids, edges, origin=None, rank_sep=150, node_sep=80, sweeps=4):
+    """Computes a layered (Sugiyama-style) layout flowing from left to right.
+
+    Cycles are broken by reversing back edges, nodes are put in the layer
+    after their furthest predecessor and ordered within layers by the
+    barycenter of their neighbors. Separate components are stacked.
+
+    Parameters:
+    node_ids (list): node ids
+    edges (list): (source, target) pairs; self-loops and unknown ids are ignored
+    origin (str): node placed at (0, 0), by default the first node
+    rank_sep (float): distance between layers
+    node_sep (float): distance between nodes of a layer
+    sweeps (int): ordering sweeps
+
+    Returns:
+    positions (dict): node id to {'x', 'y'}
+    """
+    node_ids = list(dict.fromkeys(node_ids))
+    if not node_ids:
+        return {}
+    known = set(node_ids)
+    successors = {node_id: [] for node_id in node_ids}
+    for source, target in dict.fromkeys(edges):
+        if source != target and source in known and target in known:
+            successors[source].append(target)
+
+    reversed_edges = break_cycles(node_ids, successors)
+    if reversed_edges:
+        acyclic = {node_id: [] for node_id in node_ids}
+        for source, targets in successors.items():
+            for target in targets:
+                if (source, target) in reversed_edges:
+                    acyclic[target].append(source)
+                else:
+                    acyclic[source].append(target)
+        successors = acyclic
+    predecessors = {node_id: [] for node_id in node_ids}
+    for source, targets in successors.items():
+        for target in targets:
+            predecessors[target].append(source)
+
+    # components, in order of their first node
+    component = {}
+    for start in node_ids:
+        if start in component:
+            continue
+        component[start] = start
+        stack = [start]
+        while stack:
+            node_id = stack.pop()
+            for other in successors[node_id] + predecessors[node_id]:
+                if other not in component:
+                    component[other] = start
+                    stack.append(other)
+
+    members_of = {}
+    for node_id in node_ids:
+        members_of.setdefault(component[node_id], []).append(node_id)
+
+    layers = assign_layers(node_ids, successors)
+    positions = {}
+    top = 0
+    for members in members_of.values():
+        ranks = [[] for _ in range(max(layers[node_id] for node_id in members) + 1)]
+        for node_id in members:
+            ranks[layers[node_id]].append(node_id)
+        ranks = order_layers(ranks, successors, predecessors, sweeps)
+        height = max(len(rank) for rank in ranks)
+        for layer, rank in enumerate(ranks):
+            offset = top + (height - len(rank)) * node_sep / 2
+            for i, node_id in enumerate(rank):
+                positions[node_id] = {'x': layer * rank_sep, 'y': offset + i * node_sep}
+        top += height * node_sep + node_sep
+
+    # move the origin to (0, 0)
+    anchor = positions[origin if origin in positions else node_ids[0]]
+    dx, dy = anchor['x'], anchor['y']
+    for position in positions.values():
+        position['x'] -= dx
+        position['y'] -= dy
+    return positions
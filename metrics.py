@@ -0,0 +1,233 @@
+import cProfile
+import heapq
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+# ===============================================
+# metrics.py
+# ------------
+# opt-in timings, element counts and profiles of
+# requests, for Server-Timing and /metrics
+# ===============================================
+
+# directory cProfile dumps of the slowest requests are written to
+profile_dir = os.environ.get('SCI_PROFILE_DIR') or None
+# number of slowest request profiles kept
+profile_top = int(os.environ.get('SCI_PROFILE_TOP', 10))
+# timings are only recorded when asked for, functions are left as they are otherwise
+enabled = os.environ.get('SCI_METRICS', '').lower() in ('1', 'true', 'yes') or profile_dir is not None
+
+# upper bounds in seconds of the latency histogram buckets
+buckets = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+class Histogram:
+    """Prometheus histogram of durations, without its labels."""
+
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += seconds
+        self.count += 1
+
+class Registry:
+    """Thread-safe totals of requests, stages and element counts since the server started."""
+
+    def __init__(self):
+        self.requests = {}
+        self.request_seconds = {}
+        self.stage_seconds = {}
+        self.elements = {}
+        self._lock = threading.Lock()
+
+    def record_stage(self, name, seconds, counts):
+        with self._lock:
+            if name not in self.stage_seconds:
+                self.stage_seconds[name] = Histogram()
+            self.stage_seconds[name].observe(seconds)
+            for kind, n in counts.items():
+                self.elements[(name, kind)] = self.elements.get((name, kind), 0) + n
+
+    def record_request(self, endpoint, method, status, seconds):
+        with self._lock:
+            key = (endpoint, method, str(status))
+            self.requests[key] = self.requests.get(key, 0) + 1
+            if endpoint not in self.request_seconds:
+                self.request_seconds[endpoint] = Histogram()
+            self.request_seconds[endpoint].observe(seconds)
+
+    def render(self, gauges=None):
+        """Writes the totals in the Prometheus text exposition format.
+
+        Parameters:
+        gauges (dict): other values to expose, by metric name
+
+        Returns:
+        str: metrics page
+        """
+        lines = []
+
+        def histogram(name, text, histograms, label):
+            lines.append(f'# HELP {name} {text}')
+            lines.append(f'# TYPE {name} histogram')
+            for value, h in sorted(histograms.items()):
+                labels = f'{label}="{escape(value)}"'
+                cumulative = 0
+                for bound, n in zip(buckets, h.counts):
+                    cumulative += n
+                    lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {h.count}')
+                lines.append(f'{name}_sum{{{labels}}} {h.sum:.6f}')
+                lines.append(f'{name}_count{{{labels}}} {h.count}')
+
+        with self._lock:
+            lines.append('# HELP sci_requests_total Requests served.')
+            lines.append('# TYPE sci_requests_total counter')
+            for (endpoint, method, status), n in sorted(self.requests.items()):
+                lines.append(f'sci_requests_total{{endpoint="{escape(endpoint)}",method="{method}",'
+                             f'status="{status}"}} {n}')
+            histogram('sci_request_duration_seconds', 'Time taken to serve requests.',
+                      self.request_seconds, 'endpoint')
+            histogram('sci_stage_duration_seconds', 'Time spent in each stage of requests.',
+                      self.stage_seconds, 'stage')
+            lines.append('# HELP sci_stage_elements_total Elements handled by each stage, by kind.')
+            lines.append('# TYPE sci_stage_elements_total counter')
+            for (stage, kind), n in sorted(self.elements.items()):
+                lines.append(f'sci_stage_elements_total{{stage="{escape(stage)}",kind="{escape(kind)}"}} {n}')
+        for name, value in (gauges or {}).items():
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+def escape(value):
+    """Escapes a Prometheus label value."""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+registry = Registry()
+# stages of the request being served by this thread
+_current = threading.local()
+# (seconds, path) of the profiles kept, slowest last
+_profiles = []
+_profiles_lock = threading.Lock()
+
+def timed(name, count=None):
+    """Decorates a function to record its duration as a stage of the current request.
+
+    Parameters:
+    name (str): stage name, a token as used in Server-Timing
+    count (function): given the result and the arguments of the function, returns
+    the number of elements handled by kind, e.g. {'nodes': 10}
+
+    Returns:
+    decorator: the function unchanged when metrics are disabled
+    """
+    def decorator(func):
+        if not enabled:
+            return func
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            result = func(*args, **kwargs)
+            seconds = time.perf_counter() - start
+            counts = count(result, *args, **kwargs) if count else {}
+            registry.record_stage(name, seconds, counts)
+            stages = getattr(_current, 'stages', None)
+            if stages is not None:
+                total, totals = stages.setdefault(name, [0.0, {}])
+                stages[name][0] = total + seconds
+                for kind, n in counts.items():
+                    totals[kind] = totals.get(kind, 0) + n
+            return result
+        return wrapper
+    return decorator
+
+def start_request():
+    """Starts timing, and profiling if enabled, the request served by this thread."""
+    if not enabled:
+        return
+    stop_profiler()
+    _current.stages = {}
+    _current.start = time.perf_counter()
+    _current.profiler = None
+    if profile_dir is not None:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            _current.profiler = profiler
+        except ValueError:
+            # another profiler is active in this thread
+            pass
+
+def stop_profiler():
+    """Stops the profiler of this thread, if a request left it running."""
+    profiler = getattr(_current, 'profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _current.profiler = None
+    return profiler
+
+def finish_request(endpoint, method, status):
+    """Records the request served by this thread.
+
+    Parameters:
+    endpoint (str): name of the view function
+    method (str): HTTP method
+    status (int): HTTP status code
+
+    Returns:
+    str: Server-Timing header value, or None if metrics are disabled
+    """
+    stages = getattr(_current, 'stages', None)
+    if stages is None:
+        return None
+    profiler = stop_profiler()
+    seconds = time.perf_counter() - _current.start
+    _current.stages = None
+    endpoint = endpoint or 'unknown'
+    registry.record_request(endpoint, method, status, seconds)
+    if profiler is not None:
+        keep_profile(profiler, endpoint, seconds)
+
+    timings = []
+    for name, (stage_seconds, counts) in stages.items():
+        timing = f'{name};dur={stage_seconds * 1000:.1f}'
+        if counts:
+            timing += ';desc="' + ' '.join(f'{kind}={n}' for kind, n in counts.items()) + '"'
+        timings.append(timing)
+    timings.append(f'total;dur={seconds * 1000:.1f}')
+    return ', '.join(timings)
+
+def keep_profile(profiler, endpoint, seconds):
+    """Dumps the profile of a request if it is one of the slowest profile_top so far, dropping the fastest kept.
+
+    Parameters:
+    profiler (Profile): stopped profiler of the request
+    endpoint (str): name of the view function
+    seconds (float): time taken by the request
+    """
+    with _profiles_lock:
+        if len(_profiles) >= profile_top and (not _profiles or seconds <= _profiles[0][0]):
+            return
+        os.makedirs(profile_dir, exist_ok=True)
+        name = f'{seconds * 1000:010.1f}ms-{re.sub(r"[^A-Za-z0-9_]", "_", endpoint)}-{time.time_ns()}.prof'
+        path = os.path.join(profile_dir, name)
+        profiler.dump_stats(path)
+        heapq.heappush(_profiles, (seconds, path))
+        while len(_profiles) > profile_top:
+            _, dropped = heapq.heappop(_profiles)
+            try:
+                os.remove(dropped)
+            except OSError:
+                pass
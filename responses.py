@@ -0,0 +1,98 @@
+import gzip
+import json
+import os
+
+from flask import Response, request
+
+from metrics import timed
+
+# ===============================================
+# responses.py
+# ------------
+# serializes and compresses JSON responses
+# ===============================================
+
+def _orjson():
+    import orjson
+    return orjson.dumps
+
+def _ujson():
+    import ujson
+    return lambda obj: ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+def _stdlib():
+    return lambda obj: json.dumps(obj, ensure_ascii=False).encode('utf-8')
+
+serializers = {
+    'orjson': _orjson,
+    'ujson': _ujson,
+    'json': _stdlib
+}
+
+def get_serializer(names):
+    """Picks the first installed JSON serializer.
+
+    Parameters:
+    names (list): serializer names in order of preference, see serializers
+
+    Returns:
+    name (str): name of the serializer
+    dumps (function): turns an object into UTF-8 encoded JSON bytes
+    """
+    for name in names:
+        try:
+            return name, serializers[name]()
+        except (ImportError, KeyError):
+            continue
+    return 'json', _stdlib()
+
+def _brotli():
+    try:
+        import brotli
+        return lambda body: brotli.compress(body, quality=5)
+    except ImportError:
+        return None
+
+serializer_name, dumps = get_serializer(
+    [os.environ['SCI_JSON_BACKEND']] if os.environ.get('SCI_JSON_BACKEND') else ['orjson', 'ujson', 'json'])
+
+# compressors by content coding, in order of preference
+compressors = {
+    'br': _brotli(),
+    'gzip': lambda body: gzip.compress(body, compresslevel=6)
+}
+compressors = {coding: timed('compress', lambda body, *args: {'bytes': len(body)})(compress)
+               for coding, compress in compressors.items() if compress}
+
+# responses smaller than this are sent uncompressed
+compress_min_bytes = int(os.environ.get('SCI_COMPRESS_MIN_BYTES', 1024))
+
+@timed('serialize', lambda body, obj: {'bytes': len(body)})
+def serialize(obj):
+    """Turns an object into the JSON bytes of a response."""
+    return dumps(obj)
+
+def json_response(obj, status=200):
+    """Serializes an object into a JSON response, compressed if the client accepts it.
+
+    Parameters:
+    obj: object to send
+    status (int): HTTP status code
+
+    Returns:
+    Response: JSON response
+    """
+    body = serialize(obj)
+    response = Response(body, status=status, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    if len(body) >= compress_min_bytes:
+        for coding, compress in compressors.items():
+            if request.accept_encodings[coding]:
+                response.set_data(compress(body))
+                response.headers['Content-Encoding'] = coding
+                break
+    return response
+
+def include_schema():
+    """Whether the client wants the schema JSON echoed back, i.e. ?schemaJson=false was not sent."""
+    return request.args.get('schemaJson', 'true').lower() != 'false'
@@ -0,0 +1,354 @@
+import contextlib
+import copy
+import io
+import json
+import os
+import getopt, sys
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPTS_DIR, '..'))
+sys.path.insert(0, SCRIPTS_DIR)
+import app
+from app import GraphBuilder, get_connected_nodes, get_nodes_and_edges, handle_containers, \
+    load_workspace, patch_graph, update_json
+from sdf import index_json
+from generate import generate_schema
+import preprocess
+import reorder
+
+
+def container_schema(num_containers):
+    """Builds a schema whose root alternates plain children and outlinks containers.
+
+    Each container is reached through an outlink of the previous child and
+    holds two children of its own.
+
+    Parameters:
+    num_containers (int): number of outlinks containers
+
+    Returns:
+    schemaJson (dict): schema in json form
+    """
+    root = {'@id': 'Events/00000/', 'name': 'Root', 'children_gate': 'or', 'children': []}
+    events = [root]
+    for i in range(num_containers):
+        step_id = f'Events/{i}/step/'
+        container_id = f'Events/{i}/outlinks/'
+        events.append({'@id': step_id, 'name': f'Step {i}'})
+        root['children'].append({'child': step_id, 'comment': f'Step {i}', 'optional': False, 'outlinks': [container_id]})
+        root['children'].append({'child': container_id, 'comment': 'outlinks', 'optional': False, 'outlinks': []})
+        container = {'@id': container_id, 'name': f'outlinks {i}', 'children_gate': 'or', 'children': []}
+        for side in ('a', 'b'):
+            child_id = f'Events/{i}/{side}/'
+            events.append({'@id': child_id, 'name': f'Step {i}{side}'})
+            container['children'].append({'child': child_id, 'comment': side, 'optional': False, 'outlinks': []})
+        events.append(container)
+    return {'@id': 'Schemas/benchmark', 'sdfVersion': '2.0', 'events': events, 'entities': [], 'relations': []}
+
+def bench_containers(sizes, repeat):
+    """Times get_nodes_and_edges against the number of containers.
+
+    Parameters:
+    sizes (list): container counts to time
+    repeat (int): runs per size, the fastest is reported
+    """
+    print(f"{'containers':>12}{'seconds':>12}{'us/container':>15}")
+    for size in sizes:
+        best = float('inf')
+        for _ in range(repeat):
+            schema = container_schema(size)
+            start = time.perf_counter()
+            get_nodes_and_edges(schema)
+            best = min(best, time.perf_counter() - start)
+        print(f"{size:>12}{best:>12.4f}{best / size * 1e6:>15.2f}")
+
+def measure(func, setup, repeat, memory):
+    """Times a function, and optionally the memory it allocates.
+
+    Parameters:
+    func (function): takes the value returned by setup
+    setup (function): prepares a fresh input for every run, not timed
+    repeat (int): runs, the fastest is reported
+    memory (bool): whether to also measure the peak of traced memory in a separate run
+
+    Returns:
+    seconds (float): fastest run
+    peak (float): peak MB allocated during a run, or None
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        value = setup()
+        start = time.perf_counter()
+        func(value)
+        best = min(best, time.perf_counter() - start)
+    peak = None
+    if memory:
+        value = setup()
+        tracemalloc.start()
+        func(value)
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return best, peak
+
+def sample_edits(schema):
+    """Picks a fixed set of sidebar edits spread over the schema."""
+    events = schema['events']
+    parents = [event for event in events if 'children' in event]
+    leaves = [event for event in events if 'children' not in event]
+    edits = [
+        {'id': parents[len(parents) // 2]['@id'], 'key': 'name', 'value': 'kairos:Renamed_Event'},
+        {'id': leaves[len(leaves) // 2]['@id'], 'key': 'description', 'value': 'new description'},
+        {'id': leaves[len(leaves) // 3]['@id'], 'key': 'optional', 'value': True},
+        {'id': leaves[len(leaves) // 4]['@id'], 'key': '@id', 'value': 'Events/99999/Renamed'}
+    ]
+    if schema['entities']:
+        edits.append({'id': schema['entities'][0]['@id'], 'key': '@id', 'value': 'Entities/99999/'})
+    return edits
+
+def stage_benchmarks(schema, repeat, memory):
+    """Times every stage of loading, browsing and editing a schema.
+
+    Parameters:
+    schema (dict): schema in json form
+    repeat (int): runs per stage
+    memory (bool): whether to measure memory too
+
+    Returns:
+    results (list): (stage, calls, seconds, peak MB) per stage
+    """
+    results = []
+    schema_string = json.dumps(schema)
+    fresh = lambda: copy.deepcopy(schema)
+
+    def builder_for(schema_json):
+        builder = GraphBuilder()
+        for entity in schema_json['entities']:
+            builder.add_entity(entity)
+        for relation in schema_json['relations']:
+            builder.add_relation(relation)
+        for event in schema_json['events']:
+            builder.add_event(event)
+        return builder
+
+    stages = [
+        ('json.loads', 1, lambda _: json.loads(schema_string), lambda: None),
+        ('get_nodes_and_edges', 1, get_nodes_and_edges, fresh),
+        ('handle_containers', 1,
+         lambda builder: handle_containers(builder.nodes, builder.edges, builder.containers_to_remove),
+         lambda: builder_for(fresh())),
+        ('index_json', 1, index_json, fresh),
+        ('load_workspace', 1, load_workspace, fresh),
+    ]
+    for name, calls, func, setup in stages:
+        seconds, peak = measure(func, setup, repeat, memory)
+        results.append((name, calls, seconds, peak))
+
+    # subtrees of the root and of up to 50 parents
+    workspace, _ = load_workspace(fresh())
+    parents = ['root'] + [event['@id'] for event in schema['events'] if 'children' in event
+                          and event['@id'] in workspace.nodes][:50]
+    seconds, peak = measure(lambda _: [get_connected_nodes(workspace, parent) for parent in parents],
+                            lambda: None, repeat, memory)
+    results.append(('get_connected_nodes', len(parents), seconds, peak))
+
+    # sidebar edits on a fresh workspace each run
+    edits = sample_edits(schema)
+    def edit_all(workspace):
+        for values in edits:
+            changes = []
+            update_json(workspace, values, changes)
+            patch_graph(workspace, values, changes)
+    seconds, peak = measure(edit_all, lambda: load_workspace(fresh())[0], repeat, memory)
+    results.append(('update_json+patch_graph', len(edits), seconds, peak))
+    return results
+
+def route_benchmarks(schema, repeat):
+    """Times the Flask routes through the test client.
+
+    The first upload of a schema parses it; the reload of the same content
+    is served from the parsed schema cache when it is enabled.
+
+    Parameters:
+    schema (dict): schema in json form
+    repeat (int): runs per route
+
+    Returns:
+    results (list): (route, calls, seconds, None) per route
+    """
+    client = app.app.test_client()
+    body = json.dumps(schema).encode('utf-8')
+    results = []
+    edits = sample_edits(schema)
+    upload_best = reload_best = node_best = patch_best = float('inf')
+    for _ in range(repeat):
+        if app.graph_cache is not None:
+            app.graph_cache = app.GraphCache(app.graph_cache.max_bytes)
+        start = time.perf_counter()
+        response = client.post('/upload', data={'file': (io.BytesIO(body), 'schema.json')},
+                               content_type='multipart/form-data')
+        upload_best = min(upload_best, time.perf_counter() - start)
+        uploaded = json.loads(response.data)
+        workspace_id = uploaded['workspace']
+        node_ids = [node['data']['id'] for node in uploaded['parsedSchema']['nodes']][:50]
+
+        start = time.perf_counter()
+        for node_id in node_ids:
+            client.get('/node', query_string={'ID': node_id, 'workspace': workspace_id})
+        node_best = min(node_best, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for values in edits:
+            client.patch('/node', query_string={'workspace': workspace_id}, data=json.dumps(values))
+        patch_best = min(patch_best, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        client.post('/reload', query_string={'workspace': workspace_id}, data=body)
+        reload_best = min(reload_best, time.perf_counter() - start)
+    results.append(('POST /upload', 1, upload_best, None))
+    results.append(('GET /node', len(node_ids), node_best, None))
+    results.append(('PATCH /node', len(edits), patch_best, None))
+    results.append(('POST /reload', 1, reload_best, None))
+    return results
+
+def script_benchmarks(schema, repeat):
+    """Times scripts/preprocess.py and scripts/reorder.py on a schema file.
+
+    Parameters:
+    schema (dict): schema in json form
+    repeat (int): runs per script
+
+    Returns:
+    results (list): (script, calls, seconds, None) per script
+    """
+    results = []
+    directory = tempfile.mkdtemp()
+    try:
+        source = os.path.join(directory, 'schema.json')
+        with open(source, 'w') as f:
+            json.dump(schema, f)
+        for name, script in (('preprocess.py', preprocess), ('reorder.py', reorder)):
+            best = float('inf')
+            for _ in range(repeat):
+                target = os.path.join(directory, 'run.json')
+                shutil.copyfile(source, target)
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    script.main(['-i', target])
+                best = min(best, time.perf_counter() - start)
+            results.append((name, 1, best, None))
+    finally:
+        shutil.rmtree(directory)
+    return results
+
+def bench_suite(sizes, repeat, suites, memory, options, output_file):
+    """Runs the selected suites on synthetic schemas of growing size and prints scaling tables.
+
+    Parameters:
+    sizes (list): numbers of events
+    repeat (int): runs per measurement, the fastest is reported
+    suites (list): any of stages, routes, scripts
+    memory (bool): whether to measure memory of the stages
+    options (dict): extra generate_schema options
+    output_file (str): file to write the results to as JSON, or empty
+    """
+    rows = []
+    print(f"{'stage':<26}{'events':>8}{'calls':>7}{'seconds':>11}{'us/event':>11}{'peak MB':>10}")
+    for size in sizes:
+        schema = generate_schema(events=size, **options)
+        num_events = len(schema['events'])
+        results = []
+        if 'stages' in suites:
+            results += stage_benchmarks(schema, repeat, memory)
+        if 'routes' in suites:
+            results += route_benchmarks(schema, repeat)
+        if 'scripts' in suites:
+            results += script_benchmarks(schema, repeat)
+        for name, calls, seconds, peak in results:
+            peak_text = f'{peak:.2f}' if peak is not None else '-'
+            print(f"{name:<26}{num_events:>8}{calls:>7}{seconds:>11.4f}"
+                  f"{seconds / num_events * 1e6:>11.3f}{peak_text:>10}")
+            rows.append({'stage': name, 'events': num_events, 'calls': calls,
+                         'seconds': seconds, 'peakMB': peak})
+        print()
+    if output_file:
+        with open(output_file, 'w') as outf:
+            json.dump(rows, outf, indent=4)
+        print(f"Results written to {output_file}.")
+
+def main(argv):
+    h = """
+    benchmark.py
+    ======================================================================
+    Times schema parsing, browsing and editing on synthetic schemas.
+
+    The containers benchmark parses schemas with a growing number of
+    outlinks containers. Time per container should stay flat as the
+    number of containers grows.
+
+    The stages, routes and scripts benchmarks run on schemas from
+    generate.py with a growing number of events, and report time and
+    peak memory per stage so scaling curves can be compared between
+    revisions.
+    ======================================================================
+    -h      help
+
+    Optionals:
+    -b      comma-separated benchmarks: containers, stages, routes,
+            scripts, or all (default)
+    -s      comma-separated sizes, default 1000,2000,4000,8000,16000
+            containers, or 1000,4000,16000 events
+    -r      runs per measurement, default 3
+    -m      skip memory measurement of stages
+    -o      write stage results to a JSON file
+    -d, -f, -x, -a, -c, -p, -e
+            depth (default 8 here), fan-out, xor and and gate shares, container share,
+            participants per event and entities, as in generate.py
+    """
+    # obtain arguments
+    sizes = None
+    repeat = 3
+    benchmarks = ['containers', 'stages', 'routes', 'scripts']
+    memory = True
+    output_file = ''
+    # deep enough that the number of events, not the depth, bounds the schema
+    options = {'depth': 8}
+    flags = {'-d': ('depth', int), '-f': ('fan_out', int), '-x': ('xor', float),
+             '-a': ('and_gate', float), '-c': ('containers', float), '-p': ('participants', int),
+             '-e': ('entities', int)}
+    try:
+        opts, _ = getopt.getopt(argv, "hb:s:r:mo:d:f:x:a:c:p:e:",
+                                ["help", "benchmarks=", "sizes=", "repeat=", "outputfile="])
+    except getopt.GetoptError:
+        print(h)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(h)
+            sys.exit()
+        if opt in ("-b", "--benchmarks"):
+            benchmarks = benchmarks if arg == 'all' else arg.split(',')
+        elif opt in ("-s", "--sizes"):
+            sizes = [int(size) for size in arg.split(',')]
+        elif opt in ("-r", "--repeat"):
+            repeat = int(arg)
+        elif opt == "-m":
+            memory = False
+        elif opt in ("-o", "--outputfile"):
+            output_file = arg
+        elif opt in flags:
+            name, cast = flags[opt]
+            options[name] = cast(arg)
+
+    if 'containers' in benchmarks:
+        bench_containers(sizes or [1000, 2000, 4000, 8000, 16000], repeat)
+        print()
+    suites = [suite for suite in benchmarks if suite != 'containers']
+    if suites:
+        bench_suite(sizes or [1000, 4000, 16000], repeat, suites, memory, options, output_file)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
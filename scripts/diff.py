@@ -0,0 +1,109 @@
+import json
+import getopt, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from app import get_nodes_and_edges
+from compare import diff_graphs
+
+
+def read_graph(file):
+    """Parses a schema file into its graph.
+
+    Parameters:
+    file (str): path to the JSON file
+
+    Returns:
+    nodes (dict): nodes in the schema
+    edge_index (dict): adjacency index over edges
+    """
+    with open(file, encoding='utf-8') as f:
+        nodes, _, edge_index = get_nodes_and_edges(json.load(f))
+    return nodes, edge_index
+
+def print_diff(result):
+    """Prints a diff one line per change, '+' for added, '-' for removed and '~' for modified."""
+    for node in result['nodes']['removed']:
+        print(f"- node {node['@id']} ({node['name']})")
+    for node in result['nodes']['added']:
+        print(f"+ node {node['@id']} ({node['name']})")
+    for node in result['nodes']['modified']:
+        was = f" (was {node['was']})" if 'was' in node else ''
+        print(f"~ node {node['@id']}{was}")
+        for field, change in node['changes'].items():
+            print(f"    {field}: {json.dumps(change.get('old'))} -> {json.dumps(change.get('new'))}")
+    for sign, kind in (('-', 'removed'), ('+', 'added'), ('~', 'modified')):
+        for edge in result['edges'][kind]:
+            print(f"{sign} {edge['type']} {edge['source']} -> {edge['target']}")
+            for field, change in edge.get('changes', {}).items():
+                print(f"    {field}: {json.dumps(change.get('old'))} -> {json.dumps(change.get('new'))}")
+    counts = ', '.join(f"{len(result[group][kind])} {group} {kind}"
+                       for group in ('nodes', 'edges') for kind in ('added', 'removed', 'modified'))
+    print(f"{counts}; {result['skipped']} of {result['compared']} matched nodes skipped as unchanged subtrees.")
+
+def main(argv):
+    h = """
+    diff.py
+    ======================================================================
+    Input two JSON files, e.g. a TA1 submission and its curated version.
+    This script compares the graphs of the two schemas and lists the
+    nodes and edges added, removed or modified in the second one, with
+    the fields that changed.
+
+    Nodes are matched by @id, then by name for the remaining ones.
+
+    Exits with 1 if the schemas differ.
+    ======================================================================
+    -h      help
+    -a      old file
+    -b      new file
+
+    Optionals:
+    -n      @id of a node, to only compare its subtree
+    -o      output file to write the diff to as JSON, instead of printing it
+    """
+    # obtain arguments
+    old_file = ''
+    new_file = ''
+    node_id = None
+    output_file = ''
+    try:
+        opts, _ = getopt.getopt(argv, "ha:b:n:o:", ["help", "old=", "new=", "node=", "outputfile="])
+    except getopt.GetoptError:
+        print('error')
+        print(h)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(h)
+            sys.exit()
+        if opt in ("-a", "--old"):
+            old_file = arg
+        elif opt in ("-b", "--new"):
+            new_file = arg
+        elif opt in ("-n", "--node"):
+            node_id = arg
+        elif opt in ("-o", "--outputfile"):
+            output_file = arg
+
+    # exit with help
+    if old_file == '' or new_file == '':
+        print(h)
+        sys.exit(2)
+
+    old, new = read_graph(old_file), read_graph(new_file)
+    if node_id is not None and node_id not in old[0] and node_id not in new[0]:
+        print(f"ERROR: {node_id} is in neither schema.")
+        sys.exit(2)
+    result = diff_graphs(old, new, node_id)
+
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=4)
+        print(f"Diff is available at {output_file}.")
+    else:
+        print_diff(result)
+    if not result['identical']:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,181 @@
+import json
+import getopt, sys
+import random
+from collections import deque
+
+
+def generate_schema(events=1000, depth=4, fan_out=5, xor=0.1, and_gate=0.1, containers=0.05,
+                    participants=2, entities=200, relations=100, seed=0):
+    """Generates a synthetic SDF 2.0 schema.
+
+    Events form a single hierarchy built breadth first from one root. Siblings
+    are chained through outlinks, and a share of parents wrap their last two
+    children in an outlinks container.
+
+    Parameters:
+    events (int): number of events, not counting containers
+    depth (int): maximum depth of the hierarchy
+    fan_out (int): average number of children of a parent
+    xor (float): share of parents with an xor children_gate
+    and_gate (float): share of parents with an and children_gate
+    containers (float): share of parents that wrap children in an outlinks container
+    participants (int): participants per event
+    entities (int): number of entities
+    relations (int): number of relations between entities
+    seed (int): random seed
+
+    Returns:
+    schemaJson (dict): schema in json form
+    """
+    rng = random.Random(seed)
+    num = {'event': 10000, 'participant': 20000}
+
+    entity_list = [{
+        '@id': f'Entities/{i:05d}/',
+        'name': f'entity {i}',
+        'qnode': f'wd:Q{rng.randint(1, 10 ** 7)}',
+        'qlabel': f'label {i}',
+        'centrality': round(rng.random(), 3)
+    } for i in range(entities)]
+    relation_list = [{
+        '@id': f'Relations/{30000 + i}/',
+        'name': f'relation {i}',
+        'relationSubject': rng.choice(entity_list)['@id'],
+        'relationPredicate': f'wd:P{rng.randint(1, 9999)}',
+        'relationObject': rng.choice(entity_list)['@id']
+    } for i in range(relations if entities else 0)]
+
+    def new_event(level, name=None):
+        event_id = f"Events/{num['event']:05d}/"
+        num['event'] += 1
+        name = name or f'kairos:Event_{event_id.split("/")[1]}_{level}'
+        event = {
+            '@id': event_id,
+            'name': name,
+            'description': f'{name} at depth {level}',
+            'comment': f'comment on {name}',
+            'qnode': f'wd:Q{rng.randint(1, 10 ** 7)}',
+            'qlabel': f'qlabel {level}',
+            'ta1explanation': f'explanation of {name}',
+            'importance': round(rng.random(), 2),
+            'privateData': {
+                '@type': 'kairos:Primitive',
+                'template': '',
+                'repeatable': level > 0 and rng.random() < 0.02
+            },
+            'participants': []
+        }
+        for _ in range(participants if entities else 0):
+            event['participants'].append({
+                '@id': f"Participants/{num['participant']}/",
+                'roleName': f'role_{rng.randint(1, 9)}',
+                'entity': rng.choice(entity_list)['@id']
+            })
+            num['participant'] += 1
+        return event
+
+    def child_entry(event):
+        return {
+            'child': event['@id'],
+            'comment': event['name'],
+            'optional': rng.random() < 0.2,
+            'importance': event['importance'],
+            'outlinks': []
+        }
+
+    def add_children(parent, children):
+        """Attaches events as children of parent, chaining siblings through outlinks."""
+        draw = rng.random()
+        parent['children_gate'] = 'xor' if draw < xor else 'and' if draw < xor + and_gate else 'or'
+        parent['children'] = [child_entry(child) for child in children]
+        for entry, following in zip(parent['children'], parent['children'][1:]):
+            entry['outlinks'].append(following['child'])
+
+    root = new_event(0, 'kairos:Root')
+    event_list = [root]
+    count = 1
+    queue = deque([(root, 0)])
+    while queue and count < events:
+        parent, level = queue.popleft()
+        if level >= depth:
+            continue
+        size = min(rng.randint(max(1, fan_out // 2), fan_out + fan_out // 2), events - count)
+        children = [new_event(level + 1) for _ in range(size)]
+        count += size
+        event_list.extend(children)
+        queue.extend((child, level + 1) for child in children)
+        if size >= 3 and rng.random() < containers:
+            # wrap the last two children in a container reached through an outlink
+            container = new_event(level + 1, f'kairos:Event_{parent["@id"].split("/")[1]} outlinks')
+            container['participants'] = []
+            add_children(container, children[-2:])
+            container['children_gate'] = 'or'
+            event_list.append(container)
+            children = children[:-2] + [container]
+        add_children(parent, children)
+
+    return {
+        '@context': ['https://kairos-sdf.s3.amazonaws.com/context/kairos-v2.0.jsonld'],
+        'sdfVersion': '2.0',
+        '@id': f'Submissions/synthetic/{seed}',
+        'version': 'synthetic',
+        'events': event_list,
+        'entities': entity_list,
+        'relations': relation_list
+    }
+
+def main(argv):
+    h = """
+    generate.py
+    ======================================================================
+    Writes a synthetic SDF 2.0 schema for testing and benchmarks.
+    The same options and seed always give the same schema.
+    ======================================================================
+    -h      help
+    -o      output file
+
+    Optionals:
+    -n      number of events, default 1000
+    -d      maximum hierarchy depth, default 4
+    -f      average fan-out, default 5
+    -x      share of xor gates, default 0.1
+    -a      share of and gates, default 0.1
+    -c      share of parents with an outlinks container, default 0.05
+    -p      participants per event, default 2
+    -e      number of entities, default 200
+    -r      number of relations, default 100
+    -s      random seed, default 0
+    """
+    # obtain arguments
+    output_file = ''
+    options = {}
+    flags = {'-n': ('events', int), '-d': ('depth', int), '-f': ('fan_out', int),
+             '-x': ('xor', float), '-a': ('and_gate', float), '-c': ('containers', float),
+             '-p': ('participants', int), '-e': ('entities', int), '-r': ('relations', int),
+             '-s': ('seed', int)}
+    try:
+        opts, _ = getopt.getopt(argv, "ho:n:d:f:x:a:c:p:e:r:s:", ["help", "outputfile="])
+    except getopt.GetoptError:
+        print(h)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(h)
+            sys.exit()
+        if opt in ("-o", "--outputfile"):
+            output_file = arg
+        elif opt in flags:
+            name, cast = flags[opt]
+            options[name] = cast(arg)
+
+    # exit with help
+    if output_file == '':
+        print(h)
+        sys.exit(2)
+
+    with open(output_file, 'w') as outf:
+        json.dump(generate_schema(**options), outf, indent=4)
+    print(f"Schema written to {output_file}.")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,6 +1,119 @@
+import glob
 import json
-import getopt, sys
+import getopt, os, sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sdf import find_event, index_json, set_children_gates
+
+
+def preprocess_schema(schemaJson):
+    """Fixes children gates to 'or' and fills in child comments, ids and optional values.
+
+    Children may refer to events by name instead of @id; both are resolved
+    through the index of the shared SDF model.
+
+    Parameters:
+    schemaJson (dict): schema in json form, changed in place
+
+    Returns:
+    schemaJson (dict): preprocessed schema
+    """
+    schema = schemaJson['events']
+    json_index = index_json(schemaJson)
+
+    # change children_gate
+    set_children_gates(schemaJson, 'or')
+
+    # add comments to children
+    for ref, locations in json_index['children'].items():
+        scheme = find_event(schemaJson, json_index, ref)
+        if scheme is None:
+            s, _ = locations[0]
+            raise ValueError(f"child {ref} of {schema[s]['@id']} is not an event id or name")
+        for s, c in locations:
+            child = schema[s]['children'][c]
+            # check name
+            if ref not in json_index['events']:
+                child['comment'] = ref
+                child['child'] = scheme['@id']
+            else:
+                child['comment'] = scheme['name']
+
+            if 'optional' not in child:
+                child['optional'] = False
+
+    return schemaJson
+
+def preprocess_file(input_file):
+    """Preprocesses a JSON file into a new file next to it, ending in _processed.json.
+
+    Parameters:
+    input_file (str): path to the JSON file
+
+    Returns:
+    output_file (str): path to the new file
+    num_events (int): number of events in the schema
+    seconds (float): time taken
+    """
+    start = time.perf_counter()
+    file = input_file[:-5]
+    with open(f'{file}.json', encoding='utf8') as f:
+        schemaJson = json.load(f)
+    preprocess_schema(schemaJson)
+    with open(f"{file}_processed.json", "w") as outf:
+        json.dump(schemaJson, outf, indent = 4)
+    return f"{file}_processed.json", len(schemaJson['events']), time.perf_counter() - start
+
+def find_files(pattern):
+    """Lists the JSON files in a directory or matching a glob, leaving out earlier output.
+
+    Parameters:
+    pattern (str): directory or glob pattern
+
+    Returns:
+    files (list): sorted paths
+    """
+    if os.path.isdir(pattern):
+        pattern = os.path.join(pattern, '*.json')
+    return sorted(path for path in glob.glob(pattern)
+                  if path.endswith('.json') and not path.endswith('_processed.json'))
+
+def preprocess_batch(files, workers=None):
+    """Preprocesses files in parallel and prints a timing report.
+
+    Parameters:
+    files (list): paths to JSON files
+    workers (int): number of processes, defaults to the number of CPUs
+
+    Returns:
+    failed (int): number of files that could not be preprocessed
+    """
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(preprocess_file, path): path for path in files}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    total = time.perf_counter() - start
+
+    failed = 0
+    width = max(len(path) for path in files)
+    print(f"{'file':<{width}}{'events':>9}{'seconds':>10}")
+    for path in files:
+        result = results[path]
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{path:<{width}}  ERROR: {result}")
+        else:
+            _, num_events, seconds = result
+            print(f"{path:<{width}}{num_events:>9}{seconds:>10.3f}")
+    print(f"Preprocessed {len(files) - failed} of {len(files)} files in {total:.3f} seconds.")
+    return failed
 
 def main(argv):
     h = """
@@ -14,16 +127,26 @@ def main(argv):
     hierarchy, and adds missing values to child lists to prevent errors
     from SCI 2.0.
 
+    Use -b to preprocess every JSON file in a directory, or every file
+    matching a glob pattern, in parallel. Each file is written next to
+    its input and a timing report is printed at the end.
+
     *note: if it does not read your file, try putting your file path in
     double quotes, e.g. "path\\to\\file" on Windows.
     ======================================================================
     -h      help
     -i      input file
+    -b      directory or glob pattern of input files, instead of -i
+
+    Optionals:
+    -j      number of processes for -b, default the number of CPUs
     """
     # obtain arguments
     input_file = ''
+    batch = ''
+    workers = None
     try:
-        opts, _ = getopt.getopt(argv, "hi:", ["help", "inputfile="])
+        opts, _ = getopt.getopt(argv, "hi:b:j:", ["help", "inputfile=", "batch=", "jobs="])
     except getopt.GetoptError:
         print('error')
         print(h)
@@ -34,6 +157,19 @@ def main(argv):
             sys.exit()
         if opt in ("-i", "--inputfile"):
             input_file = arg
+        elif opt in ("-b", "--batch"):
+            batch = arg
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
+
+    if batch:
+        files = find_files(batch)
+        if not files:
+            print(f"ERROR: no JSON files found in {batch}.")
+            sys.exit(2)
+        if preprocess_batch(files, workers):
+            sys.exit(1)
+        return
 
     # exit with help
     if input_file == '':
@@ -46,39 +182,8 @@ def main(argv):
         print(h)
         sys.exit(2)
 
-    file = input_file[:-5]
-    with open(f'{file}.json', encoding='utf8') as f:
-        schema_string = f.read()
-    schemaJson = json.loads(schema_string)
-    schema = schemaJson['events']
-
-    # extract event dictionary
-    eventDict = {}
-    for scheme in schema:
-        eventDict[scheme['@id']] = scheme['name']
-
-    # change children_gate and add comments to children
-    for scheme in schema:
-        if 'children' in scheme:
-            scheme['children_gate'] = 'or'
-
-            for child in scheme['children']:
-                # check name
-                if 'Events' not in child['child']:
-                    event_id = list(eventDict.keys())[list(eventDict.values()).index(child['child'])]
-                    child['comment'] = child['child']
-                    child['child'] = event_id
-                else:
-                    child['comment'] = eventDict[child['child']]
-                
-                if 'optional' not in child:
-                    child['optional'] = False
-
-    schemaJson['events'] = schema
-    jsonObject = json.dumps(schemaJson, indent = 4)
-    with open(f"{file}_processed.json", "w") as outf:
-        outf.write(jsonObject)
-    print(f"New file is available at {file}_processed.json.")
+    output_file, _, _ = preprocess_file(input_file)
+    print(f"New file is available at {output_file}.")
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
\ No newline at end of file
+    main(sys.argv[1:])
@@ -1,5 +1,15 @@
+import glob
 import json
-import getopt, sys
+import getopt, os, sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sdf import SchemaError, index_json, remap_ids, validate_schema
+
+# fields ids are read from or resolved through; other fields missing do not stop a schema from being reordered
+id_fields = {'@id', 'relationSubject', 'relationObject', 'entity', 'child'}
 
 def NewId(currId, num, idDict = -1):
     oldId = currId.split('/')
@@ -9,6 +19,209 @@ def NewId(currId, num, idDict = -1):
     num += 1
     return newId, num, idDict
 
+def reorder_schema(schemaJson, v = 0):
+    """Reorders Entities, Relations, Events, and Participant IDs and resolves references to them.
+
+    Entities, relations and participants are numbered by position, so
+    repeated ids get new ids of their own, and events in order of
+    appearance. References are then rewritten in one pass through the
+    index of the shared SDF model.
+
+    Parameters:
+    schemaJson (dict): schema in json form, changed in place
+    v (int): verbose output
+
+    Returns:
+    idMaps (dict): old id to new id, by entities, relations, events and participants
+    """
+    if v: print("Indexing ids...", end='')
+    json_index = index_json(schemaJson)
+    if v: print("done.")
+
+    if v: print("Numbering entities and relations...", end='')
+    numE = 0
+    entDict = {}
+    entIds = []
+    for entity in schemaJson['entities']:
+        newId, numE, entDict = NewId(entity['@id'], numE, entDict)
+        entIds.append(newId)
+    relDict = {}
+    relIds = []
+    for numR, relation in enumerate(schemaJson['relations'], 30000):
+        rid = relation['@id'].split('/')
+        relDict[relation['@id']] = f'{rid[0]}/{numR}/'
+        relIds.append(relDict[relation['@id']])
+    if v: print("done.")
+
+    if v: print("Numbering events and participants...", end='')
+    numP = 20000
+    numS = 10000
+    schemeDict = {}
+    partDict = {}
+    partIds = []
+    for scheme in schemaJson['events']:
+        # events are numbered as they are first defined or referenced
+        refs = [scheme['@id']]
+        for child in scheme.get('children', []):
+            refs.append(child['child'])
+            refs.extend(child.get('outlinks', []))
+        for ref in refs:
+            if ref not in schemeDict:
+                _, numS, schemeDict = NewId(ref, numS, schemeDict)
+
+        for participant in scheme.get('participants', []):
+            pid = participant['@id'].split('/')
+            partDict[participant['@id']] = f"{pid[0]}/{numP}/{pid[2] if len(pid) > 2 else ''}"
+            partIds.append(partDict[participant['@id']])
+            numP += 1
+    if v: print("done.")
+
+    if v: print("Resolving references...", end='')
+    remap_ids(schemaJson, json_index, {'entities': entDict, 'events': schemeDict})
+    for entity, newId in zip(schemaJson['entities'], entIds):
+        entity['@id'] = newId
+    for relation, newId in zip(schemaJson['relations'], relIds):
+        relation['@id'] = newId
+    participants = (participant for scheme in schemaJson['events'] for participant in scheme.get('participants', []))
+    for participant, newId in zip(participants, partIds):
+        participant['@id'] = newId
+    if v: print("done.")
+
+    return {'entities': entDict, 'relations': relDict, 'events': schemeDict, 'participants': partDict}
+
+def check_ids(schemaJson):
+    """Validates a schema before its ids are reordered, see sdf.SchemaValidator.
+
+    Only references to entities that do not exist, mistyped fields and
+    missing id fields stop it; other errors, such as a missing
+    children_gate or root, are turned into warnings.
+
+    Parameters:
+    schemaJson (dict): schema in json form
+
+    Returns:
+    problems (list): the warnings found
+
+    Raises:
+    SchemaError: if the ids cannot be reordered, with every problem found
+    """
+    problems = []
+    blocked = False
+    for problem in validate_schema(schemaJson):
+        if problem['severity'] == 'error':
+            if problem['problem'] in ('broken_reference', 'invalid_field') or \
+                    (problem['problem'] == 'missing_field' and problem.get('field', '@id') in id_fields):
+                blocked = True
+            else:
+                problem = dict(problem, severity='warning')
+        problems.append(problem)
+    if blocked:
+        raise SchemaError(problems)
+    return problems
+
+def print_problems(input_file, problems):
+    """Prints the problems of a file, one per line."""
+    for problem in problems:
+        print(f"{input_file}: {problem['severity']}: {problem['path']}: {problem['message']}")
+
+def write_json(obj, path):
+    """Writes an object as indented JSON, encoding it piece by piece instead of into one string.
+
+    The file is replaced only once it is completely written.
+
+    Parameters:
+    obj: object to write
+    path (str): path to the file
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, "w") as outf:
+            outf.writelines(json.JSONEncoder(indent = 4).iterencode(obj))
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+def reorder_file(input_file, check = False, v = 0):
+    """Reorders the ids of a JSON file in place.
+
+    Parameters:
+    input_file (str): path to the JSON file
+    check (bool): only work out the new ids, leaving the file as it is
+    v (int): verbose output
+
+    Returns:
+    changed (dict): old id to new id of the ids that change, by entities, relations, events and participants
+    seconds (float): time taken
+    warnings (list): problems of the schema that do not stop it from being reordered, see check_ids
+
+    Raises:
+    SchemaError: if the ids cannot be reordered, e.g. participants refer to entities it does not define
+    """
+    start = time.perf_counter()
+    if v: print("Reading file...", end='')
+    with open(input_file, encoding='utf8') as f:
+        schemaJson = json.load(f)
+    if v: print("done.")
+
+    if v: print("Validating...", end='')
+    warnings = check_ids(schemaJson)
+    if v: print("done.")
+
+    idMaps = reorder_schema(schemaJson, v)
+
+    if not check:
+        if v: print("Writing...", end='')
+        write_json(schemaJson, input_file)
+        if v: print("done.")
+
+    changed = {key: {old: new for old, new in idMap.items() if old != new} for key, idMap in idMaps.items()}
+    return changed, time.perf_counter() - start, warnings
+
+def reorder_batch(files, check = False, workers = None):
+    """Reorders files in parallel and prints how many ids changed in each.
+
+    Parameters:
+    files (list): paths to JSON files
+    check (bool): only report the changes, leaving the files as they are
+    workers (int): number of processes, defaults to the number of CPUs
+
+    Returns:
+    failed (int): number of files that could not be reordered
+    """
+    results = {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(reorder_file, path, check): path for path in files}
+        for future in as_completed(futures):
+            try:
+                results[futures[future]] = future.result()
+            except Exception as e:
+                results[futures[future]] = e
+    total = time.perf_counter() - start
+
+    failed = 0
+    width = max(len(path) for path in files)
+    keys = ('entities', 'relations', 'events', 'participants')
+    print(f"{'file':<{width}}" + ''.join(f'{key:>14}' for key in keys) + f"{'seconds':>10}")
+    for path in files:
+        result = results[path]
+        if isinstance(result, Exception):
+            failed += 1
+            print(f"{path:<{width}}  ERROR: {result!r}")
+        else:
+            changed, seconds, _ = result
+            print(f"{path:<{width}}" + ''.join(f'{len(changed[key]):>14}' for key in keys) + f"{seconds:>10.3f}")
+    for path in files:
+        result = results[path]
+        if isinstance(result, SchemaError):
+            print_problems(path, result.problems)
+        elif not isinstance(result, Exception):
+            print_problems(path, result[2])
+    action = 'Checked' if check else 'Reordered'
+    print(f"{action} {len(files) - failed} of {len(files)} files in {total:.3f} seconds.")
+    return failed
+
 def main(argv):
     h = """
     reorder.py
@@ -23,20 +236,30 @@ def main(argv):
     [ Entities/00000, Entities/00001, Entities/00002 ]
     And resolve all references to the entities in Participant lists.
 
+    Use -b to reorder every JSON file in a directory, or every file
+    matching a glob pattern, in parallel. Use -c to only print the ids
+    that would change, without rewriting any file.
+
     *note: if it does not read your file, try putting your file path in
     double quotes, e.g. "path\\to\\file" on Windows.
     ======================================================================
     -h      help
     -i      input file
+    -b      directory or glob pattern of input files, instead of -i
     
     Optionals:
+    -c      check, i.e. report the id remapping without rewriting
+    -j      number of processes for -b, default the number of CPUs
     -v      verbose output, i.e. prints which step the program is on
     """
     # obtain arguments
     input_file = ''
+    batch = ''
+    check = False
+    workers = None
     v = 0
     try:
-        opts, _ = getopt.getopt(argv, "hi:v", ["help", "inputfile=", "verbose"])
+        opts, _ = getopt.getopt(argv, "hi:b:cj:v", ["help", "inputfile=", "batch=", "check", "jobs=", "verbose"])
     except getopt.GetoptError:
         print(h)
         sys.exit(2)
@@ -46,9 +269,25 @@ def main(argv):
             sys.exit()
         if opt in ("-i", "--inputfile"):
             input_file = arg
+        elif opt in ("-b", "--batch"):
+            batch = arg
+        elif opt in ("-c", "--check"):
+            check = True
+        elif opt in ("-j", "--jobs"):
+            workers = int(arg)
         elif opt in ("-v", "--verbose"):
             v = 1
 
+    if batch:
+        pattern = os.path.join(batch, '*.json') if os.path.isdir(batch) else batch
+        files = sorted(path for path in glob.glob(pattern) if path.endswith('.json'))
+        if not files:
+            print(f"ERROR: no JSON files found in {batch}.")
+            sys.exit(2)
+        if reorder_batch(files, check, workers):
+            sys.exit(1)
+        return
+
     # exit with help
     if input_file == '':
         print(h)
@@ -61,81 +300,18 @@ def main(argv):
         sys.exit(2)
 
     # reorder listed files
-    file = input_file[:-5]
-    if v: print("Reading file...", end='')
-    with open(f'{file}.json', encoding='utf8') as f:
-        schema_string = f.read()
-    schemaJson = json.loads(schema_string)
-    if v: print("done.")
-
-    if v: print("Reordering entities...", end='')
-    entities = schemaJson['entities']
-    numE = 0
-    entDict = {}
-    for entity in entities:
-        newId, numE, entDict = NewId(entity['@id'], numE, entDict)
-        entity['@id'] = newId
-    if v: print("done.")
-
-    if v: print("Resolving entity references in relations...", end='')
-    relations = schemaJson['relations']
-    numR = 30000
-    for relation in relations:
-        relation['relationSubject'] = entDict[relation['relationSubject']]
-        relation['relationObject'] = entDict[relation['relationObject']]
-        rid = relation['@id'].split('/')
-        relation['@id'] = f'{rid[0]}/{numR}/'
-        numR += 1
-    if v: print("done.")
-
-    if v: print("Reordering events and participants, resolving entity references...", end='')
-    schema = schemaJson['events']
-    numP = 20000
-    numS = 10000
-    schemeDict = {}
-    for scheme in schema:
-        if scheme['@id'] not in schemeDict:
-            newId, numS, schemeDict = NewId(scheme['@id'], numS, schemeDict)
-            scheme['@id'] = newId
-        else:
-            scheme['@id'] = schemeDict[scheme['@id']]
-
-        # children
-        if 'children' in scheme:
-            for child in scheme['children']:
-                if child['child'] not in schemeDict:
-                    newId, numS, schemeDict = NewId(child['child'], numS, schemeDict)
-                    child['child'] = newId
-                else:
-                    child['child'] = schemeDict[child['child']]
-                
-                # child outlinks
-                if 'outlinks' in child:
-                    for i in range(len(child['outlinks'])):
-                        if child['outlinks'][i] not in schemeDict:
-                            newId, numS, schemeDict = NewId(child['outlinks'][i], numS, schemeDict)
-                            child['outlinks'][i] = newId
-                        else:
-                            child['outlinks'][i] = schemeDict[child['outlinks'][i]]
-
-        # reorder participants and use new entity ID's
-        if 'participants' in scheme:
-            for participant in scheme['participants']:
-                pid = participant['@id'].split('/')
-                participant['@id'] = f"{pid[0]}/{numP}/{pid[2] if len(pid) > 2 else ''}"
-                numP += 1
-
-                participant['entity'] = entDict[participant['entity']]
-    if v: print("done.")
-
-    if v: print("Writing...", end='')
-    schemaJson['events'] = schema
-    schemaJson['entities'] = entities
-    schemaJson['relations'] = relations
-    jsonObject = json.dumps(schemaJson, indent = 4)
-    with open(f"{file}.json", "w") as outf:
-        outf.write(jsonObject)
-    if v: print("done.")
+    try:
+        changed, _, warnings = reorder_file(input_file, check, v)
+    except SchemaError as e:
+        print(f"ERROR: {input_file} was not reordered.")
+        print_problems(input_file, e.problems)
+        sys.exit(1)
+    print_problems(input_file, warnings)
+    if check:
+        for idMap in changed.values():
+            for old, new in idMap.items():
+                print(f"{old} -> {new}")
+        print(f"{sum(len(idMap) for idMap in changed.values())} ids would change.")
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
\ No newline at end of file
+    main(sys.argv[1:])
@@ -0,0 +1,111 @@
+import glob
+import json
+import getopt, os, sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from sdf import validate_schema
+
+
+def validate_file(input_file):
+    """Checks the structure of a JSON file, see sdf.SchemaValidator.
+
+    Parameters:
+    input_file (str): path to the JSON file
+
+    Returns:
+    problems (list): every problem found, a single error if the file is not JSON
+    seconds (float): time taken to check the parsed file
+    """
+    try:
+        with open(input_file, encoding='utf8') as f:
+            schemaJson = json.load(f)
+    except ValueError as e:
+        return [{'severity': 'error', 'problem': 'invalid_json', '@id': None, 'path': '', 'message': str(e)}], 0.0
+    start = time.perf_counter()
+    problems = validate_schema(schemaJson)
+    return problems, time.perf_counter() - start
+
+def print_problems(input_file, problems, seconds):
+    """Prints the problems of a file, one per line, and how many there are."""
+    for problem in problems:
+        print(f"{input_file}: {problem['severity']}: {problem['path']}: {problem['message']}")
+    errors = sum(1 for problem in problems if problem['severity'] == 'error')
+    print(f"{input_file}: {errors} error(s), {len(problems) - errors} warning(s) in {seconds:.3f} seconds.")
+
+def main(argv):
+    h = """
+    validate.py
+    ======================================================================
+    Input the JSON file you want to check.
+    This script checks that a JSON file can be imported into SCI 2.0
+    before it is uploaded, in a single pass over its ids.
+
+    Errors stop the graph from being built: missing or mistyped fields,
+    events with children but no children_gate, participants or
+    relations referring to entities that do not exist, and no event
+    with children or participants to be the root.
+    Warnings are shown anyway: children and outlinks referring to events
+    that do not exist, duplicate @ids, and cycles of children and
+    outlinks.
+
+    Use -b to check every JSON file in a directory, or every file
+    matching a glob pattern. Exits with 1 if a file has errors.
+
+    *note: if it does not read your file, try putting your file path in
+    double quotes, e.g. "path\\to\\file" on Windows.
+    ======================================================================
+    -h      help
+    -i      input file
+    -b      directory or glob pattern of input files, instead of -i
+
+    Optionals:
+    -s      strict, i.e. also exit with 1 if a file has warnings
+    """
+    # obtain arguments
+    input_file = ''
+    batch = ''
+    strict = False
+    try:
+        opts, _ = getopt.getopt(argv, "hi:b:s", ["help", "inputfile=", "batch=", "strict"])
+    except getopt.GetoptError:
+        print('error')
+        print(h)
+        sys.exit(2)
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print(h)
+            sys.exit()
+        if opt in ("-i", "--inputfile"):
+            input_file = arg
+        elif opt in ("-b", "--batch"):
+            batch = arg
+        elif opt in ("-s", "--strict"):
+            strict = True
+
+    if batch:
+        pattern = os.path.join(batch, '*.json') if os.path.isdir(batch) else batch
+        files = sorted(path for path in glob.glob(pattern) if path.endswith('.json'))
+        if not files:
+            print(f"ERROR: no JSON files found in {batch}.")
+            sys.exit(2)
+    elif input_file == '':
+        # exit with help
+        print(h)
+        sys.exit(2)
+    else:
+        files = [input_file]
+
+    failed = 0
+    for path in files:
+        problems, seconds = validate_file(path)
+        print_problems(path, problems, seconds)
+        if any(problem['severity'] == 'error' or strict for problem in problems):
+            failed += 1
+    if len(files) > 1:
+        print(f"{len(files) - failed} of {len(files)} files passed.")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
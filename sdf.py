@@ -0,0 +1,508 @@
+import bisect
+import gc
+from contextlib import contextmanager
+
+# ===============================================
+# sdf.py
+# ------------
+# indexed model of SDF schema JSON, shared by
+# the app and the scripts
+# ===============================================
+
+# kinds of ids and the parts of the index holding where they are defined and referenced
+id_kinds = {
+    'entities': ('entities', 'relationSubject', 'relationObject', 'participants'),
+    'relations': ('relations',),
+    'events': ('events', 'children', 'outlinks'),
+    'participants': ('participantIds',)
+}
+
+@contextmanager
+def paused_gc():
+    """Pauses the cyclic garbage collector, then puts it back the way it was.
+
+    Creating or loading many small objects, e.g. indexes and parsed graphs,
+    is much faster without it running.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def new_json_index():
+    """Returns an empty index, to be filled by index_entity, index_relation and index_event."""
+    return {key: {} for key in ('entities', 'relations', 'relationSubject', 'relationObject', 'events',
+                                'names', 'children', 'outlinks', 'participants', 'participantIds')}
+
+def index_entity(json_index, e, entity):
+    """Indexes the entity at position e of the entities list."""
+    json_index['entities'].setdefault(entity['@id'], []).append(e)
+
+def index_relation(json_index, r, relation):
+    """Indexes the relation at position r of the relations list."""
+    json_index['relations'].setdefault(relation['@id'], []).append(r)
+    json_index['relationSubject'].setdefault(relation['relationSubject'], []).append(r)
+    json_index['relationObject'].setdefault(relation['relationObject'], []).append(r)
+
+def index_event(json_index, s, scheme):
+    """Indexes the event at position s of the events list, with its participants, children and outlinks."""
+    json_index['events'].setdefault(scheme['@id'], []).append(s)
+    if 'name' in scheme:
+        json_index['names'].setdefault(scheme['name'], []).append(s)
+    for p, participant in enumerate(scheme.get('participants', [])):
+        json_index['participants'].setdefault(participant['entity'], []).append((s, p))
+        json_index['participantIds'].setdefault(participant['@id'], []).append((s, p))
+    for c, child in enumerate(scheme.get('children', [])):
+        json_index['children'].setdefault(child['child'], []).append((s, c))
+        for o, outlink in enumerate(child.get('outlinks', [])):
+            json_index['outlinks'].setdefault(outlink, []).append((s, c, o))
+
+def index_json(schema_json):
+    """Indexes where every id is defined and referenced in the schema JSON, in a single pass.
+
+    Locations are positions in the JSON lists, e.g. (event, child) for
+    schema_json['events'][event]['children'][child].
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+
+    Returns:
+    json_index (dict): {'entities': {@id: [entity]}, 'relations': {@id: [relation]},
+                        'relationSubject': {@id: [relation]}, 'relationObject': {@id: [relation]},
+                        'events': {@id: [event]}, 'names': {name: [event]},
+                        'children': {@id: [(event, child)]}, 'outlinks': {@id: [(event, child, outlink)]},
+                        'participants': {entity @id: [(event, participant)]},
+                        'participantIds': {@id: [(event, participant)]}}
+    """
+    json_index = new_json_index()
+    with paused_gc():
+        for e, entity in enumerate(schema_json.get('entities', [])):
+            index_entity(json_index, e, entity)
+        for r, relation in enumerate(schema_json.get('relations', [])):
+            index_relation(json_index, r, relation)
+        for s, scheme in enumerate(schema_json.get('events', [])):
+            index_event(json_index, s, scheme)
+    return json_index
+
+def rename_event_name(json_index, s, old_name, new_name):
+    """Moves the event at position s of the events list to a new name in the index, keeping positions in order."""
+    positions = json_index['names'].get(old_name, [])
+    if s in positions:
+        positions.remove(s)
+        if not positions:
+            del json_index['names'][old_name]
+    bisect.insort(json_index['names'].setdefault(new_name, []), s)
+
+def find_event(schema_json, json_index, ref):
+    """Finds the event a child refers to, by @id or else by name.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json
+    ref (str): @id or name of the event
+
+    Returns:
+    scheme (dict): the event, the last one defined under an @id or the first one under a name, or None
+    """
+    if ref in json_index['events']:
+        return schema_json['events'][json_index['events'][ref][-1]]
+    if ref in json_index['names']:
+        return schema_json['events'][json_index['names'][ref][0]]
+    return None
+
+# old value of fields that did not exist, see set_field
+missing = object()
+
+def set_field(schema_json, path, value, changes, undo=None):
+    """Sets a field of the schema JSON and records the change.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    path (list): keys and positions leading to the field
+    value: new value
+    changes (list): collects {path, value}
+    undo (list): if given, collects (path, old value) so the change can be reverted, see revert_fields
+
+    """
+    target = schema_json
+    for step in path[:-1]:
+        target = target[step]
+    if undo is not None:
+        undo.append((path, target[path[-1]] if isinstance(target, list) or path[-1] in target else missing))
+    target[path[-1]] = value
+    changes.append({'path': path, 'value': value})
+
+def revert_fields(schema_json, undo):
+    """Puts back the fields changed by set_field, latest first."""
+    for path, value in reversed(undo):
+        target = schema_json
+        for step in path[:-1]:
+            target = target[step]
+        if value is missing:
+            target.pop(path[-1], None)
+        else:
+            target[path[-1]] = value
+
+def remap_ids(schema_json, json_index, id_maps, changes=None, undo=None):
+    """Renames ids wherever they are defined or referenced, visiting only their indexed locations.
+
+    Every location is looked up before anything is renamed, so maps may
+    swap or chain ids, e.g. {a: b, b: c}.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    json_index (dict): index over schema_json, updated to the new ids
+    id_maps (dict): old id to new id, by kind of id, see id_kinds
+    changes (list): if given, collects {path, value} for every changed field in the JSON
+    undo (list): if given, collects the old values, see set_field
+
+    """
+    if changes is None:
+        changes = []
+
+    def update(path, value):
+        set_field(schema_json, path, value, changes, undo)
+
+    for kind, id_map in id_maps.items():
+        id_map = {old: new for old, new in id_map.items() if old != new}
+        if not id_map:
+            continue
+        for old_id, new_id in id_map.items():
+            if kind == 'entities':
+                for e in json_index['entities'].get(old_id, []):
+                    update(['entities', e, '@id'], new_id)
+                for relation_key in ('relationSubject', 'relationObject'):
+                    for r in json_index[relation_key].get(old_id, []):
+                        update(['relations', r, relation_key], new_id)
+                for s, p in json_index['participants'].get(old_id, []):
+                    update(['events', s, 'participants', p, 'entity'], new_id)
+            elif kind == 'relations':
+                for r in json_index['relations'].get(old_id, []):
+                    update(['relations', r, '@id'], new_id)
+            elif kind == 'events':
+                for s in json_index['events'].get(old_id, []):
+                    update(['events', s, '@id'], new_id)
+                for s, c in json_index['children'].get(old_id, []):
+                    update(['events', s, 'children', c, 'child'], new_id)
+                for s, c, o in json_index['outlinks'].get(old_id, []):
+                    update(['events', s, 'children', c, 'outlinks', o], new_id)
+            elif kind == 'participants':
+                for s, p in json_index['participantIds'].get(old_id, []):
+                    update(['events', s, 'participants', p, '@id'], new_id)
+
+        # re-key the index, taking out every old entry first
+        for key in id_kinds[kind]:
+            moved = [(id_map[old_id], json_index[key].pop(old_id)) for old_id in id_map if old_id in json_index[key]]
+            for new_id, locations in moved:
+                json_index[key].setdefault(new_id, []).extend(locations)
+
+def set_children_gates(schema_json, gate):
+    """Sets the children_gate of every event with children.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+    gate (str): children gate, e.g. or
+
+    """
+    for scheme in schema_json['events']:
+        if 'children' in scheme:
+            scheme['children_gate'] = gate
+
+# fields the graph cannot be built without, by kind of item, with the type they must have if it matters
+required_fields = {
+    'entity': {'@id': str, 'name': None},
+    'relation': {'@id': str, 'name': None, 'relationSubject': str, 'relationPredicate': None, 'relationObject': str},
+    'event': {'@id': str, 'name': str},
+    'participant': {'@id': str, 'entity': str, 'roleName': None},
+    'child': {'child': str, 'comment': None, 'outlinks': list}
+}
+
+# message of a schema without a root event to show
+no_root_message = 'Root node not found: a root is an event with children or participants that is not a child or outlink'
+
+def format_path(path):
+    """Writes a location in the schema JSON, e.g. ('events', 3, 'children', 0) as events[3].children[0]."""
+    text = ''
+    for step in path:
+        text += f'[{step}]' if isinstance(step, int) else (f'.{step}' if text else step)
+    return text
+
+class SchemaError(ValueError):
+    """Schema JSON whose graph cannot be built.
+
+    Attributes:
+    problems (list): every problem found, see SchemaValidator
+    """
+
+    def __init__(self, problems):
+        self.problems = problems
+        errors = [problem for problem in problems if problem['severity'] == 'error']
+        first = errors[0] if errors else problems[0]
+        super().__init__(f"{len(errors)} error(s) in the schema, first at {first['path']}: {first['message']}")
+
+    def __reduce__(self):
+        # rebuilt from its problems, e.g. when raised in a worker process
+        return SchemaError, (self.problems,)
+
+class SchemaValidator:
+    """Checks schema items in the order they are read, in a single pass.
+
+    Fields are checked as items are added. Ids are collected into sets, so
+    references, duplicate ids and cycles of the child/outlink graph are
+    checked in linear time by finish.
+
+    Problems are dicts of {'severity', 'problem', '@id', 'path', 'message'},
+    cycles also having the 'cycle' of ids. Errors stop the graph from being
+    built: missing_field, invalid_field, missing_children_gate, a
+    broken_reference to an entity, and no_root when no event has children
+    or participants. Warnings are drawn anyway: a
+    broken_reference to an event, shown as a bare child, duplicate_id, whose
+    items are merged, and cycle. Problems with a field of an item have the
+    'field' too.
+    """
+
+    def __init__(self):
+        self.problems = []
+        # id to the location it is first defined at
+        self.defined = {}
+        self.entity_ids = set()
+        self.event_ids = set()
+        # (id, location, what refers to it, whether it must be an entity)
+        self.references = []
+        # child/outlink graph, id to the ids of its children and outlinks
+        self.successors = {}
+        # whether an event has children or participants, which any root needs
+        self.has_parent = False
+        self.positions = {'entities': 0, 'relations': 0, 'events': 0}
+        self._required = {kind: fields.keys() for kind, fields in required_fields.items()}
+        self._typed = {kind: [(field, field_type) for field, field_type in fields.items() if field_type is not None]
+                       for kind, fields in required_fields.items()}
+
+    def report(self, severity, problem, item_id, path, message):
+        """Records a problem.
+
+        Parameters:
+        severity (str): error or warning
+        problem (str): kind of problem, e.g. broken_reference
+        item_id (str): id of the item concerned, if any
+        path (tuple): location of the item in the schema JSON, see format_path
+        message (str): what is wrong
+
+        """
+        self.problems.append({'severity': severity, 'problem': problem, '@id': item_id,
+                              'path': format_path(path), 'message': message})
+
+    def check_fields(self, item, kind, path):
+        """Checks an item has the fields its kind requires.
+
+        Returns:
+        bool: whether the item can be added to the graph
+        """
+        if type(item) is dict and item.keys() >= self._required[kind]:
+            for field, field_type in self._typed[kind]:
+                if not isinstance(item[field], field_type):
+                    break
+            else:
+                return True
+        if not isinstance(item, dict):
+            self.report('error', 'invalid_field', None, path, f'{kind} is not an object')
+            return False
+        for field, field_type in required_fields[kind].items():
+            if field not in item:
+                self.report('error', 'missing_field', item.get('@id'), path, f'{kind} has no {field}')
+                self.problems[-1]['field'] = field
+            elif field_type is not None and not isinstance(item[field], field_type):
+                self.report('error', 'invalid_field', item.get('@id'), path,
+                            f'{field} of {kind} is not a {field_type.__name__}')
+                self.problems[-1]['field'] = field
+        return False
+
+    def define(self, item_id, path):
+        """Records where an id is defined, reporting it if it already was."""
+        if item_id in self.defined:
+            self.report('warning', 'duplicate_id', item_id, path,
+                        f'{item_id} is already defined at {format_path(self.defined[item_id])}')
+        else:
+            self.defined[item_id] = path
+
+    def _next(self, key):
+        position = self.positions[key]
+        self.positions[key] += 1
+        return (key, position)
+
+    def add_entity(self, entity):
+        """Checks an entity.
+
+        Returns:
+        bool: whether the entity can be added to the graph
+        """
+        path = self._next('entities')
+        if not self.check_fields(entity, 'entity', path):
+            return False
+        self.define(entity['@id'], path)
+        self.entity_ids.add(entity['@id'])
+        return True
+
+    def add_relation(self, relation):
+        """Checks a relation.
+
+        Returns:
+        bool: whether the relation can be added to the graph
+        """
+        path = self._next('relations')
+        if not self.check_fields(relation, 'relation', path):
+            return False
+        self.define(relation['@id'], path)
+        self.references.append((relation['relationSubject'], path, 'relationSubject', True))
+        self.references.append((relation['relationObject'], path, 'relationObject', True))
+        return True
+
+    def add_event(self, event):
+        """Checks an event with its participants and children.
+
+        Returns:
+        bool: whether the event can be added to the graph
+        """
+        path = self._next('events')
+        if not self.check_fields(event, 'event', path):
+            return False
+        valid = True
+        event_id = event['@id']
+        self.define(event_id, path)
+        self.event_ids.add(event_id)
+        references = self.references
+
+        participants = event.get('participants', [])
+        if not isinstance(participants, list):
+            self.report('error', 'invalid_field', event_id, path, 'participants of event is not a list')
+            self.problems[-1]['field'] = 'participants'
+            participants = []
+            valid = False
+        for p, participant in enumerate(participants):
+            participant_path = path + ('participants', p)
+            if not self.check_fields(participant, 'participant', participant_path):
+                valid = False
+                continue
+            self.define(participant['@id'], participant_path)
+            references.append((participant['entity'], participant_path, 'participant', True))
+        if participants or event.get('children'):
+            self.has_parent = True
+
+        if 'children' not in event:
+            return valid
+        if 'children_gate' not in event:
+            self.report('error', 'missing_children_gate', event_id, path, 'event has children but no children_gate')
+            self.problems[-1]['field'] = 'children_gate'
+            valid = False
+        children = event['children']
+        if not isinstance(children, list):
+            self.report('error', 'invalid_field', event_id, path, 'children of event is not a list')
+            self.problems[-1]['field'] = 'children'
+            return False
+        successors = self.successors.setdefault(event_id, [])
+        for c, child in enumerate(children):
+            child_path = path + ('children', c)
+            if not self.check_fields(child, 'child', child_path):
+                valid = False
+                continue
+            child_id = child['child']
+            references.append((child_id, child_path, 'child', False))
+            successors.append(child_id)
+            for o, outlink in enumerate(child['outlinks']):
+                if not isinstance(outlink, str):
+                    self.report('error', 'invalid_field', child_id, child_path + ('outlinks', o),
+                                'outlink is not a str')
+                    self.problems[-1]['field'] = 'outlinks'
+                    valid = False
+                    continue
+                references.append((outlink, child_path + ('outlinks', o), 'outlink', False))
+                self.successors.setdefault(child_id, []).append(outlink)
+        return valid
+
+    def find_cycles(self):
+        """Reports the cycles of the child/outlink graph, one per edge closing a cycle, with an iterative depth-first search."""
+        state = {}
+        for start in self.successors:
+            if start in state:
+                continue
+            state[start] = 1
+            path = [start]
+            stack = [iter(self.successors[start])]
+            while stack:
+                for target in stack[-1]:
+                    if target not in state:
+                        state[target] = 1
+                        path.append(target)
+                        stack.append(iter(self.successors.get(target, ())))
+                        break
+                    if state[target] == 1:
+                        cycle = path[path.index(target):]
+                        self.report('warning', 'cycle', target, self.defined.get(target, ()),
+                                    'children and outlinks lead back to ' + ' -> '.join(cycle + [target]))
+                        self.problems[-1]['cycle'] = cycle
+                else:
+                    state[path.pop()] = 2
+                    stack.pop()
+
+    def finish(self, schema_json=None):
+        """Checks references against the ids defined, and looks for cycles.
+
+        Parameters:
+        schema_json (dict): if given, the schema read, checked to have its lists of entities, relations and events
+
+        Returns:
+        problems (list): every problem found
+        """
+        if schema_json is not None:
+            for key in ('entities', 'relations', 'events'):
+                if not isinstance(schema_json.get(key), list):
+                    self.report('error', 'missing_field', schema_json.get('@id'), (key,),
+                                f'schema has no list of {key}')
+            if isinstance(schema_json.get('events'), list) and not self.has_parent:
+                self.report('error', 'no_root', schema_json.get('@id'), ('events',), no_root_message)
+        entity_ids = self.entity_ids
+        event_ids = self.event_ids
+        for ref, path, referrer, is_entity in self.references:
+            if is_entity:
+                if ref not in entity_ids:
+                    self.report('error', 'broken_reference', ref, path, f'{referrer} {ref} is not an entity')
+            elif ref not in event_ids:
+                self.report('warning', 'broken_reference', ref, path, f'{referrer} {ref} is not an event')
+        self.find_cycles()
+        return self.problems
+
+def validate_schema(schema_json):
+    """Checks the structure of the schema JSON in a single pass, see SchemaValidator.
+
+    Parameters:
+    schema_json (dict): entire schema in json form
+
+    Returns:
+    problems (list): every problem found
+    """
+    validator = SchemaValidator()
+    if not isinstance(schema_json, dict):
+        validator.report('error', 'invalid_field', None, (), 'schema is not an object')
+        return validator.problems
+    add_item = {'entities': validator.add_entity, 'relations': validator.add_relation, 'events': validator.add_event}
+    with paused_gc():
+        for key in ('entities', 'relations', 'events'):
+            items = schema_json.get(key)
+            if isinstance(items, list):
+                for item in items:
+                    add_item[key](item)
+        return validator.finish(schema_json)
+
+def check_schema(schema_json):
+    """Validates the schema JSON, raising SchemaError if its graph cannot be built.
+
+    Returns:
+    problems (list): the warnings found, see SchemaValidator
+    """
+    problems = validate_schema(schema_json)
+    if any(problem['severity'] == 'error' for problem in problems):
+        raise SchemaError(problems)
+    return problems
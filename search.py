@@ -0,0 +1,147 @@
+import re
+
+# ===============================================
+# search.py
+# ------------
+# inverted token index over the text fields of
+# events and entities
+# ===============================================
+
+# fields searched, by kind of item; each has a bit in the postings
+event_fields = ('name', 'description', 'comment', 'qlabel', 'qnode', 'ta1explanation')
+entity_fields = ('name',)
+field_bits = {field: 1 << i for i, field in enumerate(event_fields)}
+
+token_pattern = re.compile(r'[^\W_]+')
+
+def tokenize(value):
+    """Splits a field value into lowercase words, e.g. kairos:Event_10002 into kairos, event and 10002.
+
+    Parameters:
+    value: field value; lists are split item by item and other non-strings have no words
+
+    Returns:
+    list: words, in order
+    """
+    if isinstance(value, list):
+        return [token for item in value for token in tokenize(item)]
+    if not isinstance(value, str):
+        return []
+    return token_pattern.findall(value.lower())
+
+class SearchIndex:
+    """Inverted index from words to the nodes whose searched fields contain them.
+
+    Attributes:
+    texts (dict): {node_id: {field: value}} of the indexed fields
+    postings (dict): {word: {node_id: bits of the fields containing it}}
+    """
+
+    def __init__(self):
+        self.texts = {}
+        self.postings = {}
+
+    def set_field(self, node_id, field, value):
+        """Indexes the value of a field of a node, replacing its previous value.
+
+        Parameters:
+        node_id (str): node id
+        field (str): field name, one of event_fields
+        value: field value
+
+        """
+        texts = self.texts.setdefault(node_id, {})
+        if field in texts:
+            if texts[field] == value:
+                return
+            self._unpost(node_id, field, texts[field])
+        texts[field] = value
+        bit = field_bits[field]
+        for token in tokenize(value):
+            by_node = self.postings.setdefault(token, {})
+            by_node[node_id] = by_node.get(node_id, 0) | bit
+
+    def _unpost(self, node_id, field, value):
+        bit = field_bits[field]
+        for token in set(tokenize(value)):
+            by_node = self.postings.get(token)
+            if by_node is None or node_id not in by_node:
+                continue
+            by_node[node_id] &= ~bit
+            if not by_node[node_id]:
+                del by_node[node_id]
+                if not by_node:
+                    del self.postings[token]
+
+    def add_entity(self, entity):
+        """Indexes the searched fields of an entity."""
+        for field in entity_fields:
+            if field in entity:
+                self.set_field(entity['@id'], field, entity[field])
+
+    def add_event(self, event):
+        """Indexes the searched fields of an event and the comments its children are shown with."""
+        for field in event_fields:
+            if field in event:
+                self.set_field(event['@id'], field, event[field])
+        for child in event.get('children', []):
+            if 'comment' in child:
+                self.set_field(child['child'], 'comment', child['comment'])
+
+    def remove_node(self, node_id):
+        """Drops every field of a node."""
+        for field, value in self.texts.pop(node_id, {}).items():
+            self._unpost(node_id, field, value)
+
+    def reindex_node(self, schema_json, json_index, node_id):
+        """Indexes the fields of a node again from every place the schema defines or references it.
+
+        Places are visited in the order the graph is built in, so fields set
+        in several places end up with the value the graph shows.
+
+        Parameters:
+        schema_json (dict): entire schema in json form
+        json_index (dict): index over schema_json
+        node_id (str): node id
+
+        """
+        self.remove_node(node_id)
+        for e in json_index['entities'].get(node_id, []):
+            self.add_entity(schema_json['entities'][e])
+        events = schema_json['events']
+        for s in sorted(set(json_index['events'].get(node_id, [])) |
+                        {s for s, _ in json_index['children'].get(node_id, [])}):
+            event = events[s]
+            if event['@id'] == node_id:
+                for field in event_fields:
+                    if field in event:
+                        self.set_field(node_id, field, event[field])
+            for child in event.get('children', []):
+                if child['child'] == node_id and 'comment' in child:
+                    self.set_field(node_id, 'comment', child['comment'])
+
+    def search(self, query):
+        """Finds the nodes whose searched fields contain every word of a query.
+
+        Parameters:
+        query (str): words to look for, in any case and order
+
+        Returns:
+        list: (node_id, matched fields) pairs, nodes matching more words in their name
+              or comment first, then by id
+        """
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        by_node = [self.postings.get(token, {}) for token in tokens]
+        by_node.sort(key=len)
+        matches = by_node[0]
+        for other in by_node[1:]:
+            matches = {node_id: bits | other[node_id] for node_id, bits in matches.items() if node_id in other}
+            if not matches:
+                return []
+        title_bits = field_bits['name'] | field_bits['comment']
+        ranked = sorted(matches, key=lambda node_id: (
+            -sum(1 for postings in by_node if postings[node_id] & title_bits), node_id))
+        return [(node_id, [field for field in event_fields if matches[node_id] & field_bits[field]])
+                for node_id in ranked]
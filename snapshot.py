@@ -0,0 +1,329 @@
+import atexit
+import json
+import marshal
+import mmap
+import os
+import pickle
+import re
+import sys
+import tempfile
+import threading
+import time
+
+from sdf import paused_gc
+from search import SearchIndex
+from workspace import Workspace
+
+# ===============================================
+# snapshot.py
+# ------------
+# workspaces saved to disk, reopened through
+# memory mapping without parsing them again
+# ===============================================
+
+# start of every snapshot file
+magic = b'SCIWSNAP'
+# bumped when what is stored changes, so snapshots written by older versions are not read
+format_version = 2
+# marshal data only loads on the Python version that wrote it
+python_version = f'{sys.implementation.name}-{sys.version_info[0]}.{sys.version_info[1]}-{marshal.version}'
+
+# parts of a snapshot and the workspace attributes each one holds; edges share their objects with the edge index
+section_attributes = {
+    'schema': ('schema_json',),
+    'json_index': ('json_index',),
+    'nodes': ('nodes',),
+    'edges': ('edges', 'edge_index'),
+    'search': ('search_index',),
+    'layouts': ('layouts',)
+}
+attribute_sections = {attribute: section for section, attributes in section_attributes.items()
+                      for attribute in attributes}
+
+workspace_id_pattern = re.compile(r'[A-Za-z0-9_-]{1,64}')
+
+def encode_section(workspace, section):
+    """Serializes a part of a workspace.
+
+    Builtin values are written with marshal, the fastest to load, and
+    nodes and edges with pickle.
+
+    Parameters:
+    workspace (Workspace): workspace to snapshot
+    section (str): part of the workspace, see section_attributes
+
+    Returns:
+    data (bytes): serialized part, or None if the workspace does not have it
+    codec (str): marshal or pickle
+    """
+    values = [getattr(workspace, attribute) for attribute in section_attributes[section]]
+    if values[0] is None:
+        return None, None
+    if section == 'search':
+        values = [(values[0].texts, values[0].postings)]
+    try:
+        return marshal.dumps(tuple(values)), 'marshal'
+    except ValueError:
+        return pickle.dumps(tuple(values), protocol=pickle.HIGHEST_PROTOCOL), 'pickle'
+
+def decode_section(section, data, codec):
+    """Loads a part of a workspace serialized by encode_section.
+
+    Returns:
+    dict: attribute name to value
+    """
+    with paused_gc():
+        values = marshal.loads(data) if codec == 'marshal' else pickle.loads(data)
+    if section == 'search':
+        search_index = SearchIndex()
+        search_index.texts, search_index.postings = values[0]
+        values = (search_index,)
+    return dict(zip(section_attributes[section], values))
+
+def write_snapshot(path, workspace):
+    """Writes a workspace to a snapshot file, replacing it only once it is completely written.
+
+    The file starts with the magic, the length of a JSON header and the
+    header, giving the offset from its end, length and codec of every
+    section that follows.
+
+    Parameters:
+    path (str): path to the snapshot
+    workspace (Workspace): workspace to write; its lock should be held
+    """
+    sections = {}
+    chunks = []
+    offset = 0
+    for section in section_attributes:
+        data, codec = encode_section(workspace, section)
+        if data is None:
+            sections[section] = None
+            continue
+        sections[section] = [offset, len(data), codec]
+        chunks.append(data)
+        offset += len(data)
+    header = json.dumps({
+        'format': format_version,
+        'python': python_version,
+        'name': workspace.schema_name,
+        'lazy': workspace.subtrees is not None,
+        'sections': sections
+    }).encode('utf-8')
+
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(magic)
+            f.write(len(header).to_bytes(4, 'little'))
+            f.write(header)
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+class MappedWorkspace(Workspace):
+    """Workspace reopened from a memory-mapped snapshot.
+
+    Only the header is read when it is opened; every other attribute is
+    decoded from the mapped file the first time it is used, and the file
+    is closed once they all are.
+
+    Parameters:
+    mapped (mmap): mapped snapshot file
+    header (dict): header of the snapshot, see write_snapshot
+    """
+
+    def __init__(self, mapped, header):
+        # the attributes of the snapshot are set as their sections are decoded, see __getattr__
+        self.schema_name = header['name']
+        self.shared = False
+        self.subtrees = {} if header['lazy'] else None
+        self.lock = threading.RLock()
+        self._mapped = mapped
+        self._sections = {}
+        self._load_lock = threading.Lock()
+        for section, location in header['sections'].items():
+            if location is None:
+                for attribute in section_attributes[section]:
+                    setattr(self, attribute, None)
+            else:
+                self._sections[section] = location
+        if not self._sections:
+            self._close()
+
+    def __getattr__(self, name):
+        section = attribute_sections.get(name)
+        if section is None:
+            raise AttributeError(name)
+        with self._load_lock:
+            if section in self._sections:
+                offset, length, codec = self._sections.pop(section)
+                with memoryview(self._mapped) as view, view[offset:offset + length] as data:
+                    values = decode_section(section, data, codec)
+                for attribute, value in values.items():
+                    setattr(self, attribute, value)
+                if not self._sections:
+                    self._close()
+        return object.__getattribute__(self, name)
+
+    def _close(self):
+        self._mapped.close()
+        self._mapped = None
+
+def open_snapshot(path):
+    """Opens a snapshot file, reading only its header.
+
+    Parameters:
+    path (str): path to the snapshot
+
+    Returns:
+    workspace (MappedWorkspace): the workspace, or None if the file is missing, broken or
+                                 written by another version
+    """
+    try:
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if mapped[:len(magic)] != magic:
+            raise ValueError('not a snapshot')
+        start = len(magic) + 4
+        length = int.from_bytes(mapped[len(magic):start], 'little')
+        header = json.loads(mapped[start:start + length])
+        if header['format'] != format_version or header['python'] != python_version:
+            raise ValueError('snapshot written by another version')
+        for location in header['sections'].values():
+            if location is not None:
+                location[0] += start + length
+                if location[0] + location[1] > len(mapped):
+                    raise ValueError('truncated snapshot')
+    except (ValueError, KeyError, TypeError):
+        mapped.close()
+        return None
+    return MappedWorkspace(mapped, header)
+
+class SnapshotStore:
+    """Directory of workspace snapshots, written in the background and reopened through memory mapping.
+
+    Saving only marks a workspace; it is written once it has not changed
+    for a delay, so a burst of edits is written once.
+
+    Parameters:
+    directory (str): directory to keep snapshots in, only written to by the server
+    delay (float): seconds to wait after the last change before writing a snapshot
+    ttl (float): seconds a snapshot is kept after it was last written or opened, 0 keeps it forever
+    """
+
+    def __init__(self, directory, delay=1.0, ttl=7 * 24 * 3600):
+        self.directory = directory
+        self.delay = delay
+        self.ttl = ttl
+        self._pending = {}
+        self._changed = threading.Condition()
+        os.makedirs(directory, exist_ok=True)
+        self._purge()
+        self._writer = threading.Thread(target=self._run, name='snapshot', daemon=True)
+        self._writer.start()
+        # changes still waiting for the delay are written when the server stops
+        atexit.register(self.flush)
+
+    def _path(self, workspace_id):
+        if not workspace_id_pattern.fullmatch(workspace_id):
+            return None
+        return os.path.join(self.directory, f'{workspace_id}.v{format_version}.snapshot')
+
+    def _purge(self):
+        """Removes the snapshots not written or opened within the ttl."""
+        if not self.ttl:
+            return
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.snapshot'):
+                try:
+                    if now - entry.stat().st_mtime >= self.ttl:
+                        os.remove(entry.path)
+                except OSError:
+                    pass
+
+    def open(self, workspace_id):
+        """Reopens the snapshot of a workspace.
+
+        Parameters:
+        workspace_id (str): id the workspace was saved under
+
+        Returns:
+        workspace (MappedWorkspace): the workspace, or None if it has no snapshot
+        """
+        path = self._path(workspace_id)
+        if path is None:
+            return None
+        with self._changed:
+            if workspace_id in self._pending:
+                return self._pending[workspace_id][0]
+        workspace = open_snapshot(path)
+        if workspace is not None:
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+        return workspace
+
+    def save(self, workspace_id, workspace):
+        """Marks a workspace to be written after the delay.
+
+        Parameters:
+        workspace_id (str): id of the workspace
+        workspace (Workspace): workspace to write
+        """
+        if self._path(workspace_id) is None:
+            return
+        with self._changed:
+            self._pending[workspace_id] = (workspace, time.monotonic() + self.delay)
+            self._changed.notify()
+
+    def remove(self, workspace_id):
+        """Drops the snapshot of a workspace, and any write still pending for it."""
+        path = self._path(workspace_id)
+        if path is None:
+            return
+        with self._changed:
+            self._pending.pop(workspace_id, None)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def _write(self, workspace_id, workspace):
+        with workspace.lock:
+            write_snapshot(self._path(workspace_id), workspace)
+
+    def flush(self):
+        """Writes every pending snapshot now."""
+        with self._changed:
+            pending = self._pending
+            self._pending = {}
+        for workspace_id, (workspace, _) in pending.items():
+            self._write(workspace_id, workspace)
+
+    def _run(self):
+        last_purge = time.monotonic()
+        while True:
+            with self._changed:
+                now = time.monotonic()
+                due = [workspace_id for workspace_id, (_, when) in self._pending.items() if when <= now]
+                if not due:
+                    timeout = min((when for _, when in self._pending.values()), default=now + 3600) - now
+                    self._changed.wait(timeout)
+                    continue
+                writes = [(workspace_id, self._pending.pop(workspace_id)[0]) for workspace_id in due]
+            for workspace_id, workspace in writes:
+                try:
+                    self._write(workspace_id, workspace)
+                except Exception as e:
+                    print(f'Snapshot of workspace {workspace_id} failed: {type(e).__name__}: {e}', file=sys.stderr)
+            if now - last_purge >= 3600:
+                self._purge()
+                last_purge = now
@@ -21,6 +21,11 @@ import 'cytoscape-context-menus/cytoscape-context-menus.css';
 cytoscape.use(klay);
 cytoscape.use(contextMenus);
 
+// children fetched per request when expanding a node
+const SUBTREE_PAGE_SIZE = 500;
+// subtrees with at least this many children are placed by the server layout instead of klay
+const SERVER_LAYOUT_MIN_NODES = 200;
+
 /* Graph view of the data.
    Includes reload, fit to graph, and save current view button.
    Left click to expand node, right click to expand / collapse sidebar of information.
@@ -47,6 +52,7 @@ class Canvas extends React.Component {
 
         this.showSidebar = this.showSidebar.bind(this);
         this.showSubTree = this.showSubTree.bind(this);
+        this.fetchSubTree = this.fetchSubTree.bind(this);
         this.removeSubTree = this.removeSubTree.bind(this);
         this.runLayout = this.runLayout.bind(this);
         this.reloadCanvas = this.reloadCanvas.bind(this);
@@ -54,6 +60,7 @@ class Canvas extends React.Component {
         this.restore = this.restore.bind(this);
         this.fitCanvas = this.fitCanvas.bind(this);
         this.download = this.download.bind(this);
+        this.applyDiff = this.applyDiff.bind(this);
     }
 
     showSidebar(data) {
@@ -61,18 +68,41 @@ class Canvas extends React.Component {
     }
 
     showSubTree(node) {
-        axios.get('/node', {
-            params: {
-                ID: node.id
-            }
-        })
+        this.fetchSubTree(node, {
+            ID: node.id,
+            workspace: this.props.workspace,
+            limit: SUBTREE_PAGE_SIZE,
+            layout: true
+        }, true);
+    }
+
+    fetchSubTree(node, params, firstPage) {
+        /* Adds a subtree window by window, so large fan-outs are drawn in chunks */
+        axios.get('/node', { params: params })
             .then(res => {
-                if (this.state.hasSubtree && this.state.topTree.includes(node)) {
-                    this.removeSubTree();
+                if (firstPage) {
+                    if (this.state.hasSubtree && this.state.topTree.includes(node)) {
+                        this.removeSubTree();
+                    }
+                    this.setState({ hasSubtree: true });
+                }
+                const added = this.cy.add({ nodes: res.data.nodes, edges: res.data.edges });
+                if (res.data.total >= SERVER_LAYOUT_MIN_NODES) {
+                    // positions from the server are relative to the expanded node
+                    const origin = this.cy.getElementById(node.id).position();
+                    added.nodes().positions(element => {
+                        const position = element.position();
+                        return { x: position.x + origin.x, y: position.y + origin.y };
+                    });
+                } else {
+                    this.runLayout();
+                }
+                if (res.data.nextCursor) {
+                    this.fetchSubTree(node, {
+                        cursor: res.data.nextCursor,
+                        workspace: this.props.workspace
+                    }, false);
                 }
-                this.setState({ hasSubtree: true });
-                this.cy.add(res.data);
-                this.runLayout();
             })
             .catch(err => {
                 console.error(err);
@@ -114,6 +144,27 @@ class Canvas extends React.Component {
         }
     }
 
+    applyDiff(diff) {
+        /* Updates shown elements in place after an edit; renamed elements are replaced */
+        const shown = new Set();
+        const removed = diff.removed.map(id => this.cy.getElementById(id)).filter(element => element.nonempty());
+        for (const element of removed)
+            shown.add(diff.renamed[element.id()] || element.id());
+        removed.forEach(element => element.remove());
+        for (const element of diff.nodes.concat(diff.edges)) {
+            const current = this.cy.getElementById(element.data.id);
+            if (current.nonempty()) {
+                current.data(element.data);
+                current.classes(element.classes);
+            } else if (shown.has(element.data.id)) {
+                if (element.data.source === undefined ||
+                    (this.cy.getElementById(element.data.source).nonempty() &&
+                     this.cy.getElementById(element.data.target).nonempty()))
+                    this.cy.add(element);
+            }
+        }
+    }
+
     fitCanvas() {
         this.cy.fit();
     }
@@ -186,6 +237,9 @@ class Canvas extends React.Component {
         if (!equal(this.props.elements, prevProps.elements)) {
             this.reloadCanvas();
         }
+        if (this.props.diff && this.props.diff !== prevProps.diff) {
+            this.applyDiff(this.props.diff);
+        }
     }
 
     render() {
@@ -17,7 +17,8 @@ class UploadModal extends Component {
     this.state = {
       modal: false,
       selectedFile: null,
-      valid: false
+      valid: false,
+      problems: []
     }
     this.toggle = this.toggle.bind(this);
     this.onChangeHandler = this.onChangeHandler.bind(this);
@@ -25,13 +26,15 @@ class UploadModal extends Component {
     this.maxSelectFile = this.maxSelectFile.bind(this);
     this.checkFileSize = this.checkFileSize.bind(this);
     this.onClickHandler = this.onClickHandler.bind(this);
+    this.waitForUpload = this.waitForUpload.bind(this);
   }
 
   toggle() {
     this.setState({
       modal: !this.state.modal,
       selectedFile: null,
-      valid: false
+      valid: false,
+      problems: []
     })
   }
 
@@ -119,6 +122,30 @@ class UploadModal extends Component {
     }
   }
 
+  waitForUpload(job) {
+    /*
+    Polls an upload parsed in the background until it is done.
+    Resolves with the parsed schema, or rejects with the parsing error
+    and the problems found if the schema is invalid.
+    */
+
+    return new Promise((resolve, reject) => {
+      const poll = () => {
+        axios.get("/jobs/" + job)
+          .then(res => {
+            if (res.data.status === 'done')
+              resolve(res.data.result);
+            else if (res.data.status === 'failed')
+              reject({ jobError: res.data.error, jobProblems: res.data.problems });
+            else
+              setTimeout(poll, 500);
+          })
+          .catch(reject);
+      };
+      poll();
+    });
+  }
+
   onClickHandler() {
     /*
     Handles green upload button.
@@ -130,19 +157,28 @@ class UploadModal extends Component {
     for (var x = 0; x < this.state.selectedFile.length; x++) {
       data.append('file', this.state.selectedFile[x]);
     }
-    axios.post("/upload", data)
-      .then(res => { // then print response status
-        this.props.parentCallback(res.data)
+    // large schemas are parsed in the background so the request does not time out
+    axios.post("/upload", data, { params: { async: true } })
+      .then(res => this.waitForUpload(res.data.job))
+      .then(result => { // then print response status
+        this.props.parentCallback(result)
         toast.success('Upload success');
         setTimeout(this.toggle, 1000);
       })
       .catch(err => { // then print response status
-        this.setState({ valid: false });
-        let error = err.response.data;
-        let error_title = error.slice(error.indexOf("<title>") + 7, error.lastIndexOf("</title>"));
-        let error_notif = error_title.slice(0, error_title.indexOf("//"));
-        if (error_notif.includes('root_node'))
-          error_notif = "UnboundLocalError: Root node not found.\nPlease make sure you have a root node that has an 'or' children_gate for hierarchy visualization.";
+        // invalid schemas come with every problem found in them
+        const problems = err.jobProblems || (err.response && err.response.data.problems) || [];
+        this.setState({ valid: false, problems: problems });
+        let error_notif = err.jobError;
+        if (!error_notif && err.response.data.error) {
+          error_notif = err.response.data.error;
+        } else if (!error_notif) {
+          let error = err.response.data;
+          let error_title = error.slice(error.indexOf("<title>") + 7, error.lastIndexOf("</title>"));
+          error_notif = error_title.slice(0, error_title.indexOf("//"));
+        }
+        if (error_notif.includes('Root node not found'))
+          error_notif = "Root node not found.\nPlease make sure you have a root node that has an 'or' children_gate for hierarchy visualization.";
         toast.error(error_notif);
       });
   }
@@ -177,6 +213,15 @@ class UploadModal extends Component {
                 <Input type="file" className="form-control" style={{ height: 'auto' }} onChange={this.onChangeHandler} />
               </FormGroup>
             </Form>
+            {this.state.problems.length > 0 &&
+              <div>
+                <Label>Problems found in the file</Label>
+                <ul style={{ maxHeight: '40vh', overflowY: 'auto' }}>
+                  {this.state.problems.map((problem, i) =>
+                    <li key={i}><b>{problem.severity}</b> {problem.path}: {problem.message}</li>
+                  )}
+                </ul>
+              </div>}
           </ModalBody>
 
           <ModalFooter>
@@ -1,5 +1,7 @@
 import React, { Component } from 'react';
 import isEmpty from 'lodash/isEmpty';
+import clone from 'lodash/clone';
+import setWith from 'lodash/setWith';
 import { ToastContainer, toast } from 'react-toastify';
 import 'react-toastify/dist/ReactToastify.css';
 import IconButton from '@mui/material/IconButton';
@@ -20,18 +22,21 @@ class Viewer extends Component {
             schemaResponse: '',
             schemaName: '',
             schemaJson: '',
+            workspace: '',
             isOpen: false,
             isUpload: false,
             downloadUrl: '',
             fileName: 'schema.json',
 
-            nodeData: {}
+            nodeData: {},
+            graphDiff: null
         }
 
         this.callbackFunction = this.callbackFunction.bind(this);
         this.jsonEditorCallback = this.jsonEditorCallback.bind(this);
         this.sidebarCallback = this.sidebarCallback.bind(this);
         this.sideEditorCallback = this.sideEditorCallback.bind(this);
+        this.applyGraphDiff = this.applyGraphDiff.bind(this);
         this.download = this.download.bind(this);
 
     }
@@ -42,6 +47,7 @@ class Viewer extends Component {
             schemaResponse: Object.assign({}, response.parsedSchema),
             schemaName: response.name,
             schemaJson: response.schemaJson,
+            workspace: response.workspace,
             isUpload: true
         });
     }
@@ -64,10 +70,11 @@ class Viewer extends Component {
         /* Handles changes from the JSON editor */
         if (JSON.stringify(json) === JSON.stringify(this.state.schemaJson))
             return false;
-        axios.post("/reload", json)
+        // the editor already holds the schema, so it is not sent back
+        axios.post("/reload", json, { params: { workspace: this.state.workspace, schemaJson: false } })
             .then(res => {
                 toast.success('Reload success')
-                this.callbackFunction(res.data);
+                this.callbackFunction(Object.assign({ schemaJson: json }, res.data));
             })
             .catch(err => {
                 let error = err.response.data;
@@ -99,11 +106,54 @@ class Viewer extends Component {
         }
     }
 
+    applyGraphDiff(elements, diff) {
+        /* Applies changed, renamed and removed elements to a list of graph elements */
+        const removed = new Set(diff.removed);
+        const changed = {};
+        for (const element of diff.nodes.concat(diff.edges))
+            changed[element.data.id] = element;
+        const patch = list => list
+            .map(element => {
+                const id = element.data.id;
+                const newId = removed.has(id) ? diff.renamed[id] : id;
+                return newId in changed ? changed[newId] : (removed.has(id) ? null : element);
+            })
+            .filter(element => element !== null);
+        return { nodes: patch(elements.nodes), edges: patch(elements.edges) };
+    }
+
     sideEditorCallback(data) {
         /* Handles changes through the sidebar */
-        axios.post("/node", data)
+        axios.patch("/node", data, { params: { workspace: this.state.workspace } })
             .then(res => {
-                this.jsonEditorCallback(res.data);
+                // copy the objects along each changed path once, the previous state keeps the rest
+                const copies = new WeakSet();
+                const copy = value => {
+                    if (value === null || typeof value !== 'object')
+                        return undefined;
+                    if (copies.has(value))
+                        return value;
+                    const copied = clone(value);
+                    copies.add(copied);
+                    return copied;
+                };
+                const schemaJson = copy(this.state.schemaJson);
+                for (const change of res.data.json)
+                    setWith(schemaJson, change.path, change.value, copy);
+                if (res.data.graph.reload) {
+                    this.setState({
+                        schemaResponse: Object.assign({}, res.data.parsedSchema),
+                        schemaName: res.data.name,
+                        schemaJson: schemaJson
+                    });
+                } else {
+                    this.setState({
+                        schemaResponse: this.applyGraphDiff(this.state.schemaResponse, res.data.graph),
+                        schemaName: res.data.name,
+                        schemaJson: schemaJson,
+                        graphDiff: res.data.graph
+                    });
+                }
             })
             .catch(err => {
                 let error = err.response.data;
@@ -131,6 +181,8 @@ class Viewer extends Component {
             // graph (cytoscape)
             canvas = <Canvas id="canvas"
                 elements={this.state.schemaResponse}
+                workspace={this.state.workspace}
+                diff={this.state.graphDiff}
                 sidebarCallback={this.sidebarCallback}
                 className={canvasClassName}
             />;
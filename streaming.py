@@ -0,0 +1,108 @@
+import codecs
+import json
+
+# ===============================================
+# streaming.py
+# ------------
+# reads a schema document piece by piece from a stream
+# ===============================================
+
+_decoder = json.JSONDecoder()
+_whitespace = ' \t\n\r'
+
+class _Reader:
+    """Text buffer over a binary stream that is refilled on demand."""
+
+    def __init__(self, stream, chunk_size):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8-sig')()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, at_least=1):
+        """Reads until at least at_least more characters are buffered or the stream ends."""
+        self.buf = self.buf[self.pos:]
+        self.pos = 0
+        target = len(self.buf) + at_least
+        while len(self.buf) < target and not self.eof:
+            chunk = self.stream.read(self.chunk_size)
+            if not chunk:
+                self.eof = True
+                self.buf += self.decoder.decode(b'', final=True)
+            else:
+                self.buf += self.decoder.decode(chunk)
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it, '' at the end."""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _whitespace:
+                self.pos += 1
+            if self.pos < len(self.buf) or self.eof:
+                return self.buf[self.pos:self.pos + 1]
+            self.fill()
+
+    def expect(self, chars):
+        """Consumes the next non-whitespace character, which must be one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expecting one of {chars!r} at character {self.pos}, got {char!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decodes the next JSON value, reading more of the stream until it is complete."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buf, self.pos)
+                # a number or literal at the end of the buffer may continue in the next chunk, and a number
+                # cut inside its fraction or exponent stops before it, e.g. at the dot of a buffer ending in 1.
+                if self.eof or (end < len(self.buf) and self.buf[end] not in '.eE'):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self.fill(max(self.chunk_size, len(self.buf) - self.pos))
+
+def iter_schema(stream, sections=('entities', 'relations', 'events'), chunk_size=1 << 16):
+    """Parses a schema document from a binary stream one piece at a time.
+
+    Lists under the keys in sections are yielded item by item as they are
+    read; every other top-level key is yielded whole.
+
+    Parameters:
+    stream (file): binary stream with the schema JSON
+    sections (tuple): top-level keys whose lists are yielded item by item
+    chunk_size (int): bytes read from the stream at a time
+
+    Yields:
+    key (str): top-level key
+    value: a list item if key is in sections, the whole value otherwise
+    is_item (bool): whether value is a single list item
+    """
+    reader = _Reader(stream, chunk_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        key = reader.value()
+        if not isinstance(key, str):
+            raise ValueError(f"Expecting a key at character {reader.pos}")
+        reader.expect(':')
+        if key in sections and reader.peek() == '[':
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.expect(']')
+                yield key, [], False
+            else:
+                while True:
+                    yield key, reader.value(), True
+                    if reader.expect(',]') == ']':
+                        break
+        else:
+            yield key, reader.value(), False
+        if reader.expect(',}') == '}':
+            break
@@ -0,0 +1,93 @@
+import copy
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from app import get_nodes_and_edges, load_workspace, patch_graph, update_batch, update_json
+from generate import generate_schema
+from sdf import index_json
+
+
+def graph_state(nodes, edge_index):
+    """Puts a graph in a form that can be compared, regardless of the order it was built in."""
+    node_state = {node.id: (node.type, node.label, node.shape, node.classes, node.fields)
+                  for node in nodes.values()}
+    edge_state = sorted((edge.source, edge.target, edge.type, edge.name)
+                        for by_type in edge_index['source'].values()
+                        for edge_list in by_type.values() for edge in edge_list)
+    return node_state, edge_state, list(edge_index['roots'])
+
+class PatchGraphTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.schema = generate_schema(events=500)
+
+    def assertPatchMatchesRebuild(self, values):
+        workspace, _ = load_workspace(copy.deepcopy(self.schema))
+        changes = []
+        update_json(workspace, values, changes)
+        patch_graph(workspace, values, changes)
+        nodes, _, edge_index = get_nodes_and_edges(copy.deepcopy(workspace.schema_json))
+        self.assertEqual(graph_state(workspace.nodes, workspace.edge_index), graph_state(nodes, edge_index))
+
+    def test_rename_keeps_own_comment(self):
+        # the event defines its own comment after its parent's child entry
+        self.assertPatchMatchesRebuild({'id': 'Events/10337/', 'key': 'name', 'value': 'v5'})
+
+    def test_field_changes(self):
+        for event in self.schema['events'][::7]:
+            for key, value in (('name', 'v5'), ('comment', 'c5'), ('description', 'd5'), ('optional', True),
+                               ('repeatable', True), ('@id', 'Events/renamed/')):
+                values = {'id': event['@id'], 'key': key, 'value': value}
+                with self.subTest(**values):
+                    self.assertPatchMatchesRebuild(values)
+
+    def test_renames_keep_index(self):
+        workspace, _ = load_workspace(copy.deepcopy(self.schema))
+        for event in self.schema['events'][::-50]:
+            changes = []
+            values = {'id': event['@id'], 'key': 'name', 'value': 'v5'}
+            update_json(workspace, values, changes)
+            patch_graph(workspace, values, changes)
+        self.assertEqual(workspace.json_index, index_json(workspace.schema_json))
+
+    def test_container_renamed_out(self):
+        containers = [event for event in self.schema['events'] if 'outlinks' in event['name']]
+        self.assertTrue(containers)
+        for event in containers:
+            values = {'id': event['@id'], 'key': 'name', 'value': 'v5'}
+            with self.subTest(**values):
+                self.assertPatchMatchesRebuild(values)
+
+    def test_unparsable_change_reverted(self):
+        # the graph cannot be built once this event is named as an outlinks container
+        workspace, _ = load_workspace(copy.deepcopy(self.schema))
+        values = {'id': 'Events/10011/', 'key': 'name', 'value': 'outlinks thing'}
+        changes = []
+        undo = []
+        update_json(workspace, values, changes, undo)
+        with self.assertRaises(ValueError):
+            patch_graph(workspace, values, changes, undo)
+        self.assertEqual(workspace.schema_json, self.schema)
+        self.assertEqual(workspace.json_index, index_json(self.schema))
+        nodes, _, edge_index = get_nodes_and_edges(copy.deepcopy(self.schema))
+        self.assertEqual(graph_state(workspace.nodes, workspace.edge_index), graph_state(nodes, edge_index))
+
+    def test_batch_diff_leaves_out_intermediate_ids(self):
+        workspace, _ = load_workspace(copy.deepcopy(self.schema))
+        before = set(workspace.nodes) | {edge.id for edge in workspace.edges}
+        event_id = self.schema['events'][1]['@id']
+        _, diff = update_batch(workspace, [{'id': event_id, 'key': '@id', 'value': 'Events/moved/'},
+                                           {'id': 'Events/moved/', 'key': '@id', 'value': 'Events/final/'},
+                                           {'id': 'Events/final/', 'key': 'repeatable', 'value': True},
+                                           {'id': 'Events/final/', 'key': 'repeatable', 'value': False}])
+        self.assertTrue(diff['removed'])
+        self.assertLessEqual(set(diff['removed']), before)
+        self.assertLessEqual(set(diff['renamed']), before)
+        self.assertEqual(diff['renamed'][event_id], 'Events/final/')
+
+if __name__ == '__main__':
+    unittest.main()
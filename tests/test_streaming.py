@@ -0,0 +1,41 @@
+import io
+import json
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from streaming import iter_schema
+
+
+def read_schema(raw, chunk_size):
+    """Puts a document read by iter_schema back together."""
+    schema = {}
+    for key, value, is_item in iter_schema(io.BytesIO(raw), chunk_size=chunk_size):
+        if is_item:
+            schema.setdefault(key, []).append(value)
+        else:
+            schema[key] = value
+    return schema
+
+class IterSchemaTest(unittest.TestCase):
+
+    def test_numbers_split_across_chunks(self):
+        schema = {
+            'entities': [{'@id': 'Entities/00000/', 'centrality': 1.5e10, 'weight': -2.25E-3, 'count': 10}],
+            'relations': [],
+            'events': [{'@id': 'Events/10000/', 'values': [1e5, 0.5, 123456789.125, True, None, '1.e']}],
+            'centrality': 1.5e10,
+            'weight': -2.25E-3
+        }
+        raw = json.dumps(schema).encode('utf-8')
+        for chunk_size in [*range(1, 17), 1 << 16]:
+            with self.subTest(chunk_size=chunk_size):
+                self.assertEqual(read_schema(raw, chunk_size), schema)
+
+    def test_number_cut_before_fraction(self):
+        # with one byte at a time the buffer ends in 1. before the rest of the number is read
+        self.assertEqual(read_schema(b'{"centrality": 1.5e10}', 1), {'centrality': 1.5e10})
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# ===============================================
+# workspace.py
+# ------------
+# per-session parsed schemas kept in memory
+# ===============================================
+
+class Workspace:
+    """Parsed state of one uploaded schema.
+
+    Attributes:
+    schema_json (dict): entire schema in json form
+    schema_name (str): name of the root node
+    nodes (dict): nodes in the schema
+    edges (dict): edges in the schema as keys, in order, so removing one takes constant time
+    edge_index (dict): adjacency index over edges
+    json_index (dict): locations of ids in schema_json
+    shared (bool): whether the schema and graph are shared through the cache and must be copied before editing
+    subtrees (dict): graphs around nodes built so far while the full graph is not built, otherwise None
+    layouts (dict): node positions of subtrees laid out so far, cleared when the graph structure changes
+    search_index (SearchIndex): text index over the schema, or None until it is first searched
+    lock (RLock): held while the workspace is read or changed
+    """
+
+    def __init__(self, schema_json, nodes, edges, edge_index, json_index, schema_name='', shared=False,
+                 subtrees=None):
+        self.schema_json = schema_json
+        self.schema_name = schema_name
+        self.nodes = nodes
+        self.edges = dict.fromkeys(edges) if isinstance(edges, list) else edges
+        self.edge_index = edge_index
+        self.json_index = json_index
+        self.shared = shared
+        self.subtrees = subtrees
+        self.layouts = {}
+        self.search_index = None
+        self.lock = threading.RLock()
+
+class WorkspaceStore:
+    """Thread-safe in-memory LRU of workspaces with TTL eviction, optionally backed by snapshots on disk.
+
+    With snapshots, workspaces evicted from memory or lost to a restart are
+    reopened from disk when asked for again.
+
+    Parameters:
+    max_size (int): number of workspaces kept before the least recently used is evicted
+    ttl (float): seconds a workspace is kept after its last use, 0 keeps it until evicted
+    snapshots (SnapshotStore): where workspaces are saved to and reopened from, or None to keep them in memory only
+    """
+
+    def __init__(self, max_size=32, ttl=3600, snapshots=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.snapshots = snapshots
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _purge(self, now):
+        """Drops expired workspaces. Entries are ordered by last use, so only the front is checked."""
+        if not self.ttl:
+            return
+        while self._items:
+            workspace_id, (_, last_used) = next(iter(self._items.items()))
+            if now - last_used < self.ttl:
+                break
+            self._items.pop(workspace_id)
+
+    def get(self, workspace_id):
+        """Gets a workspace and marks it as recently used.
+
+        Parameters:
+        workspace_id (str): id returned by put
+
+        Returns:
+        workspace (Workspace): the workspace, or None if it is unknown or expired
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._purge(now)
+            if workspace_id in self._items:
+                workspace, _ = self._items.pop(workspace_id)
+            elif self.snapshots is not None and workspace_id:
+                # only the header of a snapshot is read here, the rest when it is used
+                workspace = self.snapshots.open(workspace_id)
+                if workspace is None:
+                    return None
+            else:
+                return None
+            self._items[workspace_id] = (workspace, now)
+            self._evict()
+            return workspace
+
+    def _evict(self):
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def put(self, workspace, workspace_id=None):
+        """Stores a workspace, evicting the least recently used ones if the store is full.
+
+        Parameters:
+        workspace (Workspace): workspace to store
+        workspace_id (str): id to store it under, a new one is created if empty
+
+        Returns:
+        workspace_id (str): id of the stored workspace
+        """
+        now = time.monotonic()
+        workspace_id = workspace_id or uuid.uuid4().hex
+        with self._lock:
+            self._purge(now)
+            self._items.pop(workspace_id, None)
+            self._items[workspace_id] = (workspace, now)
+            self._evict()
+        self.changed(workspace_id, workspace)
+        return workspace_id
+
+    def changed(self, workspace_id, workspace):
+        """Saves a workspace again after it was edited, if snapshots are kept."""
+        if self.snapshots is not None:
+            self.snapshots.save(workspace_id, workspace)
+
+    def remove(self, workspace_id):
+        """Drops a workspace if it exists, along with its snapshot."""
+        with self._lock:
+            self._items.pop(workspace_id, None)
+        if self.snapshots is not None:
+            self.snapshots.remove(workspace_id)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._items)